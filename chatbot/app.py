@@ -1,10 +1,13 @@
 """
 Construkt Chatbot - Flask API Server
-Smart NLP-powered chatbot with unlimited context memory.
+Smart NLP-powered chatbot with per-user context memory.
 """
+import atexit
 import os
 import re
+import shelve
 import threading
+import time
 import uuid
 from flask import Flask, request, jsonify
 from flask_cors import CORS
@@ -18,43 +21,242 @@ app = Flask(__name__)
 CORS(app)
 
 # Import modules
-from src.nlp_engine import NLPEngine
+from src.nlp_engine import ConversationMemory, NLPEngine
+from src.session_store import KVSessionStore, RespClient, SessionStore, SQLiteSessionStore
 from src.intents.calculator import CalculatorIntentHandler
 from src.intents.store_info import handle_store_info, is_store_info_query
 from src.gemini_ai import get_gemini_assistant
 from src.command_handler import CommandHandler
 from utils.database import DatabaseConnector
+from utils.log_writer import ConversationLogWriter
 
 # Initialize components
 database = DatabaseConnector()
 calculator_handler = CalculatorIntentHandler()
 command_handler = CommandHandler(database)
 
+# Conversation logs are inserted in batches by one background thread
+# (registered after the fallback sink so the final flush can still reach it)
+atexit.register(database.log_sink.close)
+log_writer = ConversationLogWriter(
+    database,
+    batch_size=int(os.environ.get('CHATBOT_LOG_BATCH_SIZE', 100)),
+    flush_interval=float(os.environ.get('CHATBOT_LOG_FLUSH_MS', 200)) / 1000,
+    queue_size=int(os.environ.get('CHATBOT_LOG_QUEUE_SIZE', 10000)),
+    enqueue_timeout=float(os.environ.get('CHATBOT_LOG_ENQUEUE_TIMEOUT_MS', 0)) / 1000,
+).start()
+atexit.register(log_writer.close)
+
 # Initialize NLP Engine with products from database
 nlp_engine = None
+# Concurrent first requests (and refreshes) build the engine once, not once each
+nlp_engine_lock = threading.Lock()
+# Empty engine that answers while the catalog cannot be loaded, and when the last load failed
+fallback_engine = None
+catalog_load_failed_at = 0.0
+# Seconds between catalog load attempts after a failed load
+CATALOG_RETRY_SECONDS = 30
+
+# Fuzzy matcher mode: 'sequence' (SequenceMatcher on every candidate) or 'trigram'
+MATCH_MODE = os.environ.get('CHATBOT_MATCH_MODE', 'sequence')
+# Search ranking: 'tiers' (exact/fuzzy/keyword) or 'bm25' (requires numpy)
+RANK_MODE = os.environ.get('CHATBOT_RANK_MODE', 'tiers')
+# Seconds between polls of products.updated_at for outside edits (0 disables polling)
+CATALOG_POLL_INTERVAL = float(os.environ.get('CATALOG_POLL_INTERVAL', 30))
+# Seconds between poller scans of active product ids for rows deleted outright (0 disables)
+CATALOG_DELETE_SCAN_INTERVAL = float(os.environ.get('CATALOG_DELETE_SCAN_INTERVAL', 300))
+# Built engine state for fast cold starts (empty disables snapshots)
+CATALOG_SNAPSHOT_PATH = os.environ.get(
+    'CATALOG_SNAPSHOT_PATH', os.path.join(os.path.dirname(__file__), 'data', 'catalog.snapshot')
+)
+
+
+def create_session_store():
+    """Build the conversation session backend from environment settings"""
+    backend = os.environ.get('CHATBOT_SESSION_BACKEND', 'memory')
+    limits = {
+        'idle_ttl': float(os.environ.get('CHATBOT_SESSION_TTL', 3600)),
+        'max_messages': int(os.environ.get('CHATBOT_SESSION_MAX_MESSAGES', 200)),
+        'max_bytes': int(os.environ.get('CHATBOT_SESSION_MAX_BYTES', 256 * 1024)),
+    }
+
+    try:
+        if backend == 'sqlite':
+            path = os.environ.get(
+                'CHATBOT_SESSION_DB_PATH', os.path.join(os.path.dirname(__file__), 'data', 'sessions.db')
+            )
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            print(f"Session backend: sqlite ({path})")
+            return SQLiteSessionStore(ConversationMemory, path, **limits)
+        if backend == 'kv':
+            url = os.environ.get('CHATBOT_SESSION_KV_URL', 'redis://127.0.0.1:6379/0')
+            print(f"Session backend: kv ({url})")
+            return KVSessionStore(ConversationMemory, RespClient.from_url(url), **limits)
+        if backend != 'memory':
+            print(f"Unknown session backend '{backend}', using 'memory'")
+    except Exception as e:
+        print(f"Error opening session backend '{backend}', using 'memory': {e}")
+
+    spill = None
+    spill_path = os.environ.get('CHATBOT_SESSION_SPILL_PATH')
+    if spill_path:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(spill_path)), exist_ok=True)
+            spill = shelve.open(spill_path)
+        except Exception as e:
+            print(f"Error opening session spill store: {e}")
+
+    return SessionStore(
+        ConversationMemory,
+        max_sessions=int(os.environ.get('CHATBOT_MAX_SESSIONS', 10000)),
+        spill=spill,
+        **limits
+    )
+
+
+# Conversation memories live outside the engine so rebuilds keep them;
+# a sweeper thread drops idle sessions every SESSION_SWEEP_SECONDS (0 disables)
+SESSION_SWEEP_SECONDS = float(os.environ.get('CHATBOT_SESSION_SWEEP_SECONDS', 300))
+session_store = create_session_store().start_sweeper(SESSION_SWEEP_SECONDS)
+atexit.register(session_store.close)
 
 
 def get_nlp_engine():
-    """Get or initialize NLP engine with fresh product data"""
-    global nlp_engine
-    if nlp_engine is None:
-        products = database.get_products(limit=500)
-        categories = database.get_categories(with_product_counts=True)
-        nlp_engine = NLPEngine(products, categories)
-        print(f"NLP Engine initialized with {len(products)} products and {len(categories)} categories")
+    """Get or initialize NLP engine (from the catalog snapshot when one is available)"""
+    global nlp_engine, fallback_engine, catalog_load_failed_at
+    if nlp_engine is not None:
+        return nlp_engine
+
+    with nlp_engine_lock:
+        if nlp_engine is not None:
+            return nlp_engine
+        if fallback_engine is not None and time.monotonic() - catalog_load_failed_at < CATALOG_RETRY_SECONDS:
+            return fallback_engine
+
+        restored = NLPEngine.load_snapshot(CATALOG_SNAPSHOT_PATH, MATCH_MODE, RANK_MODE)
+        if restored:
+            engine, watermark = restored
+            engine.memories = session_store
+            watermark = catch_up_catalog(engine, watermark)
+            categories = database.get_categories(with_product_counts=True)
+            if categories:
+                engine.set_categories(categories)
+            nlp_engine = engine
+            print(f"NLP Engine restored from snapshot with {len(engine.products)} products")
+        else:
+            watermark = database.get_catalog_watermark()
+            products = database.get_all_products()
+            categories = database.get_categories(with_product_counts=True)
+            if products is None:
+                # Not cached or snapshotted: the next request after CATALOG_RETRY_SECONDS tries again
+                print(f"Catalog load failed, answering without products for {CATALOG_RETRY_SECONDS}s")
+                catalog_load_failed_at = time.monotonic()
+                if fallback_engine is None:
+                    fallback_engine = NLPEngine(
+                        [], categories, match_mode=MATCH_MODE, rank_mode=RANK_MODE, memories=session_store
+                    )
+                return fallback_engine
+            nlp_engine = NLPEngine(
+                products, categories, match_mode=MATCH_MODE, rank_mode=RANK_MODE, memories=session_store
+            )
+            print(f"NLP Engine initialized with {len(products)} products and {len(categories)} categories")
+            save_catalog_snapshot(nlp_engine, watermark)
+        if CATALOG_POLL_INTERVAL > 0:
+            database.start_catalog_poller(
+                apply_catalog_changes, CATALOG_POLL_INTERVAL, watermark,
+                known_ids=catalog_product_ids, delete_scan_interval=CATALOG_DELETE_SCAN_INTERVAL
+            )
     return nlp_engine
 
 
 def refresh_nlp_engine():
-    """Refresh NLP engine with updated product data"""
+    """
+    Refresh NLP engine with updated product data (conversation memories are kept).
+    Returns None, keeping the current engine and snapshot, if the catalog load failed.
+    """
     global nlp_engine
-    products = database.get_products(limit=500)
-    categories = database.get_categories(with_product_counts=True)
-    nlp_engine = NLPEngine(products, categories)
-    print(f"NLP Engine refreshed with {len(products)} products and {len(categories)} categories")
+    with nlp_engine_lock:
+        watermark = database.get_catalog_watermark()
+        products = database.get_all_products()
+        if products is None:
+            print("Catalog load failed, keeping the current NLP engine")
+            return None
+        categories = database.get_categories(with_product_counts=True)
+        engine = NLPEngine(
+            products, categories, match_mode=MATCH_MODE, rank_mode=RANK_MODE, memories=session_store
+        )
+        nlp_engine = engine
+        print(f"NLP Engine refreshed with {len(products)} products and {len(categories)} categories")
+        save_catalog_snapshot(nlp_engine, watermark)
     return nlp_engine
 
 
+def save_catalog_snapshot(engine, watermark):
+    """Write the engine snapshot (skipped without a watermark to catch up from)"""
+    if CATALOG_SNAPSHOT_PATH and watermark is not None and engine.save_snapshot(CATALOG_SNAPSHOT_PATH, watermark):
+        print(f"Catalog snapshot saved to {CATALOG_SNAPSHOT_PATH}")
+
+
+def catch_up_catalog(engine, watermark):
+    """
+    Apply product changes made since a snapshot was taken, drop snapshot
+    products that no longer exist, and return the new watermark
+    """
+    applied = 0
+    while True:
+        changes = database.get_product_changes(watermark)
+        if not changes:
+            break
+        engine.apply_delta(
+            upserts=[p for p in changes if p.get('is_active')],
+            deletes=[p.get('id') for p in changes if not p.get('is_active')]
+        )
+        applied += len(changes)
+        watermark = (changes[-1].get('updated_at'), changes[-1].get('id'))
+        if len(changes) < database.CHANGE_BATCH_SIZE:
+            break
+
+    # Rows deleted outright since the snapshot leave no change behind; if the ids
+    # can't be read now, the catalog poller's delete scan removes them later
+    removed = 0
+    active_ids = database.get_active_product_ids()
+    if active_ids is not None:
+        missing = set(engine.matcher.products_by_id) - active_ids
+        if missing:
+            engine.apply_delta(deletes=sorted(missing))
+        removed = len(missing)
+    print(f"Catalog snapshot caught up with {applied} changed and {removed} deleted products")
+    return watermark
+
+
+def patch_nlp_engine(product_id: int):
+    """Re-read one product and patch it into the NLP engine (a missing or inactive product is removed)"""
+    if nlp_engine is None:
+        return
+    ok, row = database.get_product_row(product_id)
+    if not ok:
+        # Not a deletion: the write bumped updated_at, so the catalog poller applies it later
+        print(f"Could not re-read product {product_id}, leaving it to the catalog poller")
+        return
+    if row and row.get('is_active'):
+        nlp_engine.apply_delta(upserts=[row])
+    else:
+        nlp_engine.apply_delta(deletes=[product_id])
+
+
+def apply_catalog_changes(upserts, deletes):
+    """Feed products changed outside the chatbot (e.g. the PHP admin) into the NLP engine"""
+    if nlp_engine is not None and (upserts or deletes):
+        nlp_engine.apply_delta(upserts=upserts, deletes=deletes)
+        print(f"Catalog poller applied {len(upserts)} updates and {len(deletes)} removals")
+
+
+def catalog_product_ids():
+    """Ids of the products in the NLP engine, for the poller's deleted-row scan"""
+    engine = nlp_engine
+    return list(engine.matcher.products_by_id) if engine is not None else []
+
+
 def get_user_id(data: dict) -> str:
     """Get or generate user ID from request data"""
     user_id = data.get('user_id')
@@ -64,15 +266,8 @@ def get_user_id(data: dict) -> str:
 
 
 def log_conversation_async(user_id: str, user_message: str, bot_response: str, intent: str):
-    """Log conversation to database asynchronously"""
-    def _log():
-        try:
-            database.log_conversation(user_id, user_message, bot_response, intent)
-        except Exception as e:
-            print(f"Error logging conversation: {e}")
-
-    thread = threading.Thread(target=_log)
-    thread.start()
+    """Queue a conversation log row for the background writer"""
+    log_writer.log(user_id, user_message, bot_response, intent)
 
 
 @app.route('/api/chatbot', methods=['POST', 'OPTIONS'])
@@ -80,7 +275,7 @@ def log_conversation_async(user_id: str, user_message: str, bot_response: str, i
 def process_message():
     """
     Main endpoint for processing chat messages.
-    Uses smart NLP engine with unlimited context memory.
+    Uses smart NLP engine with per-user context memory.
     """
     # Handle CORS preflight
     if request.method == 'OPTIONS':
@@ -136,6 +331,7 @@ def process_message():
                 memory.calculator_material_type = ctx_update.get('calculator_material_type')
                 memory.calculator_dimensions = ctx_update.get('calculator_dimensions', {})
                 memory.calculator_state = ctx_update.get('calculator_state')
+                engine.save_memory(user_id, memory)
 
             log_conversation_async(user_id, user_message, response, 'calculator')
 
@@ -182,7 +378,8 @@ def process_message():
                     products=engine.products,
                     current_product=current_product,
                     conversation_history=memory.messages,
-                    nlp_context=result
+                    nlp_context=result,
+                    catalog_version=engine.catalog_version
                 )
                 if gemini_response:
                     response = gemini_response
@@ -335,6 +532,15 @@ def health_check():
             'status': 'ok',
             'database': db_status,
             'nlp_engine': engine_status,
+            'match_mode': engine.matcher.match_mode,
+            'rank_mode': engine.matcher.rank_mode,
+            'catalog_load': database.catalog_load_stats,
+            'db_pool': database.get_pool_stats(),
+            'catalog_poller': database.get_poller_status(),
+            'sessions': session_store.stats(),
+            'conversation_logs': log_writer.stats(),
+            'log_fallback': database.log_sink.stats(),
+            'gemini': get_gemini_assistant().stats(),
             'version': '3.0.0'
         })
 
@@ -349,7 +555,11 @@ def health_check():
 def refresh_products():
     """Refresh product data in NLP engine"""
     try:
-        refresh_nlp_engine()
+        if refresh_nlp_engine() is None:
+            return jsonify({
+                'success': False,
+                'message': 'Could not load products from the database; the current catalog is kept'
+            }), 503
 
         return jsonify({
             'success': True,
@@ -923,7 +1133,7 @@ def create_product():
         product_id = database.create_product(data)
         print(f"Product created with id: {product_id}")
         if product_id:
-            refresh_nlp_engine()
+            patch_nlp_engine(product_id)
             return jsonify({'success': True, 'id': product_id})
         return jsonify({'error': 'Failed to create product'}), 500
     except Exception as e:
@@ -939,7 +1149,7 @@ def update_product(product_id):
     try:
         data = request.get_json() or {}
         database.update_product(product_id, data)
-        refresh_nlp_engine()
+        patch_nlp_engine(product_id)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -950,7 +1160,7 @@ def delete_product(product_id):
     """Delete product"""
     try:
         database.delete_product(product_id)
-        refresh_nlp_engine()
+        patch_nlp_engine(product_id)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1052,7 +1262,7 @@ if __name__ == '__main__':
     print(f"Construkt Smart Chatbot v3.0")
     print(f"Features: Fuzzy matching, Smart recommendations,")
     print(f"          Product comparison, Price calculation,")
-    print(f"          Unlimited context memory")
+    print(f"          Per-user context memory")
     print(f"Starting on port {port}")
     print(f"{'='*50}\n")
 
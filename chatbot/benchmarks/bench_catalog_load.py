@@ -0,0 +1,222 @@
+"""
+Benchmark for the full catalog load.
+Compares the old single-query load (one get_products query with a limit
+covering the whole catalog, read through a buffered cursor) with the paged
+get_all_products loader, on load time and peak RSS. Each loader runs in its
+own interpreter, since peak RSS only ever grows within a process, and both
+must return the same products.
+
+By default the MySQL server is simulated, so no database is needed: a
+buffered cursor holds the whole result set from execute(), as the driver
+does, and an unbuffered one produces rows as they are fetched. With --live
+both loaders read the real catalog configured through DB_* variables.
+
+Usage (from the chatbot/ directory):
+    python benchmarks/bench_catalog_load.py [--products 200000] [--page-size 1000] [--live]
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector
+
+from utils.database import DatabaseConnector
+
+WORDS = [
+    'galvanized', 'steel', 'nails', 'cement', 'portland', 'concrete', 'blocks', 'hollow',
+    'sand', 'gravel', 'rebar', 'ribbed', 'plywood', 'marine', 'timber', 'treated',
+    'roofing', 'sheets', 'corrugated', 'paint', 'exterior', 'primer', 'tiles', 'ceramic',
+    'pipe', 'pvc', 'copper', 'fittings', 'insulation', 'mineral', 'wool', 'adhesive',
+]
+COLUMNS = [
+    'id', 'category_id', 'supplier_id', 'name', 'description', 'price', 'unit',
+    'stock_quantity', 'dimensions', 'is_featured', 'is_active', 'thumbnail',
+    'created_at', 'updated_at', 'category_name', 'supplier_name',
+]
+RESULT_PREFIX = 'RESULT '
+
+
+class SimulatedCatalog:
+    """Active products of the simulated server; rows are built fresh for every read"""
+    count = 0
+    by_name = []  # Ids in name order, as an index on name would give them
+
+    @classmethod
+    def setup(cls, count):
+        cls.count = count
+        cls.by_name = sorted(range(1, count + 1), key=lambda i: cls.name(i).lower())
+
+    @staticmethod
+    def name(product_id):
+        first = WORDS[product_id * 7 % len(WORDS)]
+        second = WORDS[product_id * 13 % len(WORDS)]
+        return f"{first.title()} {second.title()} {product_id}"
+
+    @classmethod
+    def row(cls, product_id):
+        words = [WORDS[(product_id + i * 5) % len(WORDS)] for i in range(30)]
+        return (
+            product_id, product_id % 40 + 1, product_id % 25 + 1, cls.name(product_id),
+            f"{' '.join(words)} ({product_id})", f"{product_id % 997 + 0.5:.2f}", 'piece',
+            product_id % 500, f'{{"length": {product_id % 300}, "material": "steel"}}', 0, 1,
+            f"/images/products/{product_id}.jpg", '2024-01-01 00:00:00', '2024-01-01 00:00:00',
+            f"Category {product_id % 40 + 1}", f"Supplier {product_id % 25 + 1}",
+        )
+
+    @classmethod
+    def rows(cls, operation, params):
+        """Rows for one of the two catalog queries"""
+        limit = int(re.search(r'LIMIT\s+(\d+)', operation).group(1))
+        if 'p.id > %s' in operation:
+            ids = range(params[0] + 1, cls.count + 1)
+        else:
+            ids = cls.by_name
+        return (cls.row(product_id) for product_id in itertools.islice(ids, limit))
+
+
+class SimulatedCursor:
+    description = [(column,) for column in COLUMNS]
+    rowcount = -1
+
+    def __init__(self, buffered=True):
+        self.buffered = buffered
+        self._rows = iter(())
+
+    def execute(self, operation, params=None, multi=False):
+        rows = SimulatedCatalog.rows(operation, params)
+        # A buffered cursor reads the whole result set before execute returns
+        self._rows = iter(list(rows)) if self.buffered else rows
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def fetchmany(self, size=1):
+        return list(itertools.islice(self._rows, size))
+
+    def close(self):
+        self._rows = iter(())
+
+
+class SimulatedConnection:
+    """Stand-in for a MySQL connection serving the simulated catalog"""
+
+    def cursor(self, buffered=True, **kwargs):
+        return SimulatedCursor(buffered)
+
+    def is_connected(self):
+        return True
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        pass
+
+    def reconnect(self, attempts=1, delay=0):
+        pass
+
+    def close(self):
+        pass
+
+
+def load_single_query(db):
+    """The loader before paging: one get_products query covering the whole catalog"""
+    return db.get_products(limit=10 ** 9)
+
+
+def load_paged(db, page_size):
+    return db.get_all_products(page_size)
+
+
+def catalog_digest(products):
+    """Order-sensitive digest of the loaded products"""
+    digest = hashlib.sha256()
+    for product in products:
+        digest.update(repr(sorted(product.items(), key=lambda item: item[0])).encode())
+    return digest.hexdigest()
+
+
+def run_loader(loader, args):
+    """Run one loader in this process and print its figures as a RESULT line"""
+    if not args.live:
+        SimulatedCatalog.setup(args.products)
+        mysql.connector.connect = lambda **config: SimulatedConnection()
+
+    db = DatabaseConnector()
+    baseline = DatabaseConnector._peak_rss_mb()
+    started = time.perf_counter()
+    if loader == 'single':
+        products = load_single_query(db)
+    else:
+        products = load_paged(db, args.page_size)
+    seconds = time.perf_counter() - started
+    peak = DatabaseConnector._peak_rss_mb()
+
+    print(RESULT_PREFIX + json.dumps({
+        'products': len(products) if products is not None else None,
+        'seconds': seconds,
+        'baseline_rss_mb': baseline,
+        'peak_rss_mb': peak,
+        'digest': catalog_digest(products or []),
+    }))
+
+
+def measure(loader, args):
+    """Run a loader in a fresh interpreter and parse its RESULT line"""
+    command = [sys.executable, os.path.abspath(__file__), '--run', loader,
+               '--products', str(args.products), '--page-size', str(args.page_size)]
+    if args.live:
+        command.append('--live')
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    for line in output.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    raise RuntimeError(f"{loader} loader printed no result:\n{output}")
+
+
+def format_mb(value):
+    return f"{value:.1f}" if value is not None else "n/a"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--products', type=int, default=200000, help="Simulated catalog size")
+    parser.add_argument('--page-size', type=int, default=DatabaseConnector.CATALOG_PAGE_SIZE)
+    parser.add_argument('--live', action='store_true', help="Load from the real MySQL server")
+    parser.add_argument('--run', choices=['single', 'paged'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_loader(args.run, args)
+        return
+
+    single = measure('single', args)
+    paged = measure('paged', args)
+
+    if single['products'] is None or paged['products'] is None:
+        print("A loader failed, no comparison")
+        sys.exit(1)
+    if single['digest'] != paged['digest']:
+        print(f"Parity check FAILED: the single query returned {single['products']} products, "
+              f"the paged loader {paged['products']} (or in a different order)")
+        sys.exit(1)
+    print(f"Parity check passed: both loaders return the same {paged['products']} products in name order")
+
+    source = 'live server' if args.live else f'simulated server, {args.products} products'
+    print(f"\nFull catalog load ({source}, pages of {args.page_size}):")
+    print(f"  {'loader':14} {'seconds':>8} {'peak RSS MB':>12} {'RSS growth MB':>14}")
+    for name, result in (('single query', single), ('paged', paged)):
+        growth = None
+        if result['peak_rss_mb'] is not None:
+            growth = result['peak_rss_mb'] - result['baseline_rss_mb']
+        print(f"  {name:14} {result['seconds']:8.2f} {format_mb(result['peak_rss_mb']):>12} "
+              f"{format_mb(growth):>14}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Benchmark for DatabaseConnector connection validation.
+Counts database round trips per API call with the old policy (is_connected()
+plus ping() before every query) and the idle-time policy (ping only after
+DB_VALIDATE_IDLE_SECONDS idle), and times both with a simulated network delay.
+
+By default the MySQL server is simulated, so no database is needed. With
+--live the counts come from a real server configured through DB_* variables.
+
+Usage (from the chatbot/ directory):
+    python benchmarks/bench_db_round_trips.py [--calls 200] [--rtt-ms 0.5] [--live]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector
+from mysql.connector import Error
+
+from utils.database import DatabaseConnector
+
+
+class RoundTrips:
+    """Round trip counter shared by the counting connections"""
+    count = 0
+    rtt = 0.0
+
+    @classmethod
+    def add(cls):
+        cls.count += 1
+        if cls.rtt:
+            time.sleep(cls.rtt)
+
+
+class SimulatedCursor:
+    description = [('id',), ('name',)]
+    lastrowid = 1
+    rowcount = 1
+
+    def execute(self, operation, params=None, multi=False):
+        RoundTrips.add()
+
+    def fetchall(self):
+        return [(1, 'Galvanized Nails')]
+
+    def fetchone(self):
+        return (1, 'Galvanized Nails')
+
+    def fetchmany(self, size=1):
+        return []
+
+    def close(self):
+        pass
+
+
+class SimulatedConnection:
+    """Stand-in for a MySQL connection: every server call is one round trip"""
+
+    def cursor(self, *args, **kwargs):
+        return SimulatedCursor()
+
+    def is_connected(self):
+        # mysql.connector implements is_connected() with a ping
+        RoundTrips.add()
+        return True
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        RoundTrips.add()
+
+    def reconnect(self, attempts=1, delay=0):
+        RoundTrips.add()
+
+    def close(self):
+        pass
+
+
+class CountingCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, operation, params=None, multi=False):
+        RoundTrips.add()
+        return self._cursor.execute(operation, params, multi)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class CountingConnection:
+    """Real MySQL connection that counts server calls"""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._connection.cursor(*args, **kwargs))
+
+    def is_connected(self):
+        RoundTrips.add()
+        return self._connection.is_connected()
+
+    def ping(self, *args, **kwargs):
+        RoundTrips.add()
+        return self._connection.ping(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class LegacyConnector(DatabaseConnector):
+    """Validation as it was: is_connected() and ping() before every query"""
+
+    def ensure_connection(self):
+        connection = self.connection
+        if connection is None:
+            return False
+        try:
+            if not connection.is_connected():
+                connection.reconnect(attempts=1)
+            connection.ping(reconnect=True)
+            return True
+        except Error:
+            self._local.broken = True
+            return False
+
+
+# DB calls made by typical API requests
+API_CALLS = {
+    'GET /api/products/<id>': lambda db: db.get_products(limit=1, product_id=1),
+    'GET /api/categories': lambda db: db.get_categories(with_product_counts=True),
+    'GET /api/cart': lambda db: db.get_cart(1),
+    'POST /api/chatbot/message (log)': lambda db: db.log_conversation('u1', 'hi', 'hello', 'greeting'),
+}
+
+
+def run(connector_class, calls):
+    """Round trips per call and mean latency for each API call"""
+    db = connector_class()
+    results = {}
+    for name, api_call in API_CALLS.items():
+        api_call(db)  # Open the pooled connection outside the measurement
+        RoundTrips.count = 0
+        started = time.perf_counter()
+        for _ in range(calls):
+            api_call(db)
+        elapsed = time.perf_counter() - started
+        results[name] = (RoundTrips.count / calls, elapsed / calls * 1000)
+    db.disconnect()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--rtt-ms', type=float, default=0.5, help="Simulated round trip time")
+    parser.add_argument('--live', action='store_true', help="Count against the real MySQL server")
+    args = parser.parse_args()
+
+    if args.live:
+        # The pool opens its connections through mysql.connector.connect
+        connect = mysql.connector.connect
+        mysql.connector.connect = lambda **config: CountingConnection(connect(**config))
+    else:
+        RoundTrips.rtt = args.rtt_ms / 1000
+        mysql.connector.connect = lambda **config: SimulatedConnection()
+
+    before = run(LegacyConnector, args.calls)
+    after = run(DatabaseConnector, args.calls)
+
+    print(f"\nRound trips per API call ({args.calls} calls each, "
+          f"{'live server' if args.live else f'simulated {args.rtt_ms} ms RTT'}):")
+    print(f"  {'call':34} {'before':>8} {'after':>8} {'before ms':>10} {'after ms':>10}")
+    for name in API_CALLS:
+        trips_before, ms_before = before[name]
+        trips_after, ms_after = after[name]
+        print(f"  {name:34} {trips_before:8.2f} {trips_after:8.2f} {ms_before:10.3f} {ms_after:10.3f}")
+
+
+if __name__ == '__main__':
+    main()
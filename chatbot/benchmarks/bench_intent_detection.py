@@ -0,0 +1,91 @@
+"""
+Micro-benchmark for NLPEngine intent detection.
+Compares the precompiled intent matchers against calling re.search with raw
+pattern strings, and checks that both pick the same intent and groups.
+
+Usage (from the chatbot/ directory):
+    python benchmarks/bench_intent_detection.py [rounds]
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.nlp_engine import NLPEngine
+
+
+MESSAGES = [
+    "hi",
+    "hello",
+    "help",
+    "show me galvanized nails",
+    "i need portland cement",
+    "do you have red brick in stock",
+    "what's the price of plywood",
+    "total for 12 bags of cement",
+    "compare galvanized nails with stainless steel nails",
+    "which is better, pine board or osb board",
+    "is the claw hammer available",
+    "recommend something for roofing",
+    "alternatives",
+    "what is the length",
+    "how much for 5 packs",
+    "how much?",
+    "most expensive paint",
+    "cheapest insulation",
+    "how many types of tiles do you have",
+    "list all drywall",
+    "categories",
+    "ok thanks, that's all",
+    "what are your opening hours",
+    "nails",
+]
+
+
+def detect_legacy(message: str):
+    """Intent detection as a loop of re.search calls on raw pattern strings"""
+    for intent, patterns in NLPEngine.INTENT_PATTERNS.items():
+        for pattern in patterns:
+            match = re.search(pattern, message, re.IGNORECASE)
+            if match:
+                return intent, match.groups()
+    return None, ()
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    engine = NLPEngine([], [])
+
+    # Both implementations must agree before timing them
+    for message in MESSAGES:
+        intent, params = engine._detect_intent(message)
+        legacy_intent, legacy_groups = detect_legacy(message)
+        if legacy_intent is not None and (intent, params.get('groups')) != (legacy_intent, legacy_groups):
+            print(f"MISMATCH for '{message}': {intent} {params.get('groups')} vs {legacy_intent} {legacy_groups}")
+            return 1
+
+    count = rounds * len(MESSAGES)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for message in MESSAGES:
+            detect_legacy(message)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for message in MESSAGES:
+            engine._detect_intent(message)
+    compiled_time = time.perf_counter() - start
+
+    print(f"Intent detection over {count} messages:")
+    print(f"  re.search on strings:  {legacy_time / count * 1e6:8.2f} us/message")
+    print(f"  precompiled matchers:  {compiled_time / count * 1e6:8.2f} us/message")
+    print(f"  speedup:               {legacy_time / compiled_time:8.2f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
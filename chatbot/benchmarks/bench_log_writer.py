@@ -0,0 +1,114 @@
+"""
+Benchmark for conversation log writing.
+Compares the old thread-per-message logging with the batched writer: the time
+a request spends handing off its log row, and rows per second reaching the
+database for several batch sizes. The MySQL server is simulated with a fixed
+round trip time per statement plus a small per-row cost.
+
+Usage (from the chatbot/ directory):
+    python benchmarks/bench_log_writer.py [--rows 2000] [--rtt-ms 1.0]
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector
+
+from utils.database import DatabaseConnector
+from utils.log_writer import ConversationLogWriter
+
+RTT = 0.001
+ROW_COST = 0.00002
+
+
+class SimulatedCursor:
+    def execute(self, operation, params=None, multi=False):
+        time.sleep(RTT + ROW_COST)
+
+    def executemany(self, operation, seq_params):
+        # mysql.connector rewrites a multi-row INSERT into one statement
+        time.sleep(RTT + ROW_COST * len(seq_params))
+
+    def close(self):
+        pass
+
+
+class SimulatedConnection:
+    def cursor(self, *args, **kwargs):
+        return SimulatedCursor()
+
+    def is_connected(self):
+        return True
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        pass
+
+    def close(self):
+        pass
+
+
+def thread_per_message(database, rows):
+    """The old log_conversation_async: one thread and one INSERT per row"""
+    latencies = []
+    threads = []
+    started = time.perf_counter()
+    for i in range(rows):
+        t0 = time.perf_counter()
+        thread = threading.Thread(target=database.log_conversation, args=(f"u{i}", "hi", "hello", 'greeting'))
+        thread.start()
+        latencies.append(time.perf_counter() - t0)
+        threads.append(thread)
+    peak_threads = threading.active_count()
+    for thread in threads:
+        thread.join()
+    return latencies, rows / (time.perf_counter() - started), peak_threads
+
+
+def batched(database, rows, batch_size):
+    writer = ConversationLogWriter(database, batch_size=batch_size, flush_interval=0.05, queue_size=rows).start()
+    latencies = []
+    started = time.perf_counter()
+    for i in range(rows):
+        t0 = time.perf_counter()
+        writer.log(f"u{i}", "hi", "hello", 'greeting')
+        latencies.append(time.perf_counter() - t0)
+    writer.close(timeout=600)
+    elapsed = time.perf_counter() - started
+    return latencies, writer.stats()['written'] / elapsed, writer.stats()
+
+
+def us(values):
+    values = sorted(values)
+    return f"{statistics.mean(values) * 1e6:8.1f} {values[int(len(values) * 0.99)] * 1e6:8.1f}"
+
+
+def main():
+    global RTT
+    parser = argparse.ArgumentParser(description="Conversation log writer benchmark")
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--rtt-ms', type=float, default=1.0, help="Simulated round trip time")
+    args = parser.parse_args()
+    RTT = args.rtt_ms / 1000
+
+    mysql.connector.connect = lambda **config: SimulatedConnection()
+    database = DatabaseConnector()
+
+    print(f"\n{args.rows} log rows, simulated {args.rtt_ms} ms RTT")
+    print(f"  {'mode':24} {'enqueue us (mean p99)':>22} {'rows/s':>10}")
+
+    latencies, throughput, peak_threads = thread_per_message(database, args.rows)
+    print(f"  {'thread per message':24} {us(latencies):>22} {throughput:10.0f}   peak threads {peak_threads}")
+
+    for batch_size in (1, 10, 100, 500):
+        latencies, throughput, stats = batched(database, args.rows, batch_size)
+        print(f"  {f'batched, batch {batch_size}':24} {us(latencies):>22} {throughput:10.0f}   "
+              f"batches {stats['batches']}, dropped {stats['dropped']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+"""
+Benchmark and regression check for SmartProductMatcher.find_products.
+Compares the indexed search (ProductIndex candidates) with scoring every
+product in the catalog, as find_products did before the index, on a
+synthetic catalog and queries with typos, short words and partial names.
+
+Whole-name fuzzy matches only come from names sharing a share of the
+query's bigrams or trigrams (ProductIndex.names_within_ratio), so the
+check is in two parts: the indexed search must return exactly what the full
+scan returns when the whole-name ratio is only computed for the index
+candidates, and every name the full scan matches on the ratio that
+names_within_ratio promises to find must be a candidate. Queries where the
+full scan still differs (names matching on scattered characters) are counted.
+
+--scaling times the indexed search on catalogs of growing size whose names
+come from a vocabulary that grows with the catalog, so the number of
+products a query really matches stays about the same.
+
+Usage (from the chatbot/ directory):
+    python benchmarks/bench_product_search.py [--products 400] [--queries 1500] [--seed 1]
+    python benchmarks/bench_product_search.py --scaling [--sizes 500,50000,500000] [--queries 300]
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.nlp_engine import FuzzyMatcher, ProductMatch, SmartProductMatcher
+from src.search_index import ProductIndex, char_ngrams
+
+
+WORDS = [
+    'galvanized', 'common', 'nails', 'stainless', 'steel', 'wood', 'screws', 'deck', 'hex', 'bolts',
+    'anchor', 'portland', 'cement', 'concrete', 'mix', 'mortar', 'grout', 'red', 'clay', 'brick',
+    'cinder', 'block', 'ceramic', 'porcelain', 'tile', 'latex', 'paint', 'primer', 'white', 'exterior',
+    'interior', 'drywall', 'sheet', 'plywood', 'ply', 'osb', 'board', 'pine', 'lumber', 'copper',
+    'pipe', 'pvc', 'fitting', 'wire', 'claw', 'hammer', 'cordless', 'drill', 'level', 'tape',
+    'insulation', 'foam', 'roofing', 'felt', 'shingles', '2x4', '3-inch', '1/2"', '16d', '10ft',
+]
+
+
+def make_catalog(count, rnd):
+    products = []
+    for product_id in range(1, count + 1):
+        name = ' '.join(rnd.sample(WORDS, rnd.randint(1, 4))).title()
+        products.append({
+            'id': product_id,
+            'name': name,
+            'description': ' '.join(rnd.sample(WORDS, rnd.randint(3, 8))),
+            'price': round(rnd.uniform(1, 300), 2),
+            'stock_quantity': rnd.choice([0, 10, 100]),
+            'category_id': rnd.randint(1, 10),
+            'supplier_id': rnd.randint(1, 5),
+        })
+    return products
+
+
+# English letter frequencies (percent), for made-up words
+LETTER_WEIGHTS = {
+    'e': 12.7, 't': 9.1, 'a': 8.2, 'o': 7.5, 'i': 7.0, 'n': 6.7, 's': 6.3, 'h': 6.1, 'r': 6.0,
+    'd': 4.3, 'l': 4.0, 'c': 2.8, 'u': 2.8, 'm': 2.4, 'w': 2.4, 'f': 2.2, 'g': 2.0, 'y': 2.0,
+    'p': 1.9, 'b': 1.5, 'v': 1.0, 'k': 0.8, 'j': 0.2, 'x': 0.2, 'q': 0.1, 'z': 0.1,
+}
+
+
+def make_word(rnd):
+    """Made-up word with English letter frequencies, like a brand or product line name"""
+    return ''.join(rnd.choices(list(LETTER_WEIGHTS), list(LETTER_WEIGHTS.values()), k=rnd.randint(4, 9)))
+
+
+def make_scaling_catalog(count, rnd):
+    """Catalog whose vocabulary grows with it: every word is in about the same number of products"""
+    vocabulary = sorted({make_word(rnd) for _ in range(max(50, count // 10))})
+    products = []
+    for product_id in range(1, count + 1):
+        words = rnd.sample(vocabulary, rnd.randint(2, 4))
+        if rnd.random() < 0.3:
+            words.append(f"{rnd.choice('bcdfghkmnprstvwxz')}{rnd.randint(10, 999)}")
+        products.append({
+            'id': product_id,
+            'name': ' '.join(words).title(),
+            'description': ' '.join(rnd.sample(vocabulary, rnd.randint(3, 8))),
+            'price': round(rnd.uniform(1, 300), 2),
+            'stock_quantity': rnd.choice([0, 10, 100]),
+            'category_id': rnd.randint(1, 10),
+            'supplier_id': rnd.randint(1, 5),
+        })
+    return products, vocabulary
+
+
+def typo(word, rnd):
+    """Drop, swap or replace one character"""
+    if len(word) < 2:
+        return word
+    i = rnd.randrange(len(word) - 1)
+    kind = rnd.randrange(3)
+    if kind == 0:
+        return word[:i] + word[i + 1:]
+    if kind == 1:
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    return word[:i] + rnd.choice('abcdefghijklmnopqrstuvwxyz') + word[i + 1:]
+
+
+def make_queries(products, count, rnd, vocabulary=WORDS):
+    queries = []
+    for _ in range(count):
+        kind = rnd.randrange(4)
+        if kind == 0:
+            words = rnd.choice(products)['name'].lower().split()
+            start = rnd.randrange(len(words))
+            query = ' '.join(words[start:start + rnd.randint(1, 3)])
+        elif kind == 1:
+            query = ' '.join(typo(w, rnd) for w in rnd.sample(vocabulary, rnd.randint(1, 2)))
+        elif kind == 2:
+            query = rnd.choice(vocabulary)[:rnd.randint(2, 4)]
+        else:
+            query = typo(rnd.choice(products)['name'].lower(), rnd)
+        queries.append(query)
+    return queries
+
+
+def correct_words(matcher, query):
+    """The query words find_products searches for, after typo correction"""
+    corrected_words = []
+    for word in query.lower().split():
+        corrected = FuzzyMatcher.correct_word(word)
+        if corrected == word:
+            corrected = matcher.speller.correct(word)
+        corrected_words.append(corrected)
+    return corrected_words
+
+
+def find_products_full_scan(matcher, query, limit, ratio_ids=None):
+    """
+    find_products scoring every product, without the candidate index.
+    With ratio_ids, the whole-name SequenceMatcher ratio is only used for those products.
+    """
+    corrected_words = correct_words(matcher, query)
+    corrected_query = ' '.join(corrected_words)
+    if not corrected_words:
+        return [ProductMatch(p, 1.0, 'exact') for p in matcher.products[:limit]]
+
+    matches = []
+    for product in matcher.products:
+        name = (product.get('name') or '').lower()
+        description = (product.get('description') or '').lower()
+        if corrected_query in name:
+            matches.append(ProductMatch(product, 1.0, 'exact'))
+            continue
+        use_ratio = ratio_ids is None or product['id'] in ratio_ids
+        is_match, score = FuzzyMatcher.fuzzy_match(
+            corrected_query, name, threshold=matcher.FUZZY_MIN_RATIO, use_ratio=use_ratio
+        )
+        if is_match and score >= 0.6:
+            matches.append(ProductMatch(product, score, 'fuzzy'))
+            continue
+        for word in corrected_words:
+            if len(word) >= 3 and word in name:
+                matches.append(ProductMatch(product, 0.7, 'keyword'))
+                break
+            elif len(word) >= 3 and word in description:
+                matches.append(ProductMatch(product, 0.5, 'keyword'))
+                break
+
+    seen = set()
+    unique_matches = []
+    for m in sorted(matches, key=lambda x: x.score, reverse=True):
+        if m.product['id'] not in seen:
+            seen.add(m.product['id'])
+            unique_matches.append(m)
+    return unique_matches[:limit]
+
+
+def summary(matches):
+    return [(m.product['id'], round(m.score, 6), m.match_type) for m in matches]
+
+
+def promised_by_index(query, name):
+    """Whether names_within_ratio promises to return a name that reaches the ratio (see its docstring)"""
+    n = 2 if len(query) <= ProductIndex.SHORT_QUERY_LENGTH else 3
+    grams = char_ngrams(f' {query} ', n)
+    min_shared = max(1, math.ceil(len(grams) * ProductIndex.NAME_GRAM_SHARE))
+    return len(grams & char_ngrams(f' {name} ', n)) >= min_shared
+
+
+def check_parity(matcher, queries, limit):
+    """Compare the indexed search with full scans; returns the number of failed queries"""
+    failures = 0
+    legacy_differences = 0
+    for query in queries:
+        words = correct_words(matcher, query)
+        candidate_ids = matcher.index.candidates(words, min_ratio=matcher.FUZZY_MIN_RATIO) if words else None
+        indexed = summary(matcher.find_products(query, limit))
+
+        scanned = summary(find_products_full_scan(matcher, query, limit, ratio_ids=candidate_ids))
+        if indexed != scanned:
+            failures += 1
+            if failures <= 10:
+                print(f"MISMATCH for '{query}':\n  index: {indexed}\n  scan:  {scanned}")
+            continue
+
+        if words:
+            corrected_query = ' '.join(words)
+            for product in matcher.products:
+                if product['id'] in candidate_ids:
+                    continue
+                name = (product.get('name') or '').lower()
+                is_match, score = FuzzyMatcher.fuzzy_match(corrected_query, name, threshold=matcher.FUZZY_MIN_RATIO)
+                if is_match and score >= 0.6 and promised_by_index(corrected_query, name):
+                    failures += 1
+                    print(f"MISSED for '{query}': '{name}' (ratio {score:.3f}) is not a candidate")
+                    break
+
+        if indexed != summary(find_products_full_scan(matcher, query, limit)):
+            legacy_differences += 1
+
+    print(f"{legacy_differences} of {len(queries)} queries differ from the full scan through "
+          f"whole-name matches on scattered characters")
+    return failures
+
+
+def run_scaling(sizes, query_count, limit, seed):
+    """Time the indexed search on catalogs of growing size"""
+    print(f"find_products on growing catalogs, {query_count} queries each:")
+    print(f"  {'products':>9} {'build s':>8} {'ms/query':>9} {'names_within_ratio ms':>22}")
+    for size in sizes:
+        rnd = random.Random(seed)
+        products, vocabulary = make_scaling_catalog(size, rnd)
+        queries = make_queries(products, query_count, rnd, vocabulary)
+
+        start = time.perf_counter()
+        matcher = SmartProductMatcher(products)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for query in queries:
+            matcher.find_products(query, limit)
+        search_time = time.perf_counter() - start
+
+        whole_names = [' '.join(correct_words(matcher, query)) for query in queries]
+        start = time.perf_counter()
+        for query in whole_names:
+            matcher.index.names_within_ratio(query, matcher.FUZZY_MIN_RATIO)
+        ratio_time = time.perf_counter() - start
+
+        print(f"  {size:>9} {build_time:>8.1f} {search_time / query_count * 1e3:>9.3f} "
+              f"{ratio_time / query_count * 1e3:>22.3f}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Indexed find_products vs a full catalog scan")
+    parser.add_argument('--products', type=int, default=400)
+    parser.add_argument('--queries', type=int, default=1500)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--scaling', action='store_true', help="time the indexed search on growing catalogs")
+    parser.add_argument('--sizes', default='500,50000,500000', help="catalog sizes for --scaling")
+    args = parser.parse_args()
+
+    if args.scaling:
+        sizes = [int(size) for size in args.sizes.split(',')]
+        return run_scaling(sizes, min(args.queries, 300), args.limit, args.seed)
+
+    rnd = random.Random(args.seed)
+    products = make_catalog(args.products, rnd)
+    queries = make_queries(products, args.queries, rnd)
+    matcher = SmartProductMatcher(products)
+
+    # The indexed search must agree with the full scan before timing them
+    failures = check_parity(matcher, queries, args.limit)
+    if failures:
+        print(f"{failures} of {len(queries)} queries failed the check")
+        return 1
+
+    start = time.perf_counter()
+    for query in queries:
+        find_products_full_scan(matcher, query, args.limit)
+    scan_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for query in queries:
+        matcher.find_products(query, args.limit)
+    index_time = time.perf_counter() - start
+
+    count = len(queries)
+    print(f"find_products over {count} queries, {len(products)} products:")
+    print(f"  full scan:  {scan_time / count * 1e3:8.3f} ms/query")
+    print(f"  indexed:    {index_time / count * 1e3:8.3f} ms/query")
+    print(f"  speedup:    {scan_time / index_time:8.2f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
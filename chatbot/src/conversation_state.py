@@ -2,13 +2,50 @@
 Unified Conversation State Manager for the Construkt chatbot.
 Single source of truth for all conversation context and state.
 """
+import atexit
 import json
 import time
 import os
+import zipfile
+from contextlib import contextmanager
 from datetime import datetime
+from decimal import Decimal
 from pathlib import Path
-from typing import Optional, Dict, Any, List
-from threading import Lock
+from typing import Optional, Dict, Any, List, Tuple
+from threading import Event, Lock, Thread
+
+from src.state_journal import StateJournal
+
+# 'behind' marks changed states dirty and writes them from a background thread;
+# 'sync' writes the user's file on every change
+STATE_WRITE_MODE = os.environ.get('CHATBOT_STATE_WRITE_MODE', 'behind')
+# Seconds between background flushes of changed states in 'behind' mode
+STATE_FLUSH_SECONDS = float(os.environ.get('CHATBOT_STATE_FLUSH_SECONDS', 2))
+# 'journal' appends state deltas to {user_id}.journal and compacts them into {user_id}.json;
+# 'snapshot' rewrites {user_id}.json in full on every write
+STATE_STORAGE = os.environ.get('CHATBOT_STATE_STORAGE', 'journal')
+# Journal entries per user before they are compacted into a new snapshot
+STATE_COMPACT_EVERY = int(os.environ.get('CHATBOT_STATE_COMPACT_EVERY', 100))
+# Seconds between sweeps that evict idle states and their locks and expire old files (0 disables)
+STATE_SWEEP_SECONDS = float(os.environ.get('CHATBOT_STATE_SWEEP_SECONDS', 300))
+# State files untouched for this many days are deleted or archived
+STATE_FILE_TTL_DAYS = float(os.environ.get('CHATBOT_STATE_FILE_TTL_DAYS', 30))
+# What happens to expired state files: delete | archive (into monthly zips next to data/contexts)
+STATE_EXPIRED_FILES = os.environ.get('CHATBOT_STATE_EXPIRED_FILES', 'delete')
+# Most users (or files) handled per sweep step, so one sweep never stalls for long
+STATE_SWEEP_BATCH = int(os.environ.get('CHATBOT_STATE_SWEEP_BATCH', 500))
+
+# Suffixes of the per-user files in the storage directory
+STATE_FILE_SUFFIXES = ('.json', '.journal', '.json.tmp')
+
+
+class StateEncoder(json.JSONEncoder):
+    """JSON encoder for Decimal and other types found in product dicts"""
+
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return float(obj)
+        return super().default(obj)
 
 
 class ConversationState:
@@ -189,7 +226,7 @@ class ConversationStateManager:
     _instance = None
     _lock = Lock()
 
-    def __new__(cls):
+    def __new__(cls, *args, **kwargs):
         if cls._instance is None:
             with cls._lock:
                 if cls._instance is None:
@@ -197,7 +234,8 @@ class ConversationStateManager:
                     cls._instance._initialized = False
         return cls._instance
 
-    def __init__(self, context_timeout: int = 3600, storage_dir: str = None):
+    def __init__(self, context_timeout: int = 3600, storage_dir: str = None, write_mode: str = None,
+                 flush_interval: float = None, storage: str = None):
         if self._initialized:
             return
 
@@ -206,6 +244,35 @@ class ConversationStateManager:
         self._global_lock = Lock()
         self.context_timeout = context_timeout  # 1 hour default
 
+        # Write-behind: user ids whose state changed since the last flush
+        self.write_mode = write_mode or STATE_WRITE_MODE
+        self.flush_interval = flush_interval if flush_interval is not None else STATE_FLUSH_SECONDS
+        self._dirty = set()
+        self._dirty_lock = Lock()
+        self._flush_lock = Lock()
+        self._flusher: Optional[Thread] = None
+        self._stop = Event()
+        self._write_stats = {'saves': 0, 'writes': 0, 'flushes': 0, 'errors': 0}
+
+        # Sweeper: idle states leave memory (their files stay), old files are expired
+        self.sweep_interval = STATE_SWEEP_SECONDS
+        self.file_ttl = STATE_FILE_TTL_DAYS * 86400
+        self.expired_files = STATE_EXPIRED_FILES
+        self.sweep_batch = STATE_SWEEP_BATCH
+        self.archive_dir = None
+        self._sweeper: Optional[Thread] = None
+        self._sweep_stats = {
+            'sweeps': 0,
+            'states_evicted': 0,
+            'locks_reclaimed': 0,
+            'files_deleted': 0,
+            'files_archived': 0,
+            'errors': 0,
+            'last_sweep': None,
+            'last_sweep_seconds': 0.0,
+            'last_sweep_counts': {},
+        }
+
         # Storage directory for persistent contexts
         if storage_dir:
             self.storage_dir = Path(storage_dir)
@@ -213,9 +280,26 @@ class ConversationStateManager:
             self.storage_dir = Path(__file__).parent.parent / 'data' / 'contexts'
 
         os.makedirs(self.storage_dir, exist_ok=True)
+
+        self.storage = storage or STATE_STORAGE
+        self.journal = None
+        if self.storage == 'journal':
+            self.journal = StateJournal(
+                self.storage_dir, encoder=StateEncoder, compact_every=STATE_COMPACT_EVERY,
+                max_history=ConversationState('').max_history_size
+            )
         self._initialized = True
 
-        print(f"ConversationStateManager initialized. Storage: {self.storage_dir}")
+        if self.archive_dir is None:
+            self.archive_dir = self.storage_dir.parent / f"{self.storage_dir.name}_archive"
+
+        atexit.register(self.close)
+        if self.sweep_interval > 0:
+            self._sweeper = Thread(target=self._sweep_loop, name='conversation-state-sweeper', daemon=True)
+            self._sweeper.start()
+
+        print(f"ConversationStateManager initialized. Storage: {self.storage_dir} "
+              f"({self.storage}, {self.write_mode} writes)")
 
     def _get_state_lock(self, user_id: str) -> Lock:
         """Get or create a lock for a specific user's state"""
@@ -224,11 +308,27 @@ class ConversationStateManager:
                 self._state_locks[user_id] = Lock()
             return self._state_locks[user_id]
 
+    @contextmanager
+    def _user_lock(self, user_id: str):
+        """
+        Hold a user's lock. The sweeper may drop a lock from the table while
+        someone waits on it, so the lock is re-checked after acquiring and the
+        wait repeated on the new one if it was replaced.
+        """
+        while True:
+            lock = self._get_state_lock(user_id)
+            lock.acquire()
+            if self._state_locks.get(user_id) is lock:
+                break
+            lock.release()
+        try:
+            yield
+        finally:
+            lock.release()
+
     def get_state(self, user_id: str) -> ConversationState:
         """Get or create conversation state for a user"""
-        lock = self._get_state_lock(user_id)
-
-        with lock:
+        with self._user_lock(user_id):
             # Check memory first
             if user_id in self._states:
                 state = self._states[user_id]
@@ -247,27 +347,92 @@ class ConversationStateManager:
             return state
 
     def save_state(self, user_id: str, state: ConversationState = None):
-        """Save state to memory and file"""
-        lock = self._get_state_lock(user_id)
-
-        with lock:
+        """Save state to memory, and to its file now ('sync') or on the next flush ('behind')"""
+        with self._user_lock(user_id):
             if state is None:
                 state = self._states.get(user_id)
 
             if state:
                 state.last_access = time.time()
                 self._states[user_id] = state
-                self._save_to_file(user_id, state)
+                self._count('saves')
+                if self.write_mode != 'behind':
+                    self._save_to_file(user_id, state)
+                    return
+
+        with self._dirty_lock:
+            self._dirty.add(user_id)
+        self._start_flusher()
+
+    def flush(self):
+        """Write every state changed since the last flush"""
+        with self._flush_lock:
+            with self._dirty_lock:
+                dirty, self._dirty = self._dirty, set()
+            for user_id in dirty:
+                # Under the user's lock so a concurrent clear_state cannot be undone by this write
+                with self._user_lock(user_id):
+                    state = self._states.get(user_id)
+                    if state:
+                        self._save_to_file(user_id, state)
+            if dirty:
+                self._count('flushes')
+
+    def close(self):
+        """Stop the background flusher and sweeper and write pending changes"""
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=self.flush_interval + 5)
+        if self._sweeper is not None:
+            self._sweeper.join(timeout=5)
+        self.flush()
+
+    def get_write_stats(self) -> Dict[str, Any]:
+        """State saves, file writes and pending dirty states"""
+        with self._dirty_lock:
+            stats = dict(self._write_stats)
+            stats['dirty'] = len(self._dirty)
+        stats['write_mode'] = self.write_mode
+        stats['storage'] = self.storage
+        if self.journal:
+            stats['journal'] = self.journal.stats()
+        return stats
+
+    def _count(self, metric: str):
+        with self._dirty_lock:
+            self._write_stats[metric] += 1
+
+    def _start_flusher(self):
+        if self._flusher is not None or self._stop.is_set():
+            return
+        with self._flush_lock:
+            if self._flusher is None:
+                self._flusher = Thread(target=self._flush_loop, name='conversation-state-flusher', daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing conversation states: {e}")
 
     def clear_state(self, user_id: str):
         """Clear state for a user"""
-        lock = self._get_state_lock(user_id)
-
-        with lock:
+        with self._user_lock(user_id):
             if user_id in self._states:
                 del self._states[user_id]
+            with self._dirty_lock:
+                self._dirty.discard(user_id)
 
             # Remove file
+            if self.journal:
+                try:
+                    self.journal.remove(user_id)
+                except Exception as e:
+                    print(f"Error removing state files: {e}")
+                return
+
             file_path = self.storage_dir / f"{user_id}.json"
             if file_path.exists():
                 try:
@@ -275,43 +440,196 @@ class ConversationStateManager:
                 except Exception as e:
                     print(f"Error removing state file: {e}")
 
-    def cleanup_expired(self):
-        """Remove expired states"""
+    def cleanup_expired(self, limit: int = None) -> int:
+        """
+        Evict states idle longer than context_timeout from memory, with their locks.
+        Pending changes are written first and the files are kept, so a returning
+        user gets their context back. Returns the number evicted.
+        """
         current_time = time.time()
-        expired = []
-
-        with self._global_lock:
-            for user_id, state in self._states.items():
-                if current_time - state.last_access > self.context_timeout:
-                    expired.append(user_id)
+        expired = [
+            user_id for user_id, state in list(self._states.items())
+            if current_time - state.last_access > self.context_timeout
+        ][:limit]
 
+        evicted = 0
         for user_id in expired:
-            self.clear_state(user_id)
-
-        if expired:
-            print(f"Cleaned up {len(expired)} expired conversation states")
-
-    def _save_to_file(self, user_id: str, state: ConversationState):
-        """Save state to JSON file"""
+            with self._user_lock(user_id):
+                state = self._states.get(user_id)
+                if state is None or current_time - state.last_access <= self.context_timeout:
+                    continue  # Used again since the scan
+                with self._dirty_lock:
+                    dirty = user_id in self._dirty
+                    self._dirty.discard(user_id)
+                if dirty:
+                    self._save_to_file(user_id, state)
+                del self._states[user_id]
+                if self.journal:
+                    self.journal.forget(user_id)
+                # Waiters on this lock notice it was dropped and take a new one
+                with self._global_lock:
+                    self._state_locks.pop(user_id, None)
+                evicted += 1
+
+        return evicted
+
+    def reclaim_locks(self, limit: int = None) -> int:
+        """Drop locks of users with no state in memory that nobody holds"""
+        reclaimed = 0
+        with self._global_lock:
+            for user_id, lock in list(self._state_locks.items()):
+                if limit is not None and reclaimed >= limit:
+                    break
+                if user_id in self._states or not lock.acquire(blocking=False):
+                    continue
+                del self._state_locks[user_id]
+                lock.release()
+                reclaimed += 1
+        return reclaimed
+
+    def expire_files(self, limit: int = None) -> Dict[str, int]:
+        """
+        Delete or archive the state files of users whose newest file was not
+        modified for file_ttl seconds, at most `limit` users per call. A
+        user's snapshot and journal expire together, never one without the
+        other. Users with a state in memory are skipped.
+        """
+        cutoff = time.time() - self.file_ttl
+        limit = limit or self.sweep_batch
+        newest = {}  # user_id -> newest mtime of their files
         try:
-            file_path = self.storage_dir / f"{user_id}.json"
+            with os.scandir(self.storage_dir) as entries:
+                for entry in entries:
+                    suffix = next((sfx for sfx in STATE_FILE_SUFFIXES if entry.name.endswith(sfx)), None)
+                    if suffix is None:
+                        continue
+                    user_id = entry.name[:-len(suffix)]
+                    newest[user_id] = max(newest.get(user_id, 0), entry.stat().st_mtime)
+        except OSError as e:
+            print(f"Error scanning state files: {e}")
+            return {'deleted': 0, 'archived': 0}
+
+        stale = [
+            user_id for user_id, mtime in newest.items()
+            if mtime < cutoff and user_id not in self._states
+        ][:limit]
+
+        counts = {'deleted': 0, 'archived': 0}
+        archive = None
+        try:
+            for user_id in stale:
+                with self._user_lock(user_id):
+                    if user_id in self._states:
+                        continue  # Came back while we were scanning
+                    paths = self._user_files(user_id)
+                    if any(mtime >= cutoff for _, mtime in paths):
+                        continue  # Written since the scan
+                    for path, _ in paths:
+                        try:
+                            if self.expired_files == 'archive' and not path.endswith('.tmp'):
+                                if archive is None:
+                                    archive = self._open_archive()
+                                archive.write(path, arcname=os.path.basename(path))
+                                counts['archived'] += 1
+                            else:
+                                counts['deleted'] += 1
+                            os.remove(path)
+                        except OSError as e:
+                            self._sweep_stats['errors'] += 1
+                            print(f"Error expiring state file {path}: {e}")
+                    if self.journal:
+                        self.journal.forget(user_id)
+        finally:
+            if archive is not None:
+                archive.close()
+        return counts
+
+    def _user_files(self, user_id: str) -> List[Tuple[str, float]]:
+        """(path, mtime) of each state file a user has"""
+        files = []
+        for suffix in STATE_FILE_SUFFIXES:
+            path = os.path.join(self.storage_dir, f"{user_id}{suffix}")
+            try:
+                files.append((path, os.stat(path).st_mtime))
+            except FileNotFoundError:
+                pass
+        return files
+
+    def sweep(self) -> Dict[str, Any]:
+        """One sweeper pass: idle states, orphaned locks, then expired files"""
+        started = time.monotonic()
+        counts = {
+            'states_evicted': self.cleanup_expired(self.sweep_batch),
+            'locks_reclaimed': self.reclaim_locks(self.sweep_batch),
+        }
+        files = self.expire_files(self.sweep_batch)
+        counts['files_deleted'] = files['deleted']
+        counts['files_archived'] = files['archived']
+        elapsed = time.monotonic() - started
+
+        stats = self._sweep_stats
+        stats['sweeps'] += 1
+        for key, value in counts.items():
+            stats[key] += value
+        stats['last_sweep'] = datetime.now().isoformat(timespec='seconds')
+        stats['last_sweep_seconds'] = round(elapsed, 4)
+        stats['last_sweep_counts'] = counts
+        if any(counts.values()):
+            print(f"State sweep in {elapsed:.3f}s: {counts}")
+        return counts
+
+    def get_sweep_stats(self) -> Dict[str, Any]:
+        """Sweep totals, the last sweep's duration and counts, and current table sizes"""
+        stats = dict(self._sweep_stats)
+        stats['states_in_memory'] = len(self._states)
+        stats['locks'] = len(self._state_locks)
+        stats['sweep_interval'] = self.sweep_interval
+        return stats
+
+    def _open_archive(self) -> zipfile.ZipFile:
+        """This month's archive zip (appended to), so archived files do not use an inode each"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = self.archive_dir / f"states-{time.strftime('%Y-%m')}.zip"
+        return zipfile.ZipFile(path, 'a', compression=zipfile.ZIP_DEFLATED)
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                self._sweep_stats['errors'] += 1
+                print(f"Error sweeping conversation states: {e}")
 
-            # Custom encoder for Decimal and other types
-            class StateEncoder(json.JSONEncoder):
-                def default(self, obj):
-                    from decimal import Decimal
-                    if isinstance(obj, Decimal):
-                        return float(obj)
-                    return super().default(obj)
+    def _save_to_file(self, user_id: str, state: ConversationState):
+        """Save state to JSON file (compact, replaced atomically so readers never see half a file)"""
+        if self.journal:
+            try:
+                if self.journal.save(user_id, state.to_dict()) != 'unchanged':
+                    self._count('writes')
+            except Exception as e:
+                self._count('errors')
+                print(f"Error saving state to journal: {e}")
+            return
 
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(state.to_dict(), f, cls=StateEncoder, ensure_ascii=False, indent=2)
+        file_path = self.storage_dir / f"{user_id}.json"
+        tmp_path = self.storage_dir / f"{user_id}.json.tmp"
+        try:
+            data = json.dumps(state.to_dict(), cls=StateEncoder, ensure_ascii=False, separators=(',', ':'))
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, file_path)
+            self._count('writes')
         except Exception as e:
+            self._count('errors')
             print(f"Error saving state to file: {e}")
 
     def _load_from_file(self, user_id: str) -> Optional[ConversationState]:
         """Load state from JSON file"""
         try:
+            if self.journal:
+                data = self.journal.load(user_id)
+                return ConversationState.from_dict(data) if data else None
+
             file_path = self.storage_dir / f"{user_id}.json"
             if file_path.exists():
                 with open(file_path, 'r', encoding='utf-8') as f:
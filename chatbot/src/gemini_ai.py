@@ -5,6 +5,11 @@ Uses Gemini 2.5 Flash for intelligent, conversational responses.
 import os
 import re
 import json
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from typing import Dict, List, Optional, Any
 from dotenv import load_dotenv
 
@@ -13,11 +18,178 @@ load_dotenv()
 
 try:
     from google import genai
+    from google.genai import types as genai_types
     GEMINI_AVAILABLE = True
 except ImportError:
     GEMINI_AVAILABLE = False
     print("Warning: google-genai not installed. Run: pip install google-genai")
 
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')
+# Alternative API endpoint, e.g. tools/fake_gemini.py for local testing
+GEMINI_BASE_URL = os.getenv('GEMINI_BASE_URL')
+# Seconds a request waits for Gemini before answering with the NLP response
+GEMINI_DEADLINE_SECONDS = float(os.getenv('GEMINI_DEADLINE_SECONDS', 8))
+# Gemini calls in flight at once (running or still finishing after their deadline)
+GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', 4))
+# Consecutive failures or timeouts that open the circuit, and seconds until a trial call
+GEMINI_BREAKER_FAILURES = int(os.getenv('GEMINI_BREAKER_FAILURES', 5))
+GEMINI_BREAKER_RESET_SECONDS = float(os.getenv('GEMINI_BREAKER_RESET_SECONDS', 30))
+# Cached answers for repeated questions (0 entries disables the cache)
+GEMINI_CACHE_SIZE = int(os.getenv('GEMINI_CACHE_SIZE', 1000))
+GEMINI_CACHE_TTL_SECONDS = float(os.getenv('GEMINI_CACHE_TTL_SECONDS', 3600))
+# Prompt size limits in estimated tokens: the catalog section, and the whole prompt
+# (conversation history is shortened to fit)
+GEMINI_CATALOG_TOKEN_BUDGET = int(os.getenv('GEMINI_CATALOG_TOKEN_BUDGET', 500))
+GEMINI_PROMPT_TOKEN_BUDGET = int(os.getenv('GEMINI_PROMPT_TOKEN_BUDGET', 1500))
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for English prompt text (about 4 characters per token)"""
+    return (len(text) + 3) // 4
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing upstream for a while.
+    Opens after `failure_threshold` consecutive failures; after `reset_timeout`
+    seconds one trial call is let through (half-open) and its result closes or
+    re-opens the circuit.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go out now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def release_trial(self):
+        """Give back a half-open trial slot that was not used for a call"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'times_opened': self.times_opened,
+            }
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache of Gemini answers.
+    Keys carry the catalog version, and the whole cache is dropped the first
+    time a lookup arrives with a newer version, so answers quoting old prices
+    or stock are never served.
+    """
+
+    def __init__(self, max_entries=1000, ttl=3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (answer, stored_at, latency), least recently used first
+        self._catalog_version = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'evicted': 0,
+            'invalidations': 0,
+            'saved_seconds': 0.0,
+        }
+
+    @staticmethod
+    def normalize(message: str) -> str:
+        """Lowercase, drop punctuation and collapse whitespace"""
+        return ' '.join(re.sub(r"[^\w\s]", ' ', (message or '').lower()).split())
+
+    @staticmethod
+    def make_key(kind: str, message: str, catalog_version: Any, current_product_id: Any) -> str:
+        context = hashlib.sha1(f"{catalog_version}:{current_product_id}".encode('utf-8')).hexdigest()[:16]
+        return f"{kind}:{context}:{ResponseCache.normalize(message)}"
+
+    def get(self, key: str, catalog_version: Any) -> Optional[str]:
+        with self._lock:
+            self._check_version(catalog_version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            answer, stored_at, latency = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            self._stats['saved_seconds'] += latency
+            return answer
+
+    def put(self, key: str, catalog_version: Any, answer: str, latency: float):
+        with self._lock:
+            self._check_version(catalog_version)
+            self._entries[key] = (answer, time.monotonic(), latency)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evicted'] += 1
+
+    def _check_version(self, catalog_version: Any):
+        if catalog_version != self._catalog_version:
+            if self._entries:
+                self._entries.clear()
+                self._stats['invalidations'] += 1
+            self._catalog_version = catalog_version
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['saved_seconds'] = round(stats['saved_seconds'], 3)
+        stats['max_entries'] = self.max_entries
+        stats['ttl_seconds'] = self.ttl
+        return stats
+
 
 class GeminiAssistant:
     """Gemini AI assistant for enhanced chatbot responses"""
@@ -50,20 +222,69 @@ Recent conversation:
 {conversation_history}
 """
 
-    def __init__(self, api_key: str = None):
+    def __init__(
+        self,
+        api_key: str = None,
+        base_url: str = None,
+        deadline: float = None,
+        max_concurrency: int = None,
+        breaker: CircuitBreaker = None,
+        cache: ResponseCache = None,
+        catalog_token_budget: int = None,
+        prompt_token_budget: int = None
+    ):
         self.api_key = api_key or os.getenv('GEMINI_API_KEY')
+        self.base_url = base_url or GEMINI_BASE_URL
+        self.deadline = deadline if deadline is not None else GEMINI_DEADLINE_SECONDS
+        self.max_concurrency = max_concurrency or GEMINI_MAX_CONCURRENCY
+        self.breaker = breaker or CircuitBreaker(GEMINI_BREAKER_FAILURES, GEMINI_BREAKER_RESET_SECONDS)
+        if cache is None and GEMINI_CACHE_SIZE > 0:
+            cache = ResponseCache(GEMINI_CACHE_SIZE, GEMINI_CACHE_TTL_SECONDS)
+        self.cache = cache
+        self.catalog_token_budget = catalog_token_budget or GEMINI_CATALOG_TOKEN_BUDGET
+        self.prompt_token_budget = prompt_token_budget or GEMINI_PROMPT_TOKEN_BUDGET
+
+        # Catalog sections of the prompts, built once per catalog version
+        self._catalog_sections = {}  # kind -> (catalog_version, text)
+        self._sections_lock = threading.Lock()
         self.client = None
         self.enabled = False
 
+        # Calls run on a bounded pool so a slow upstream cannot tie up request threads;
+        # the semaphore also counts calls still finishing after their deadline passed
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='gemini')
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'calls': 0,
+            'succeeded': 0,
+            'failed': 0,
+            'timed_out': 0,
+            'rejected_busy': 0,
+            'rejected_open': 0,
+            'latency_seconds_total': 0.0,
+            'in_flight': 0,
+            'catalog_section_builds': 0,
+            'prompt_tokens_total': 0,
+            'prompts_trimmed': 0,
+        }
+
         if GEMINI_AVAILABLE and self.api_key:
             try:
                 # Set API key in environment if not set
                 if 'GEMINI_API_KEY' not in os.environ:
                     os.environ['GEMINI_API_KEY'] = self.api_key
 
-                self.client = genai.Client(api_key=self.api_key)
+                # One long-lived client keeps its HTTP connections open between calls.
+                # The transport timeout is a little past the deadline so abandoned calls end too.
+                http_options = genai_types.HttpOptions(
+                    base_url=self.base_url,
+                    timeout=int((self.deadline + 2) * 1000)
+                )
+                self.client = genai.Client(api_key=self.api_key, http_options=http_options)
                 self.enabled = True
-                print("Gemini AI (2.5 Flash) initialized successfully")
+                print(f"Gemini AI ({GEMINI_MODEL}) initialized successfully"
+                      + (f" at {self.base_url}" if self.base_url else ""))
             except Exception as e:
                 print(f"Error initializing Gemini: {e}")
                 self.enabled = False
@@ -72,33 +293,120 @@ Recent conversation:
         """Check if Gemini is available"""
         return self.enabled
 
+    def stats(self) -> Dict[str, Any]:
+        """Call counters, circuit breaker state and in-flight calls"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        succeeded = stats['succeeded']
+        stats['latency_seconds_avg'] = round(stats.pop('latency_seconds_total') / succeeded, 4) if succeeded else 0.0
+        calls = stats['calls']
+        stats['prompt_tokens_avg'] = round(stats.pop('prompt_tokens_total') / calls) if calls else 0
+        with self._sections_lock:
+            stats['catalog_section_tokens'] = {
+                kind: estimate_tokens(text) for kind, (_, text) in self._catalog_sections.items()
+            }
+        stats['max_concurrency'] = self.max_concurrency
+        stats['deadline_seconds'] = self.deadline
+        stats['circuit'] = self.breaker.stats()
+        stats['cache'] = self.cache.stats() if self.cache else None
+        return stats
+
+    def _count(self, metric: str, amount=1):
+        with self._stats_lock:
+            self._stats[metric] += amount
+
+    def _release_slot(self):
+        self._count('in_flight', -1)
+        self._slots.release()
+
+    def _cache_lookup(self, kind: str, message: str, catalog_version: Any, current_product: Dict = None):
+        """(cache key, cached answer); the key is None when the answer should not be cached"""
+        if self.cache is None or catalog_version is None:
+            return None, None
+        product_id = current_product.get('id') if current_product else None
+        key = ResponseCache.make_key(kind, message, catalog_version, product_id)
+        return key, self.cache.get(key, catalog_version)
+
+    def _generate(self, prompt: str, cache_key: str = None, catalog_version: Any = None) -> Optional[str]:
+        """
+        Run one generate_content call within the deadline.
+        Returns None (so callers keep their NLP response) when the circuit is
+        open, all slots are busy, the deadline passes or the call fails.
+        """
+        if not self.breaker.allow():
+            self._count('rejected_open')
+            return None
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected_busy')
+            # Not the upstream's fault; let a half-open trial be retried later
+            self.breaker.release_trial()
+            return None
+
+        self._count('calls')
+        self._count('in_flight')
+        self._count('prompt_tokens_total', estimate_tokens(prompt))
+        started = time.monotonic()
+        try:
+            future = self._executor.submit(
+                self.client.models.generate_content, model=GEMINI_MODEL, contents=prompt
+            )
+        except RuntimeError:
+            # Executor shut down at exit
+            self._release_slot()
+            self.breaker.release_trial()
+            return None
+        future.add_done_callback(lambda _: self._release_slot())
+
+        try:
+            response = future.result(timeout=self.deadline)
+        except FutureTimeout:
+            self._count('timed_out')
+            self.breaker.record_failure()
+            print(f"Gemini call passed its {self.deadline}s deadline")
+            return None
+        except Exception as e:
+            self._count('failed')
+            self.breaker.record_failure()
+            print(f"Gemini error: {e}")
+            return None
+
+        latency = time.monotonic() - started
+        self.breaker.record_success()
+        self._count('succeeded')
+        self._count('latency_seconds_total', latency)
+        if response and response.text:
+            answer = self._sanitize_response(response.text.strip())
+            if cache_key is not None and answer:
+                self.cache.put(cache_key, catalog_version, answer, latency)
+            return answer
+        return None
+
     def generate_response(
         self,
         user_message: str,
         products: List[Dict],
         current_product: Dict = None,
         conversation_history: List[Dict] = None,
-        nlp_context: Dict = None
+        nlp_context: Dict = None,
+        catalog_version: Any = None
     ) -> str:
-        """Generate a response using Gemini 2.5 Flash"""
+        """
+        Generate a response using Gemini 2.5 Flash.
+        With a catalog_version, answers are cached per normalized message and current product.
+        """
         if not self.enabled:
             return None
 
-        try:
-            # Build product context
-            product_context = self._build_product_context(products, current_product)
+        cache_key, cached = self._cache_lookup('response', user_message, catalog_version, current_product)
+        if cached is not None:
+            return cached
 
-            # Build conversation context
-            history_str = self._build_history_context(conversation_history or [])
-
-            # Build system context
-            system_context = self.SYSTEM_PROMPT.format(
-                product_context=product_context,
-                conversation_history=history_str
-            )
+        try:
+            # Build product context (the catalog part is reused while the catalog is unchanged)
+            product_context = self._build_product_context(products, current_product, catalog_version)
 
-            # Build the user prompt
-            prompt_parts = [system_context]
+            # Everything except the conversation history
+            prompt_parts = []
 
             if nlp_context:
                 intent = nlp_context.get('intent', 'unknown')
@@ -110,17 +418,22 @@ Recent conversation:
             prompt_parts.append(f"\nCustomer says: \"{user_message}\"")
             prompt_parts.append("\nProvide a helpful, natural response:")
 
-            full_prompt = '\n'.join(prompt_parts)
+            # Build conversation context from what is left of the token budget
+            fixed_tokens = estimate_tokens(self.SYSTEM_PROMPT) + estimate_tokens(product_context) + \
+                sum(estimate_tokens(part) + 1 for part in prompt_parts)
+            history_str = self._build_history_context(
+                conversation_history or [], max_tokens=self.prompt_token_budget - fixed_tokens
+            )
 
-            # Generate response using Gemini 2.5 Flash
-            response = self.client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=full_prompt
+            # Build system context
+            system_context = self.SYSTEM_PROMPT.format(
+                product_context=product_context,
+                conversation_history=history_str
             )
 
-            if response and response.text:
-                return self._sanitize_response(response.text.strip())
-            return None
+            full_prompt = '\n'.join([system_context] + prompt_parts)
+
+            return self._generate(full_prompt, cache_key, catalog_version)
 
         except Exception as e:
             print(f"Gemini error: {e}")
@@ -140,12 +453,17 @@ Recent conversation:
         self,
         question: str,
         products: List[Dict],
-        current_product: Dict = None
+        current_product: Dict = None,
+        catalog_version: Any = None
     ) -> str:
         """Answer a general construction question"""
         if not self.enabled:
             return None
 
+        cache_key, cached = self._cache_lookup('question', question, catalog_version, current_product)
+        if cached is not None:
+            return cached
+
         try:
             # Build minimal context
             context = "You are a construction materials expert helping a customer.\n"
@@ -157,17 +475,7 @@ Recent conversation:
                     context += f"Specifications: {dims}\n"
 
             # Add some available products
-            categories = {}
-            for p in products[:30]:
-                cat = p.get('category_name', 'Other')
-                if cat not in categories:
-                    categories[cat] = []
-                if len(categories[cat]) < 3:
-                    categories[cat].append(f"{p.get('name')} (${p.get('price')})")
-
-            context += "\nAvailable products by category:\n"
-            for cat, items in categories.items():
-                context += f"- {cat}: {', '.join(items)}\n"
+            context += self._catalog_section('available', products, catalog_version)
 
             prompt = f"""{context}
 
@@ -176,20 +484,18 @@ Customer question: {question}
 IMPORTANT: Respond ONLY in English. Never use Russian, Ukrainian, or any Cyrillic characters.
 Provide a helpful, concise answer (under 100 words). If the question is about specific products, reference our inventory."""
 
-            response = self.client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt
-            )
-
-            if response and response.text:
-                return self._sanitize_response(response.text.strip())
-            return None
+            return self._generate(prompt, cache_key, catalog_version)
 
         except Exception as e:
             print(f"Gemini error: {e}")
             return None
 
-    def _build_product_context(self, products: List[Dict], current_product: Dict = None) -> str:
+    def _build_product_context(
+        self,
+        products: List[Dict],
+        current_product: Dict = None,
+        catalog_version: Any = None
+    ) -> str:
         """Build product context for the prompt"""
         parts = []
 
@@ -199,6 +505,38 @@ Provide a helpful, concise answer (under 100 words). If the question is about sp
             parts.append(f"  Stock: {current_product.get('stock_quantity')} available")
             parts.append(f"  Category: {current_product.get('category_name')}")
 
+        parts.append(self._catalog_section('inventory', products, catalog_version))
+
+        return '\n'.join(parts)
+
+    def _catalog_section(self, kind: str, products: List[Dict], catalog_version: Any = None) -> str:
+        """
+        Catalog part of a prompt ('inventory' or 'available'), reused until the
+        catalog version changes. Without a version it is built on every call.
+        """
+        if catalog_version is not None:
+            with self._sections_lock:
+                cached = self._catalog_sections.get(kind)
+            if cached and cached[0] == catalog_version:
+                return cached[1]
+
+        if kind == 'inventory':
+            text = self._build_inventory_section(products)
+        else:
+            text = self._build_available_section(products)
+        self._count('catalog_section_builds')
+
+        if catalog_version is not None:
+            with self._sections_lock:
+                self._catalog_sections[kind] = (catalog_version, text)
+        return text
+
+    def _build_inventory_section(self, products: List[Dict]) -> str:
+        """
+        Products grouped by category, up to 4 per category, within the catalog token budget.
+        Categories take turns adding a product so a large catalog still shows every category
+        it has room for instead of filling the budget from the first few.
+        """
         # Group products by category
         categories = {}
         for p in products:
@@ -207,29 +545,70 @@ Provide a helpful, concise answer (under 100 words). If the question is about sp
                 categories[cat] = []
             categories[cat].append(p)
 
-        parts.append("\nOur inventory by category:")
-        for cat, prods in list(categories.items())[:8]:
-            parts.append(f"\n{cat}:")
-            for p in prods[:4]:
-                stock_status = "in stock" if p.get('stock_quantity', 0) > 0 else "out of stock"
-                parts.append(f"  - {p.get('name')}: ${p.get('price')}/{p.get('unit')} ({stock_status})")
-
+        header = "\nOur inventory by category:"
+        used = estimate_tokens(header)
+        lines = {cat: [] for cat in categories}
+        full = False
+        for rank in range(4):
+            for cat, prods in categories.items():
+                if rank >= len(prods):
+                    continue
+                p = prods[rank]
+                stock_status = "in stock" if (p.get('stock_quantity') or 0) > 0 else "out of stock"
+                line = f"  - {p.get('name')}: ${p.get('price')}/{p.get('unit')} ({stock_status})"
+                cost = estimate_tokens(line) + (estimate_tokens(f"\n{cat}:") if rank == 0 else 0)
+                if used + cost > self.catalog_token_budget:
+                    full = True
+                    break
+                lines[cat].append(line)
+                used += cost
+            if full:
+                break
+
+        parts = [header]
+        for cat, cat_lines in lines.items():
+            if cat_lines:
+                parts.append(f"\n{cat}:")
+                parts.extend(cat_lines)
         return '\n'.join(parts)
 
-    def _build_history_context(self, history: List[Dict]) -> str:
-        """Build conversation history for context"""
+    def _build_available_section(self, products: List[Dict]) -> str:
+        """A few products per category from the start of the catalog, for short answers"""
+        categories = {}
+        for p in products[:30]:
+            cat = p.get('category_name', 'Other')
+            if cat not in categories:
+                categories[cat] = []
+            if len(categories[cat]) < 3:
+                categories[cat].append(f"{p.get('name')} (${p.get('price')})")
+
+        section = "\nAvailable products by category:\n"
+        for cat, items in categories.items():
+            section += f"- {cat}: {', '.join(items)}\n"
+        return section
+
+    def _build_history_context(self, history: List[Dict], max_tokens: int = None) -> str:
+        """Build conversation history for context, newest messages first to fit max_tokens"""
         if not history:
             return "New conversation"
 
         lines = []
-        for msg in history[-6:]:  # Last 6 messages
+        used = 0
+        for msg in reversed(history[-6:]):  # Last 6 messages
             role = "Customer" if msg.get('is_user') else "Assistant"
             content = msg.get('content', '')
             if len(content) > 150:
                 content = content[:150] + "..."
-            lines.append(f"{role}: {content}")
-
-        return '\n'.join(lines)
+            line = f"{role}: {content}"
+            if max_tokens is not None and used + estimate_tokens(line) > max_tokens:
+                self._count('prompts_trimmed')
+                break
+            lines.append(line)
+            used += estimate_tokens(line) + 1
+
+        if not lines:
+            return "New conversation"
+        return '\n'.join(reversed(lines))
 
 
 # Singleton instance
@@ -6,51 +6,209 @@ Features:
 - Product comparison (same category only)
 - Price calculations
 - Stock checking with alternatives
-- Unlimited conversation context
+- Bounded, evicting per-user conversation context
 """
+import gc
+import os
 import re
 import json
+import mmap
+import heapq
+import itertools
+import pickle
+import threading
+from collections import Counter
 from difflib import SequenceMatcher
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Callable, Dict, List, Optional, Tuple, Any
 from dataclasses import dataclass, field
 
+from src.search_index import NUMPY_AVAILABLE, BM25Index, ProductIndex, SpellingCorrector, TrigramIndex
+from src.session_store import SessionBackend, SessionStore
+
+# Process-wide source of catalog versions, so a rebuilt or restored engine never reuses one
+_catalog_versions = itertools.count(1)
+
 
 @dataclass
 class ProductMatch:
     """Represents a matched product with confidence score"""
     product: Dict
     score: float
-    match_type: str  # 'exact', 'fuzzy', 'keyword'
+    match_type: str  # 'exact', 'fuzzy', 'keyword', 'bm25'
 
 
 @dataclass
 class ConversationMemory:
-    """Stores full conversation history and context"""
+    """
+    Stores conversation history and context.
+    Products are kept as IDs and resolved against the live catalog when read;
+    only products the catalog does not know are held as dicts.
+    """
     messages: List[Dict] = field(default_factory=list)
-    mentioned_products: List[Dict] = field(default_factory=list)  # All products mentioned
-    current_product: Optional[Dict] = None  # Most recent product focus
-    comparison_products: List[Dict] = field(default_factory=list)  # Products being compared
+    mentioned_product_ids: Dict[Any, None] = field(default_factory=dict)  # Ordered set of all products mentioned
+    current_product_id: Any = None  # Most recent product focus
+    comparison_product_ids: List[Any] = field(default_factory=list)  # Products being compared
     last_intent: Optional[str] = None
     user_preferences: Dict = field(default_factory=dict)  # Size, material preferences
     # Calculator state
     calculator_material_type: Optional[str] = None
     calculator_dimensions: Dict = field(default_factory=dict)
     calculator_state: Optional[str] = None
+    # History caps (0 is unlimited) and the approximate size of the kept messages
+    max_messages: int = 0
+    max_bytes: int = 0
+    size_bytes: int = 0
+    message_count: int = 0  # Messages ever added, including trimmed ones
+    # Live catalog by product ID (set by the engine, not persisted)
+    catalog: Optional[Dict[Any, Dict]] = field(default=None, repr=False, compare=False)
+    detached_products: Dict[Any, Dict] = field(default_factory=dict, repr=False)  # Products missing from the catalog
+
+    # Rough cost of a message beyond its text, and of each product reference
+    MESSAGE_OVERHEAD_BYTES = 200
+    PRODUCT_REF_BYTES = 8
+
+    def __getstate__(self) -> Dict:
+        state = self.__dict__.copy()
+        state['catalog'] = None
+        return state
+
+    def to_dict(self) -> Dict:
+        """Convert memory to a JSON-friendly dict (the catalog and caps are not included)"""
+        return {
+            'messages': self.messages,
+            'mentioned_product_ids': list(self.mentioned_product_ids),
+            'current_product_id': self.current_product_id,
+            'comparison_product_ids': self.comparison_product_ids,
+            'last_intent': self.last_intent,
+            'user_preferences': self.user_preferences,
+            'calculator_material_type': self.calculator_material_type,
+            'calculator_dimensions': self.calculator_dimensions,
+            'calculator_state': self.calculator_state,
+            'size_bytes': self.size_bytes,
+            'message_count': self.message_count,
+            'detached_products': list(self.detached_products.values()),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ConversationMemory':
+        """Create memory from a dict made by to_dict"""
+        memory = cls()
+        memory.messages = data.get('messages', [])
+        memory.mentioned_product_ids = dict.fromkeys(data.get('mentioned_product_ids', []))
+        memory.current_product_id = data.get('current_product_id')
+        memory.comparison_product_ids = data.get('comparison_product_ids', [])
+        memory.last_intent = data.get('last_intent')
+        memory.user_preferences = data.get('user_preferences', {})
+        memory.calculator_material_type = data.get('calculator_material_type')
+        memory.calculator_dimensions = data.get('calculator_dimensions', {})
+        memory.calculator_state = data.get('calculator_state')
+        memory.size_bytes = data.get('size_bytes', 0)
+        memory.message_count = data.get('message_count', len(memory.messages))
+        memory.detached_products = {p.get('id'): p for p in data.get('detached_products', [])}
+        return memory
+
+    def _remember(self, product: Dict) -> Any:
+        """Get a product's ID, holding the dict only if the catalog cannot resolve it"""
+        product_id = product.get('id')
+        if self.catalog is None or product_id not in self.catalog:
+            self.detached_products[product_id] = product
+        return product_id
+
+    def _resolve(self, product_id: Any) -> Optional[Dict]:
+        """Look up a product by ID in the live catalog"""
+        if self.catalog is not None:
+            product = self.catalog.get(product_id)
+            if product is not None:
+                return product
+        return self.detached_products.get(product_id)
+
+    def _resolve_all(self, product_ids) -> List[Dict]:
+        """Resolve product IDs, skipping products no longer available"""
+        products = []
+        for product_id in product_ids:
+            product = self._resolve(product_id)
+            if product is not None:
+                products.append(product)
+        return products
+
+    @property
+    def mentioned_products(self) -> List[Dict]:
+        """All products mentioned, in first-mention order"""
+        return self._resolve_all(self.mentioned_product_ids)
+
+    @property
+    def current_product(self) -> Optional[Dict]:
+        """Most recent product focus"""
+        if self.current_product_id is None:
+            return None
+        return self._resolve(self.current_product_id)
+
+    @current_product.setter
+    def current_product(self, product: Optional[Dict]):
+        self.current_product_id = self._remember(product) if product else None
+
+    @property
+    def comparison_products(self) -> List[Dict]:
+        """Products being compared"""
+        return self._resolve_all(self.comparison_product_ids)
+
+    @comparison_products.setter
+    def comparison_products(self, products: List[Dict]):
+        self.comparison_product_ids = [self._remember(p) for p in products or []]
+
+    def set_limits(self, max_messages: int, max_bytes: int):
+        """Cap the kept history and trim it to the new limits"""
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self._trim()
 
     def add_message(self, content: str, is_user: bool, intent: str = None, products: List[Dict] = None):
-        """Add a message to history"""
-        self.messages.append({
+        """Add a message to history (the oldest messages are dropped past the caps)"""
+        message = {
             'content': content,
             'is_user': is_user,
             'intent': intent,
-            'products': products or [],
-            'index': len(self.messages)
-        })
-
-        if products:
-            for p in products:
-                if p not in self.mentioned_products:
-                    self.mentioned_products.append(p)
+            'product_ids': [self._remember(p) for p in products or []],
+            'index': self.message_count
+        }
+        self.messages.append(message)
+        self.message_count += 1
+        self.size_bytes += self._message_bytes(message)
+        self._trim()
+
+        for product_id in message['product_ids']:
+            if product_id not in self.mentioned_product_ids:
+                self.mentioned_product_ids[product_id] = None
+
+    def get_messages(self) -> List[Dict]:
+        """Get history messages with their products resolved"""
+        history = []
+        for message in self.messages:
+            resolved = {key: value for key, value in message.items() if key != 'product_ids'}
+            resolved['products'] = self._resolve_all(message['product_ids'])
+            history.append(resolved)
+        return history
+
+    def _message_bytes(self, message: Dict) -> int:
+        """Approximate memory held by one history message"""
+        content = message.get('content') or ''
+        return (len(content.encode('utf-8')) + self.MESSAGE_OVERHEAD_BYTES
+                + self.PRODUCT_REF_BYTES * len(message.get('product_ids') or []))
+
+    def _trim(self):
+        """Drop the oldest messages until the history fits its caps (the newest is always kept)"""
+        drop = 0
+        size = self.size_bytes
+        while len(self.messages) - drop > 1:
+            over_count = self.max_messages and len(self.messages) - drop > self.max_messages
+            over_bytes = self.max_bytes and size > self.max_bytes
+            if not over_count and not over_bytes:
+                break
+            size -= self._message_bytes(self.messages[drop])
+            drop += 1
+        if drop:
+            del self.messages[:drop]
+            self.size_bytes = size
 
     def get_products_by_category(self, category_id: int) -> List[Dict]:
         """Get all mentioned products in a specific category"""
@@ -102,8 +260,9 @@ class FuzzyMatcher:
         return SequenceMatcher(None, s1.lower(), s2.lower()).ratio()
 
     @classmethod
-    def fuzzy_match(cls, query: str, target: str, threshold: float = 0.7) -> Tuple[bool, float]:
-        """Check if query fuzzy-matches target"""
+    def fuzzy_match(cls, query: str, target: str, threshold: float = 0.7,
+                    use_ratio: bool = True) -> Tuple[bool, float]:
+        """Check if query fuzzy-matches target (use_ratio=False skips the SequenceMatcher pass)"""
         query_lower = query.lower()
         target_lower = target.lower()
 
@@ -116,7 +275,7 @@ class FuzzyMatcher:
             return True, 0.9
 
         # Fuzzy match
-        score = cls.similarity(query_lower, target_lower)
+        score = cls.similarity(query_lower, target_lower) if use_ratio else 0.0
         if score >= threshold:
             return True, score
 
@@ -149,9 +308,86 @@ class SmartProductMatcher:
         'tools': ['hammer', 'tape', 'level', 'saw', 'drill', 'tool'],
     }
 
-    def __init__(self, products: List[Dict]):
+    # 'sequence' runs SequenceMatcher on every candidate name,
+    # 'trigram' runs it only on the names closest by trigram overlap
+    MATCH_MODES = ('sequence', 'trigram')
+    FUZZY_SHORTLIST_SIZE = 20
+    FUZZY_MIN_DICE = 0.2
+    # SequenceMatcher ratio a whole query needs for a fuzzy name match
+    FUZZY_MIN_RATIO = 0.7
+
+    # 'tiers' ranks by exact/fuzzy/keyword tiers, 'bm25' by BM25 relevance
+    RANK_MODES = ('tiers', 'bm25')
+    BM25_PARTIAL_WEIGHT = 0.5  # Weight of indexed tokens that only contain a query word
+
+    # Precomputed alternatives per product, filled by a background thread after the
+    # matcher is built; larger categories (and products not reached yet) are ranked on first use
+    ALTERNATIVES_TABLE_SIZE = 20
+    ALTERNATIVES_EAGER_LIMIT = 200
+
+    def __init__(self, products: List[Dict], match_mode: str = 'sequence', categories: List[Dict] = None,
+                 rank_mode: str = 'tiers'):
+        if match_mode not in self.MATCH_MODES:
+            print(f"Unknown match mode '{match_mode}', using 'sequence'")
+            match_mode = 'sequence'
+        if rank_mode not in self.RANK_MODES:
+            print(f"Unknown rank mode '{rank_mode}', using 'tiers'")
+            rank_mode = 'tiers'
+        if rank_mode == 'bm25' and not NUMPY_AVAILABLE:
+            print("Warning: numpy not installed, BM25 ranking disabled. Run: pip install numpy")
+            rank_mode = 'tiers'
+
         self.products = products
+        self._lock = threading.Lock()  # Serializes index reads with apply_delta
+        self.match_mode = match_mode
+        self.rank_mode = rank_mode
+        self.products_by_id = {p.get('id'): p for p in products}
         self.products_by_category = self._group_by_category()
+        self.index = ProductIndex(products)
+        self._fuzzy_index = TrigramIndex(products) if match_mode == 'trigram' else None
+        self._bm25_index = BM25Index(products) if rank_mode == 'bm25' else None
+        self.alternatives_table: Dict[Any, List[Any]] = {}
+        self._alternatives_thread: Optional[threading.Thread] = None
+        self.category_names: List[str] = []
+        self.speller = SpellingCorrector(
+            text for p in products for text in (p.get('name'), p.get('description'))
+        )
+        self.set_categories(categories or [])
+        self.start_alternatives_build()
+
+    def set_categories(self, categories: List[Dict]):
+        """Replace the category names known to the spelling corrector"""
+        for name in self.category_names:
+            self.speller.remove_text(name)
+        self.category_names = [c.get('name') or '' for c in categories]
+        for name in self.category_names:
+            self.speller.add_text(name)
+
+    def __getstate__(self) -> Dict:
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['_alternatives_thread'] = None
+        return state
+
+    def __setstate__(self, state: Dict):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        # A snapshot taken mid-build holds part of the table; rank the rest
+        self.start_alternatives_build()
+
+    @property
+    def fuzzy_index(self) -> TrigramIndex:
+        """Trigram index over names (built on first use in 'sequence' mode)"""
+        if self._fuzzy_index is None:
+            self._fuzzy_index = TrigramIndex(self.products)
+        return self._fuzzy_index
+
+    @property
+    def bm25_index(self) -> BM25Index:
+        """BM25 term matrix over names and descriptions (built on first use in 'tiers' mode)"""
+        if self._bm25_index is None:
+            self._bm25_index = BM25Index(self.products)
+        return self._bm25_index
 
     def _group_by_category(self) -> Dict[int, List[Dict]]:
         """Group products by category ID"""
@@ -163,31 +399,153 @@ class SmartProductMatcher:
             grouped[cat_id].append(p)
         return grouped
 
-    def find_products(self, query: str, limit: int = 5) -> List[ProductMatch]:
-        """Find products matching a query with fuzzy matching"""
+    def apply_delta(self, upserts: List[Dict] = None, deletes: List[Any] = None):
+        """
+        Patch the catalog with changed and removed products.
+        Indexes are updated per product. The product lists are replaced rather
+        than mutated, so callers iterating the old lists are not disturbed.
+        New products go to the end of the catalog order.
+        """
+        changed = {p.get('id'): p for p in upserts or []}
+        removed = {pid for pid in deletes or [] if pid not in changed}
+
+        with self._lock:
+            touched_categories = set()
+            for product_id in list(changed) + list(removed):
+                old = self.products_by_id.get(product_id)
+                if old is None:
+                    continue
+                touched_categories.add(old.get('category_id'))
+                self.speller.remove_text(old.get('name'))
+                self.speller.remove_text(old.get('description'))
+
+            for product_id in removed:
+                if self.products_by_id.pop(product_id, None) is None:
+                    continue
+                self.index.remove(product_id)
+                if self._fuzzy_index is not None:
+                    self._fuzzy_index.remove(product_id)
+                if self._bm25_index is not None:
+                    self._bm25_index.remove(product_id)
+
+            for product_id, product in changed.items():
+                touched_categories.add(product.get('category_id'))
+                self.products_by_id[product_id] = product
+                self.speller.add_text(product.get('name'))
+                self.speller.add_text(product.get('description'))
+                self.index.add(product)
+                if self._fuzzy_index is not None:
+                    self._fuzzy_index.add(product)
+                if self._bm25_index is not None:
+                    self._bm25_index.add(product)
+
+            self.products = self._patched_list(self.products, changed, removed)
+            for category_id in touched_categories:
+                category_products = self._patched_list(
+                    self.products_by_category.get(category_id, []), changed, removed,
+                    keep=lambda p, category_id=category_id: p.get('category_id') == category_id
+                )
+                if category_products:
+                    self.products_by_category[category_id] = category_products
+                else:
+                    self.products_by_category.pop(category_id, None)
+
+                # Rankings in the category may have moved; they are refilled on next use
+                for p in category_products:
+                    self.alternatives_table.pop(p.get('id'), None)
+            for product_id in removed:
+                self.alternatives_table.pop(product_id, None)
+
+    @staticmethod
+    def _patched_list(products: List[Dict], changed: Dict[Any, Dict], removed: set,
+                      keep: Callable[[Dict], bool] = None) -> List[Dict]:
+        """Copy a product list with changed products replaced or appended and removed ones dropped"""
+        keep = keep or (lambda p: True)
+        patched = []
+        seen = set()
+        for p in products:
+            product_id = p.get('id')
+            if product_id in removed:
+                continue
+            if product_id in changed:
+                seen.add(product_id)
+                p = changed[product_id]
+            if keep(p):
+                patched.append(p)
+        patched.extend(p for product_id, p in changed.items() if product_id not in seen and keep(p))
+        return patched
+
+    def find_products(self, query: str, limit: int = 5, match_mode: str = None,
+                      rank_mode: str = None) -> List[ProductMatch]:
+        """Find products matching a query with fuzzy matching (the mode arguments override the matcher's modes)"""
+        with self._lock:
+            return self._find_products(query, limit, match_mode, rank_mode)
+
+    def _find_products(self, query: str, limit: int, match_mode: Optional[str],
+                       rank_mode: Optional[str]) -> List[ProductMatch]:
+        """Search the indexes (caller holds the lock)"""
         query_lower = query.lower()
         matches = []
 
-        # Correct potential typos in query
+        # Correct potential typos in query: known typos first, then catalog vocabulary
         corrected_words = []
         for word in query_lower.split():
             corrected = FuzzyMatcher.correct_word(word)
+            if corrected == word:
+                corrected = self.speller.correct(word)
             corrected_words.append(corrected)
         corrected_query = ' '.join(corrected_words)
 
-        for product in self.products:
-            name = product.get('name', '').lower()
-            description = product.get('description', '').lower()
+        # An empty query is a substring of every name
+        if not corrected_words:
+            return [ProductMatch(p, 1.0, 'exact') for p in self.products[:limit]]
+
+        if (rank_mode or self.rank_mode) == 'bm25' and NUMPY_AVAILABLE:
+            return self._rank_bm25(corrected_words, limit)
+
+        # Only score products sharing vocabulary with the query
+        candidate_ids = self.index.candidates(corrected_words, min_ratio=self.FUZZY_MIN_RATIO)
+
+        # In trigram mode only the closest names get a SequenceMatcher pass
+        shortlist = None
+        if (match_mode or self.match_mode) == 'trigram':
+            shortlist = {pid for pid, _ in self.fuzzy_index.top_matches(
+                corrected_query, self.FUZZY_SHORTLIST_SIZE,
+                min_score=self.FUZZY_MIN_DICE, among=candidate_ids
+            )}
+
+        # Matches scoring 1.0 can't be outranked by later candidates (ties keep catalog order),
+        # so the search stops once there are `limit` of them
+        perfect = 0
+        query_chars = Counter(corrected_query)
+        for product_id in self.index.in_catalog_order(candidate_ids):
+            if limit > 0 and perfect >= limit:
+                break
+            product = self.products_by_id[product_id]
+            name = self.index.names[product_id]
+            description = self.index.descriptions[product_id]
 
             # Check exact match in name
             if corrected_query in name:
                 matches.append(ProductMatch(product, 1.0, 'exact'))
+                perfect += 1
                 continue
 
-            # Check fuzzy match on name
-            is_match, score = FuzzyMatcher.fuzzy_match(corrected_query, name)
+            # Check fuzzy match on name; the ratio is at most 2*shared/total (shared
+            # characters, at most the shorter length), so names that can't reach
+            # the threshold skip SequenceMatcher
+            total = len(corrected_query) + len(name)
+            use_ratio = (shortlist is None or product_id in shortlist) and (
+                2.0 * min(len(corrected_query), len(name)) / total >= self.FUZZY_MIN_RATIO
+            ) and (
+                2.0 * sum((query_chars & Counter(name)).values()) / total >= self.FUZZY_MIN_RATIO
+            )
+            is_match, score = FuzzyMatcher.fuzzy_match(
+                corrected_query, name, threshold=self.FUZZY_MIN_RATIO, use_ratio=use_ratio
+            )
             if is_match and score >= 0.6:
                 matches.append(ProductMatch(product, score, 'fuzzy'))
+                perfect += score >= 1.0
                 continue
 
             # Check keyword match
@@ -209,6 +567,108 @@ class SmartProductMatcher:
 
         return unique_matches[:limit]
 
+    def _rank_bm25(self, words: List[str], limit: int) -> List[ProductMatch]:
+        """Rank the whole catalog by BM25 relevance to the query words"""
+        terms = {}
+        for word in words:
+            tokens = self.index.tokens_containing(word) if len(word) >= 3 else {word}
+            for token in tokens:
+                weight = 1.0 if token == word else self.BM25_PARTIAL_WEIGHT
+                terms[token] = max(terms.get(token, 0.0), weight)
+
+        ranked = self.bm25_index.top_k(terms, limit)
+        if not ranked:
+            return []
+
+        # Scale scores to (0, 1] like the tiered scores
+        best = ranked[0][1]
+        return [ProductMatch(self.products_by_id[pid], score / best, 'bm25') for pid, score in ranked]
+
+    def start_alternatives_build(self):
+        """Fill the alternatives table in a background thread (lookups rank lazily until it is done)"""
+        thread = threading.Thread(target=self._build_alternatives_table, name='alternatives-table', daemon=True)
+        self._alternatives_thread = thread
+        thread.start()
+
+    def wait_for_alternatives(self, timeout: float = None) -> bool:
+        """Wait for the background table build; True once it has finished"""
+        thread = self._alternatives_thread
+        if thread is None:
+            return True
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    def _build_alternatives_table(self):
+        """Rank the nearest same-category products for every product, ignoring stock"""
+        with self._lock:
+            categories = list(self.products_by_category.items())
+
+        for category_id, category_products in categories:
+            if not category_id or len(category_products) > self.ALTERNATIVES_EAGER_LIMIT:
+                continue
+
+            # Ranked without the lock so searches are not held up
+            rankings = {
+                p.get('id'): self._rank_category(p, category_products)
+                for p in category_products if p.get('id') not in self.alternatives_table
+            }
+            with self._lock:
+                # apply_delta replaces the list of a changed category; those rankings may be stale
+                if self.products_by_category.get(category_id) is not category_products:
+                    continue
+                for product_id, ranked in rankings.items():
+                    self.alternatives_table.setdefault(product_id, ranked)
+
+    def _rank_category(self, product: Dict, category_products: List[Dict]) -> List[Any]:
+        """Get IDs of the ALTERNATIVES_TABLE_SIZE most similar products in a category"""
+        product_id = product.get('id')
+        name = (product.get('name') or '').lower()
+
+        # Upper bounds from supplier/price plus the name length ratio, which caps the name similarity
+        candidates = []
+        for position, p in enumerate(category_products):
+            if p.get('id') == product_id:
+                continue
+            other_name = (p.get('name') or '').lower()
+            total = len(name) + len(other_name)
+            length_ratio = 2.0 * min(len(name), len(other_name)) / total if total else 1.0
+            base = self._attribute_similarity(product, p)
+            candidates.append((base + length_ratio * 0.5, position, p, other_name, base))
+        candidates.sort(key=lambda c: (-c[0], c[1]))
+
+        heap = []
+        for bound, position, p, other_name, base in candidates:
+            full = len(heap) == self.ALTERNATIVES_TABLE_SIZE
+            if full and bound < heap[0][0]:
+                break  # No later candidate can beat the weakest kept one
+            matcher = SequenceMatcher(None, name, other_name)
+            if full and base + matcher.quick_ratio() * 0.5 < heap[0][0]:
+                continue
+            # Heap keys prefer higher scores, then earlier catalog position
+            entry = (base + matcher.ratio() * 0.5, -position, p.get('id'))
+            if not full:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+        return [entry[2] for entry in sorted(heap, reverse=True)]
+
+    def _ranked_alternatives(self, product: Dict) -> Optional[List[Any]]:
+        """Get the precomputed alternatives of a catalog product (filled on first use for large categories)"""
+        product_id = product.get('id')
+        ranked = self.alternatives_table.get(product_id)
+        if ranked is not None:
+            return ranked
+
+        with self._lock:
+            catalog_product = self.products_by_id.get(product_id)
+            if catalog_product is None:
+                return None
+
+            category_products = self.products_by_category.get(catalog_product.get('category_id'), [])
+            ranked = self._rank_category(catalog_product, category_products)
+            self.alternatives_table[product_id] = ranked
+        return ranked
+
     def find_alternatives(self, product: Dict, exclude_ids: List[int] = None) -> List[Dict]:
         """Find alternative products in the same category"""
         category_id = product.get('category_id')
@@ -217,13 +677,35 @@ class SmartProductMatcher:
 
         exclude_ids = exclude_ids or []
         exclude_ids.append(product.get('id'))
-
+        excluded = set(exclude_ids)
+
+        # Read the precomputed ranking and apply stock at read time
+        ranked = self._ranked_alternatives(product)
+        if ranked is not None:
+            alternatives = []
+            for product_id in ranked:
+                p = self.products_by_id.get(product_id)
+                if p is None or product_id in excluded or p.get('stock_quantity', 0) <= 0:
+                    continue
+                alternatives.append(p)
+                if len(alternatives) == 5:
+                    return alternatives
+
+            # The table holds every other product of the category unless it was truncated
+            category_size = len(self.products_by_category.get(category_id, []))
+            if category_size - 1 <= len(ranked):
+                return alternatives
+
+        return self._scan_alternatives(product, category_id, excluded)
+
+    def _scan_alternatives(self, product: Dict, category_id: Any, excluded: set) -> List[Dict]:
+        """Score the whole category for alternatives (products outside the table)"""
         category_products = self.products_by_category.get(category_id, [])
 
         # Filter and sort by relevance
         alternatives = []
         for p in category_products:
-            if p.get('id') in exclude_ids:
+            if p.get('id') in excluded:
                 continue
             if p.get('stock_quantity', 0) <= 0:
                 continue
@@ -238,6 +720,16 @@ class SmartProductMatcher:
 
     def _calculate_similarity(self, p1: Dict, p2: Dict) -> float:
         """Calculate similarity between two products"""
+        # Name similarity
+        name_score = FuzzyMatcher.similarity(
+            p1.get('name', ''),
+            p2.get('name', '')
+        )
+        return self._attribute_similarity(p1, p2) + name_score * 0.5
+
+    @staticmethod
+    def _attribute_similarity(p1: Dict, p2: Dict) -> float:
+        """Supplier and price part of the product similarity (up to 0.5)"""
         score = 0.0
 
         # Same supplier bonus
@@ -252,13 +744,6 @@ class SmartProductMatcher:
             if price_diff <= 0.3:
                 score += 0.3 * (1 - price_diff)
 
-        # Name similarity
-        name_score = FuzzyMatcher.similarity(
-            p1.get('name', ''),
-            p2.get('name', '')
-        )
-        score += name_score * 0.5
-
         return score
 
     def can_compare(self, product1: Dict, product2: Dict) -> Tuple[bool, str]:
@@ -494,16 +979,128 @@ class NLPEngine:
         ],
     }
 
-    def __init__(self, products: List[Dict], categories: List[Dict] = None):
+    def __init__(self, products: List[Dict], categories: List[Dict] = None, match_mode: str = 'sequence',
+                 rank_mode: str = 'tiers', memories: SessionBackend = None):
         self.products = products
         self.categories = categories or []
-        self.matcher = SmartProductMatcher(products)
+        self.matcher = SmartProductMatcher(
+            products, match_mode=match_mode, categories=self.categories, rank_mode=rank_mode
+        )
         self.recommender = SmartRecommendations(self.matcher)
-        self.memories: Dict[str, ConversationMemory] = {}
+        self.memories = memories if memories is not None else SessionStore(ConversationMemory)
+        self._intent_matchers = self._compile_intent_patterns(self.INTENT_PATTERNS)
+        # Serializes apply_delta between the catalog poller thread and the CRUD routes
+        self._delta_lock = threading.Lock()
+        # Changes whenever the catalog does; caches of catalog-derived data key on it
+        self.catalog_version = next(_catalog_versions)
+
+    # Bump when the pickled engine layout changes so old snapshots are ignored
+    SNAPSHOT_VERSION = 2
+    SNAPSHOT_MAGIC = b'CKTSNAP1'
+
+    def __getstate__(self) -> Dict:
+        # Conversations are live session data, not part of the catalog state
+        state = self.__dict__.copy()
+        state['memories'] = None
+        del state['_delta_lock']
+        return state
+
+    def __setstate__(self, state: Dict):
+        self.__dict__.update(state)
+        self._delta_lock = threading.Lock()
+        self.memories = SessionStore(ConversationMemory)
+        self.catalog_version = next(_catalog_versions)
+
+    def save_snapshot(self, path: str, watermark: Any = None) -> bool:
+        """
+        Write the built catalog state (products, indexes, alternatives table)
+        to a snapshot file, with the change watermark it is current as of.
+        """
+        payload = {
+            'version': self.SNAPSHOT_VERSION,
+            'watermark': watermark,
+            'match_mode': self.matcher.match_mode,
+            'rank_mode': self.matcher.rank_mode,
+            'engine': self,
+        }
+        tmp_path = f"{path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with self.matcher._lock:
+                data = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+            with open(tmp_path, 'wb') as f:
+                f.write(self.SNAPSHOT_MAGIC)
+                f.write(data)
+            os.replace(tmp_path, path)
+            return True
+        except Exception as e:
+            print(f"Error saving catalog snapshot: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+
+    @classmethod
+    def load_snapshot(cls, path: str, match_mode: str = 'sequence',
+                      rank_mode: str = 'tiers') -> Optional[Tuple['NLPEngine', Any]]:
+        """
+        Restore an engine and its watermark from a snapshot file (memory-mapped).
+        Returns None if the file is missing, from another version or built
+        with different matcher modes.
+        """
+        if not path or not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if data[:len(cls.SNAPSHOT_MAGIC)] != cls.SNAPSHOT_MAGIC:
+                    print(f"Ignoring catalog snapshot {path}: not a snapshot file")
+                    return None
+                # The snapshot is one large object graph; collection passes mid-load only cost time
+                gc_enabled = gc.isenabled()
+                gc.disable()
+                try:
+                    with memoryview(data) as view, view[len(cls.SNAPSHOT_MAGIC):] as body:
+                        payload = pickle.loads(body)
+                finally:
+                    if gc_enabled:
+                        gc.enable()
+        except Exception as e:
+            print(f"Error loading catalog snapshot: {e}")
+            return None
+
+        if payload.get('version') != cls.SNAPSHOT_VERSION:
+            print(f"Ignoring catalog snapshot {path}: version {payload.get('version')}")
+            return None
+        if payload.get('match_mode') != match_mode or payload.get('rank_mode') != rank_mode:
+            print(f"Ignoring catalog snapshot {path}: built for other matcher modes")
+            return None
+
+        return payload['engine'], payload.get('watermark')
 
     def set_categories(self, categories: List[Dict]):
         """Set categories list for fallback suggestions"""
         self.categories = categories
+        self.matcher.set_categories(categories)
+        self.catalog_version = next(_catalog_versions)
+
+    def apply_delta(self, upserts: List[Dict] = None, deletes: List[Any] = None):
+        """Patch the catalog with changed and removed products, keeping conversation memories"""
+        # Only apply_delta changes the category lists, so the counts before and after are
+        # consistent while it runs alone
+        with self._delta_lock:
+            before = {cat_id: len(prods) for cat_id, prods in self.matcher.products_by_category.items()}
+            self.matcher.apply_delta(upserts, deletes)
+            self.products = self.matcher.products
+            self.catalog_version = next(_catalog_versions)
+
+            # Keep category product counts in step with the catalog
+            for cat in self.categories:
+                cat_id = cat.get('id')
+                delta = len(self.matcher.products_by_category.get(cat_id, [])) - before.get(cat_id, 0)
+                if delta and 'product_count' in cat:
+                    cat['product_count'] = max(0, (cat.get('product_count') or 0) + delta)
 
     def _handle_categories_list(self) -> Dict:
         """Handle request to show all categories"""
@@ -535,9 +1132,9 @@ class NLPEngine:
 
     def get_memory(self, user_id: str) -> ConversationMemory:
         """Get or create conversation memory for a user"""
-        if user_id not in self.memories:
-            self.memories[user_id] = ConversationMemory()
-        return self.memories[user_id]
+        memory = self.memories.get(user_id)
+        memory.catalog = self.matcher.products_by_id
+        return memory
 
     def process(self, message: str, user_id: str) -> Dict[str, Any]:
         """Process a message and return response"""
@@ -565,15 +1162,28 @@ class NLPEngine:
             if result['products']:
                 memory.current_product = result['products'][0]
 
+        self.save_memory(user_id, memory)
+
         return result
 
+    @staticmethod
+    def _compile_intent_patterns(intent_patterns: Dict[str, List[str]]) -> Tuple[Tuple[str, Any], ...]:
+        """
+        Compile the intent pattern table into an ordered tuple of (intent, regex).
+        Order is the detection priority: the first pattern that matches wins.
+        """
+        return tuple(
+            (intent, re.compile(pattern, re.IGNORECASE))
+            for intent, patterns in intent_patterns.items()
+            for pattern in patterns
+        )
+
     def _detect_intent(self, message: str) -> Tuple[str, Dict]:
         """Detect intent from message"""
-        for intent, patterns in self.INTENT_PATTERNS.items():
-            for pattern in patterns:
-                match = re.search(pattern, message, re.IGNORECASE)
-                if match:
-                    return intent, {'groups': match.groups(), 'match': match}
+        for intent, regex in self._intent_matchers:
+            match = regex.search(message)
+            if match:
+                return intent, {'groups': match.groups(), 'match': match}
 
         # Default to product search if contains product-like words
         if any(word in message for word in ['nail', 'screw', 'cement', 'brick', 'wood', 'paint', 'tile']):
@@ -1325,12 +1935,15 @@ What are you looking for?""",
             'products': category_products
         }
 
+    def save_memory(self, user_id: str, memory: ConversationMemory):
+        """Write a user's memory back to the session backend"""
+        self.memories.save(user_id, memory)
+
     def clear_memory(self, user_id: str):
         """Clear conversation memory for a user"""
-        if user_id in self.memories:
-            del self.memories[user_id]
+        self.memories.pop(user_id)
 
     def get_conversation_history(self, user_id: str) -> List[Dict]:
         """Get full conversation history"""
         memory = self.get_memory(user_id)
-        return memory.messages
+        return memory.get_messages()
@@ -3,41 +3,149 @@ Context-aware NLP processor for the construction materials chatbot.
 Understands conversation context and handles contextual questions.
 """
 import json
+import os
 import re
+import threading
 import time
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Dict, List, Optional, Set, Tuple, Any
 
 from src.conversation_state import get_state_manager, ConversationState
 from src.intents.store_info import handle_store_info, is_store_info_query
+from src.search_index import ProductIndex
 from utils.database import DatabaseConnector
 
+# Seconds a product snapshot is fresh; after that it is still served while a refresh runs in the background
+PRODUCT_CACHE_TTL = float(os.getenv('PRODUCT_CACHE_TTL', 300))
+# Hard bound on snapshot age: older snapshots are refreshed before the request is answered
+PRODUCT_CACHE_MAX_STALE = float(os.getenv('PRODUCT_CACHE_MAX_STALE', 900))
+# Seconds to wait after a failed refresh before the next background attempt
+PRODUCT_CACHE_RETRY_SECONDS = 30
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and strip punctuation for matching"""
+    text = text.lower()
+    text = re.sub(r'[^\w\s\u0400-\u04FF]', '', text)  # Keep Cyrillic
+    return text
+
 
 class ProductCache:
-    """Simple cache for products to avoid repeated DB queries"""
+    """
+    Simple cache for products to avoid repeated DB queries.
+    On refresh it also builds a ProductIndex over the normalized names and
+    descriptions, so matching a message only looks at products sharing
+    tokens with it instead of normalizing the whole catalog per message.
+
+    Stale-while-revalidate: past the TTL the current snapshot keeps being
+    served while one background thread reloads it. Only a snapshot older
+    than max_stale (or no snapshot at all) makes a request wait, and then
+    concurrent requests share a single reload instead of each querying
+    MySQL.
+    """
 
-    def __init__(self, ttl: int = 300):  # 5 minutes TTL
+    def __init__(self, ttl: float = PRODUCT_CACHE_TTL, max_stale: float = PRODUCT_CACHE_MAX_STALE,
+                 retry_seconds: float = PRODUCT_CACHE_RETRY_SECONDS):
         self.ttl = ttl
-        self._cache: Dict = {}
+        self.max_stale = max(max_stale, ttl)
+        self.retry_seconds = retry_seconds
+        self._cache: Dict = {}  # Replaced as a whole, never mutated, so readers need no lock
         self._last_update: float = 0
+        self._last_failure: float = 0
+        self._refresh_lock = threading.Lock()  # Held by whoever is reloading (singleflight)
+        self._stats = {'refreshes': 0, 'background_refreshes': 0, 'blocking_refreshes': 0, 'failed_refreshes': 0}
 
     def get_products(self, db: DatabaseConnector, force_refresh: bool = False) -> List[Dict]:
         """Get products from cache or database"""
-        current_time = time.time()
-
-        if force_refresh or not self._cache or (current_time - self._last_update > self.ttl):
-            products = db.get_products(limit=200)
-            if products:
-                self._cache = {
-                    'products': products,
-                    'by_id': {p['id']: p for p in products},
-                    'by_name_lower': {p['name'].lower(): p for p in products}
-                }
-                self._last_update = current_time
-                print(f"Product cache updated: {len(products)} products")
+        now = time.time()
+        age = now - self._last_update
+        # Right after a failed reload the old snapshot is served rather than querying again
+        retry_due = now - self._last_failure > self.retry_seconds
+
+        if force_refresh or not self._cache or (age > self.max_stale and retry_due):
+            self._refresh_now(db, force_refresh)
+        elif age > self.ttl and retry_due:
+            self._refresh_in_background(db)
 
         return self._cache.get('products', [])
 
+    def _refresh_now(self, db: DatabaseConnector, force_refresh: bool):
+        """Reload in this request; callers arriving meanwhile wait for the same reload"""
+        requested = time.time()
+        with self._refresh_lock:
+            if max(self._last_update, self._last_failure) >= requested:
+                return  # Another request reloaded (or failed to) while this one waited
+            if not force_refresh and self._cache and time.time() - self._last_update <= self.max_stale:
+                return
+            self._stats['blocking_refreshes'] += 1
+            self._load(db)
+
+    def _refresh_in_background(self, db: DatabaseConnector):
+        """Start a reload thread unless one is already running"""
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self._stats['background_refreshes'] += 1
+                self._load(db)
+            finally:
+                self._refresh_lock.release()
+
+        try:
+            threading.Thread(target=run, name='product-cache-refresh', daemon=True).start()
+        except Exception:
+            self._refresh_lock.release()
+            raise
+
+    def _load(self, db: DatabaseConnector):
+        """
+        Query the catalog and swap in a new snapshot (keeps the old one on failure).
+        Only None is a failed load: an empty list is an empty catalog.
+        """
+        try:
+            products = db.get_all_products()
+        except Exception as e:
+            print(f"Error refreshing product cache: {e}")
+            products = None
+
+        if products is None:
+            self._last_failure = time.time()
+            self._stats['failed_refreshes'] += 1
+            return
+
+        self._cache = {
+            'products': products,
+            'by_id': {p['id']: p for p in products},
+            'by_name_lower': {p['name'].lower(): p for p in products},
+            # Raw lowercased text for keyword search
+            'lower': {p['id']: ((p.get('name') or '').lower(), (p.get('description') or '').lower())
+                      for p in products},
+            'index': ProductIndex([
+                {
+                    'id': p['id'],
+                    'name': normalize_text(p.get('name') or ''),
+                    'description': normalize_text(p.get('description') or ''),
+                }
+                for p in products
+            ]),
+        }
+        self._last_update = time.time()
+        self._stats['refreshes'] += 1
+        print(f"Product cache updated: {len(products)} products")
+
+    def stats(self) -> Dict:
+        """Snapshot age and refresh counters"""
+        stats = dict(self._stats)
+        stats.update({
+            'products': len(self._cache.get('products', [])),
+            'age_seconds': round(time.time() - self._last_update, 1) if self._cache else None,
+            'refreshing': self._refresh_lock.locked(),
+            'ttl': self.ttl,
+            'max_stale': self.max_stale,
+        })
+        return stats
+
     def get_product_by_id(self, product_id: int) -> Optional[Dict]:
         """Get a product by ID from cache"""
         return self._cache.get('by_id', {}).get(product_id)
@@ -48,14 +156,65 @@ class ProductCache:
 
     def find_products_by_keyword(self, keyword: str) -> List[Dict]:
         """Find products matching a keyword"""
+        cache = self._cache
+        if not cache:
+            return []
+
+        index = cache['index']
+        lower = cache['lower']
         keyword_lower = keyword.lower()
-        results = []
-        for product in self._cache.get('products', []):
-            name = product.get('name', '').lower()
-            desc = product.get('description', '').lower()
-            if keyword_lower in name or keyword_lower in desc:
-                results.append(product)
-        return results
+        if keyword_lower and keyword_lower == normalize_text(keyword_lower) and len(keyword_lower.split()) == 1:
+            # A plain word: a product containing it has it inside one of its normalized tokens
+            product_ids = set()
+            for token in index.tokens_containing(keyword_lower):
+                product_ids.update(index.name_postings.get(token, ()))
+                product_ids.update(index.description_postings.get(token, ()))
+            product_ids = index.in_catalog_order(product_ids)
+        else:
+            product_ids = index.in_catalog_order(lower)
+
+        return [
+            cache['by_id'][pid] for pid in product_ids
+            if keyword_lower in lower[pid][0] or keyword_lower in lower[pid][1]
+        ]
+
+    def products_named_in(self, text: str) -> List[Dict]:
+        """Products whose whole normalized name occurs in normalized text, in catalog order"""
+        cache = self._cache
+        if not cache:
+            return []
+
+        # Every token of such a name is a piece of one of the text's words
+        index = cache['index']
+        product_ids = set()
+        for word in set(text.split()):
+            for start in range(len(word)):
+                for end in range(start + 1, len(word) + 1):
+                    product_ids.update(index.name_postings.get(word[start:end], ()))
+
+        return [cache['by_id'][pid] for pid in index.in_catalog_order(product_ids) if index.names[pid] in text]
+
+    def products_containing(self, words: List[str]) -> List[Tuple[Dict, str, str, Set[str]]]:
+        """
+        Products whose normalized name or description contains any of the
+        words, in catalog order, as (product, name, description, name tokens)
+        with the normalized text from the same snapshot.
+        """
+        cache = self._cache
+        if not cache:
+            return []
+
+        index = cache['index']
+        product_ids = set()
+        for word in words:
+            for token in index.tokens_containing(word):
+                product_ids.update(index.name_postings.get(token, ()))
+                product_ids.update(index.description_postings.get(token, ()))
+
+        return [
+            (cache['by_id'][pid], index.names[pid], index.descriptions[pid], index.name_tokens(pid))
+            for pid in index.in_catalog_order(product_ids)
+        ]
 
 
 class ContextualQuestionDetector:
@@ -164,9 +323,7 @@ class MessageProcessor:
 
     def _preprocess_text(self, text: str) -> str:
         """Preprocess text for matching"""
-        text = text.lower()
-        text = re.sub(r'[^\w\s\u0400-\u04FF]', '', text)  # Keep Cyrillic
-        return text
+        return normalize_text(text)
 
     def process(self, message: str, user_id: str) -> Dict[str, Any]:
         """
@@ -315,7 +472,12 @@ class MessageProcessor:
         """Find a product mentioned in the message"""
         message_lower = self._preprocess_text(message)
         message_words = set(message_lower.split())
-        products = self.product_cache.get_products(self.db)
+        self.product_cache.get_products(self.db)
+
+        # Exact name match
+        named = self.product_cache.products_named_in(message_lower)
+        if named:
+            return named[0]
 
         best_match = None
         best_score = 0
@@ -324,15 +486,9 @@ class MessageProcessor:
         key_words = {'nails', 'screws', 'bolts', 'cement', 'bricks', 'blocks', 'hammer', 'tape',
                      'drill', 'paint', 'wood', 'lumber', 'tile', 'pipe', 'wire', 'drywall'}
 
-        for product in products:
-            product_name = self._preprocess_text(product.get('name', ''))
-            product_desc = self._preprocess_text(product.get('description', ''))
-            product_words = set(product_name.split())
-
-            # Exact name match
-            if product_name in message_lower:
-                return product
-
+        # Only products sharing a word with the message can score
+        long_words = [w for w in message_words if len(w) >= 3]
+        for product, product_name, product_desc, product_words in self.product_cache.products_containing(long_words):
             # Check if key product word matches
             for word in message_words:
                 if len(word) >= 3:
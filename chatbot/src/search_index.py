@@ -0,0 +1,619 @@
+"""
+Search indexes for the Construkt chatbot product catalog.
+Built once when the NLP engine loads products, so a chat message only
+scores the products that share vocabulary with the query.
+"""
+import heapq
+import math
+import re
+from collections import Counter
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+def char_ngrams(text: str, n: int = 3) -> Set[str]:
+    """Get the set of character n-grams of a string"""
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class ProductIndex:
+    """
+    Inverted token index over product names and descriptions.
+    Tokens are whitespace-separated words of the lowercased text, so a
+    substring test against a name is the same as a substring test against
+    one of its tokens.
+    """
+
+    # Whole-name fuzzy candidates share this much of the query's trigrams, or of
+    # its bigrams for queries up to SHORT_QUERY_LENGTH (few trigrams to go on)
+    NAME_GRAM_SHARE = 1 / 3
+    SHORT_QUERY_LENGTH = 7
+    # Names up to this length also get bigram postings (the longest a short query can match)
+    SHORT_NAME_LENGTH = 14
+
+    def __init__(self, products: List[Dict] = None):
+        self.name_postings: Dict[str, Set[int]] = {}
+        self.description_postings: Dict[str, Set[int]] = {}
+        self.names: Dict[int, str] = {}  # Lowercased names by product ID
+        self.descriptions: Dict[int, str] = {}  # Lowercased descriptions by product ID
+        self.order: Dict[int, int] = {}  # Catalog position, keeps ranking ties stable
+        self._name_tokens: Dict[int, Set[str]] = {}
+        self._description_tokens: Dict[int, Set[str]] = {}
+        self._vocabulary_grams: Dict[str, Set[str]] = {}  # Trigram -> tokens containing it
+        self._name_ids: Dict[str, Set[int]] = {}  # Distinct lowercased name -> product IDs
+        self._name_grams: Dict[str, Set[str]] = {}  # Trigram (bigram for short names) of ' name ' -> names
+        self._next_position = 0
+
+        for product in products or []:
+            self.add(product)
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def add(self, product: Dict):
+        """Index a product (re-indexes it if already present)"""
+        product_id = product.get('id')
+        position = self.order.get(product_id)
+        if position is not None:
+            self.remove(product_id)
+        else:
+            position = self._next_position
+            self._next_position += 1
+
+        name = (product.get('name') or '').lower()
+        description = (product.get('description') or '').lower()
+        name_tokens = set(name.split())
+        description_tokens = set(description.split())
+
+        self.order[product_id] = position
+        self.names[product_id] = name
+        ids = self._name_ids.setdefault(name, set())
+        if not ids:
+            for gram in self._whole_name_grams(name):
+                self._name_grams.setdefault(gram, set()).add(name)
+        ids.add(product_id)
+        self.descriptions[product_id] = description
+        self._name_tokens[product_id] = name_tokens
+        self._description_tokens[product_id] = description_tokens
+
+        for token in name_tokens:
+            self._add_posting(self.name_postings, token, product_id)
+        for token in description_tokens:
+            self._add_posting(self.description_postings, token, product_id)
+
+    def remove(self, product_id: int):
+        """Drop a product from the index"""
+        if product_id not in self.order:
+            return
+
+        for token in self._name_tokens.pop(product_id, ()):
+            self._remove_posting(self.name_postings, token, product_id)
+        for token in self._description_tokens.pop(product_id, ()):
+            self._remove_posting(self.description_postings, token, product_id)
+
+        del self.order[product_id]
+        name = self.names.pop(product_id, '')
+        ids = self._name_ids.get(name)
+        if ids is not None:
+            ids.discard(product_id)
+            if not ids:
+                del self._name_ids[name]
+                for gram in self._whole_name_grams(name):
+                    names = self._name_grams.get(gram)
+                    if names is not None:
+                        names.discard(name)
+                        if not names:
+                            del self._name_grams[gram]
+        self.descriptions.pop(product_id, None)
+
+    def _whole_name_grams(self, name: str) -> Set[str]:
+        """Trigrams of a name padded with spaces, plus its bigrams if it is short"""
+        padded = f' {name} '
+        grams = char_ngrams(padded)
+        if len(name) <= self.SHORT_NAME_LENGTH:
+            grams |= char_ngrams(padded, 2)
+        return grams
+
+    def _add_posting(self, postings: Dict[str, Set[int]], token: str, product_id: int):
+        """Add a product to a token's posting list"""
+        if token not in self.name_postings and token not in self.description_postings:
+            for gram in char_ngrams(token):
+                self._vocabulary_grams.setdefault(gram, set()).add(token)
+        postings.setdefault(token, set()).add(product_id)
+
+    def _remove_posting(self, postings: Dict[str, Set[int]], token: str, product_id: int):
+        """Remove a product from a token's posting list"""
+        ids = postings.get(token)
+        if ids is None:
+            return
+        ids.discard(product_id)
+        if ids:
+            return
+
+        del postings[token]
+        if token in self.name_postings or token in self.description_postings:
+            return
+        for gram in char_ngrams(token):
+            tokens = self._vocabulary_grams.get(gram)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._vocabulary_grams[gram]
+
+    def name_tokens(self, product_id: int) -> Set[str]:
+        """Get the tokens of a product's name"""
+        return self._name_tokens.get(product_id, set())
+
+    def tokens_containing(self, word: str) -> Set[str]:
+        """Get all indexed tokens that contain the word as a substring"""
+        if len(word) < 3:
+            vocabulary = self.name_postings.keys() | self.description_postings.keys()
+            return {t for t in vocabulary if word in t}
+
+        token_sets = []
+        for gram in char_ngrams(word):
+            tokens = self._vocabulary_grams.get(gram)
+            if not tokens:
+                return set()
+            token_sets.append(tokens)
+
+        token_sets.sort(key=len)
+        found = token_sets[0].intersection(*token_sets[1:])
+        return {t for t in found if word in t}
+
+    def tokens_like(self, word: str) -> Set[str]:
+        """Get indexed tokens sharing at least half of the word's trigrams"""
+        grams = char_ngrams(word)
+        shared: Dict[str, int] = {}
+        for gram in grams:
+            for token in self._vocabulary_grams.get(gram, ()):
+                shared[token] = shared.get(token, 0) + 1
+
+        min_shared = max(1, (len(grams) + 1) // 2)
+        return {t for t, count in shared.items() if count >= min_shared}
+
+    def names_within_ratio(self, query: str, min_ratio: float) -> Set[int]:
+        """
+        Get IDs of products whose whole name may reach a SequenceMatcher
+        ratio of min_ratio with the query.
+        Candidates come from the whole-name n-gram postings: names sharing
+        NAME_GRAM_SHARE of the query's trigrams (bigrams for short queries),
+        so the work follows the postings, not the catalog size. A name that
+        only shares scattered characters with the query is not returned.
+        Candidates must also pass two upper bounds on the ratio: the length
+        bound 2*min(len)/total and the shared-character count (like quick_ratio).
+        """
+        query_length = len(query)
+        if not query_length or min_ratio <= 0:
+            return set(self.order)
+
+        shortest = int(query_length * min_ratio / (2 - min_ratio))
+        longest = int(query_length * (2 - min_ratio) / min_ratio) + 1
+        gram_size = 2 if query_length <= self.SHORT_QUERY_LENGTH else 3
+        query_chars = Counter(query)
+        found = set()
+        for name in self._names_sharing_grams(f' {query} ', gram_size):
+            if not shortest <= len(name) <= longest:
+                continue
+            shared = sum(min(count, query_chars[char]) for char, count in Counter(name).items())
+            # Slack so float rounding at the threshold never drops a match
+            if 2.0 * shared / (query_length + len(name)) >= min_ratio - 1e-9:
+                found.update(self._name_ids[name])
+        return found
+
+    def _names_sharing_grams(self, text: str, n: int) -> List[str]:
+        """Get distinct names sharing at least NAME_GRAM_SHARE of the text's n-grams"""
+        grams = char_ngrams(text, n)
+        postings = sorted((self._name_grams.get(gram, set()) for gram in grams), key=len)
+        min_shared = max(1, math.ceil(len(grams) * self.NAME_GRAM_SHARE))
+
+        # Count hits in the shorter posting lists only; the longest ones (common trigrams)
+        # are looked up for the names that can still reach min_shared
+        skipped = min_shared // 2
+        walked, looked_up = postings[:len(postings) - skipped], postings[len(postings) - skipped:]
+        shared = Counter()
+        for names in walked:
+            shared.update(names)
+
+        found = []
+        for name, count in shared.items():
+            if count + skipped < min_shared:
+                continue
+            if count + sum(name in names for names in looked_up) >= min_shared:
+                found.append(name)
+        return found
+
+    def candidates(self, words: List[str], min_ratio: float = 0.7) -> Set[int]:
+        """
+        Get IDs of products that can match a query.
+        Covers every product whose name or description contains a query
+        word, every product whose name tokens appear inside the query, names
+        with tokens spelled close to a query word (typos), and the names
+        names_within_ratio finds for the whole query.
+        """
+        found: Set[int] = self.names_within_ratio(' '.join(words), min_ratio)
+        long_words = [w for w in words if len(w) >= 3]
+
+        for word in long_words or words:
+            for token in self.tokens_containing(word):
+                found.update(self.name_postings.get(token, ()))
+                if word in long_words:
+                    found.update(self.description_postings.get(token, ()))
+
+        for word in long_words:
+            for token in self.tokens_like(word):
+                found.update(self.name_postings.get(token, ()))
+
+        # Names made of pieces of the query ("nails" in "nailsx")
+        for word in words:
+            for start in range(len(word)):
+                for end in range(start + 1, len(word) + 1):
+                    found.update(self.name_postings.get(word[start:end], ()))
+
+        return found
+
+    def in_catalog_order(self, product_ids: Iterable[int]) -> List[int]:
+        """Sort product IDs by their catalog position"""
+        return sorted(product_ids, key=self.order.__getitem__)
+
+
+class TrigramIndex:
+    """
+    Character trigram index over product names.
+    Scores names with the Dice coefficient of their trigram sets, a cheap
+    pre-filter that picks which names are worth a full SequenceMatcher pass.
+    """
+
+    def __init__(self, products: List[Dict] = None):
+        self.postings: Dict[str, Set[int]] = {}
+        self.grams: Dict[int, FrozenSet[str]] = {}
+
+        for product in products or []:
+            self.add(product)
+
+    def add(self, product: Dict):
+        """Index a product name (re-indexes it if already present)"""
+        product_id = product.get('id')
+        self.remove(product_id)
+
+        grams = frozenset(char_ngrams((product.get('name') or '').lower()))
+        self.grams[product_id] = grams
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(product_id)
+
+    def remove(self, product_id: int):
+        """Drop a product from the index"""
+        for gram in self.grams.pop(product_id, ()):
+            ids = self.postings.get(gram)
+            if ids is not None:
+                ids.discard(product_id)
+                if not ids:
+                    del self.postings[gram]
+
+    @staticmethod
+    def dice(grams1: FrozenSet[str], grams2: FrozenSet[str]) -> float:
+        """Dice coefficient of two trigram sets"""
+        total = len(grams1) + len(grams2)
+        if not total:
+            return 0.0
+        return 2 * len(grams1 & grams2) / total
+
+    def top_matches(self, query: str, limit: int, min_score: float = 0.0,
+                    among: Optional[Iterable[int]] = None) -> List[Tuple[int, float]]:
+        """
+        Get the names most similar to the query as (product ID, Dice score).
+        Pass `among` to score only a known candidate set instead of walking
+        the trigram postings.
+        """
+        query_grams = frozenset(char_ngrams(query.lower()))
+        if not query_grams:
+            return []
+
+        if among is None:
+            among = set()
+            for gram in query_grams:
+                among.update(self.postings.get(gram, ()))
+
+        scored = []
+        for product_id in among:
+            grams = self.grams.get(product_id)
+            if grams is None:
+                continue
+            score = self.dice(query_grams, grams)
+            if score >= min_score:
+                scored.append((product_id, score))
+
+        return heapq.nlargest(limit, scored, key=lambda x: x[1])
+
+
+class SpellingCorrector:
+    """
+    Symmetric-delete (SymSpell) spelling corrector over catalog vocabulary.
+    Every vocabulary word is stored under all strings reachable by deleting
+    up to MAX_EDIT_DISTANCE characters, so a lookup only needs the deletes of
+    the input word instead of a scan over the vocabulary.
+    """
+
+    MAX_EDIT_DISTANCE = 2
+    MIN_WORD_LENGTH = 4
+    WORD_PATTERN = re.compile(r'[a-z]+')
+
+    def __init__(self, texts: Iterable[str] = None):
+        self.frequencies: Dict[str, int] = {}
+        self._deletes: Dict[str, Set[str]] = {}
+
+        for text in texts or []:
+            self.add_text(text)
+
+    def __len__(self) -> int:
+        return len(self.frequencies)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.frequencies
+
+    def _words(self, text: str) -> List[str]:
+        """Split text into vocabulary words"""
+        return [w for w in self.WORD_PATTERN.findall((text or '').lower()) if len(w) >= 3]
+
+    def _delete_variants(self, word: str, max_distance: int) -> Set[str]:
+        """Get the word and every string reachable by deleting up to max_distance characters"""
+        variants = {word}
+        frontier = {word}
+        for _ in range(max_distance):
+            next_frontier = set()
+            for item in frontier:
+                if len(item) <= 1:
+                    continue
+                for i in range(len(item)):
+                    next_frontier.add(item[:i] + item[i + 1:])
+            next_frontier -= variants
+            variants |= next_frontier
+            frontier = next_frontier
+        return variants
+
+    def add_text(self, text: str):
+        """Add the words of a product name, description or category name"""
+        for word in self._words(text):
+            count = self.frequencies.get(word, 0)
+            self.frequencies[word] = count + 1
+            if count == 0:
+                for variant in self._delete_variants(word, self.MAX_EDIT_DISTANCE):
+                    self._deletes.setdefault(variant, set()).add(word)
+
+    def remove_text(self, text: str):
+        """Remove the words of a text added earlier"""
+        for word in self._words(text):
+            count = self.frequencies.get(word, 0)
+            if count > 1:
+                self.frequencies[word] = count - 1
+                continue
+            if count == 0:
+                continue
+
+            del self.frequencies[word]
+            for variant in self._delete_variants(word, self.MAX_EDIT_DISTANCE):
+                words = self._deletes.get(variant)
+                if words is not None:
+                    words.discard(word)
+                    if not words:
+                        del self._deletes[variant]
+
+    @staticmethod
+    def edit_distance(s1: str, s2: str, max_distance: int) -> int:
+        """Optimal string alignment distance, or max_distance + 1 if it is larger"""
+        if abs(len(s1) - len(s2)) > max_distance:
+            return max_distance + 1
+
+        previous2 = None
+        previous = list(range(len(s2) + 1))
+        for i in range(1, len(s1) + 1):
+            current = [i] + [0] * len(s2)
+            for j in range(1, len(s2) + 1):
+                cost = 0 if s1[i - 1] == s2[j - 1] else 1
+                current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+                if (previous2 is not None and i > 1 and j > 1
+                        and s1[i - 1] == s2[j - 2] and s1[i - 2] == s2[j - 1]):
+                    current[j] = min(current[j], previous2[j - 2] + 1)
+            if min(current) > max_distance:
+                return max_distance + 1
+            previous2, previous = previous, current
+
+        return previous[-1]
+
+    def correct(self, word: str) -> str:
+        """
+        Get the closest vocabulary word, preferring the smallest edit distance
+        and then the most frequent word. Returns the word unchanged when it is
+        already known, too short, not alphabetic or has no close match.
+        """
+        if len(word) < self.MIN_WORD_LENGTH or not word.isalpha() or word in self.frequencies:
+            return word
+
+        # Short words allow a single edit, long ones up to MAX_EDIT_DISTANCE
+        max_distance = 1 if len(word) < 8 else self.MAX_EDIT_DISTANCE
+
+        candidates: Set[str] = set()
+        for variant in self._delete_variants(word, max_distance):
+            candidates.update(self._deletes.get(variant, ()))
+
+        best = None
+        best_key = None
+        for candidate in candidates:
+            distance = self.edit_distance(word, candidate, max_distance)
+            if distance > max_distance:
+                continue
+            key = (distance, -self.frequencies[candidate], candidate)
+            if best_key is None or key < best_key:
+                best, best_key = candidate, key
+
+        return best or word
+
+
+class BM25Index:
+    """
+    BM25 ranking over product names and descriptions (requires NumPy).
+    Keeps a sparse term matrix as per-term arrays of document slots and
+    field-weighted term frequencies, so a query is scored against the whole
+    catalog with array operations and cut to the top results with argpartition.
+    """
+
+    K1 = 1.2
+    B = 0.75
+    NAME_WEIGHT = 2.0
+    DESCRIPTION_WEIGHT = 1.0
+
+    def __init__(self, products: List[Dict] = None):
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("BM25 ranking requires numpy. Run: pip install numpy")
+
+        self._postings: Dict[str, Tuple[List[int], List[float]]] = {}  # Term -> (slots, weighted tf)
+        self._arrays: Dict[str, Tuple['np.ndarray', 'np.ndarray']] = {}  # Cached NumPy postings
+        self._df: Dict[str, int] = {}  # Live documents per term
+        self._slot_terms: Dict[int, List[str]] = {}
+        self._slots: Dict[int, int] = {}  # Product ID -> live slot
+        self._product_ids: List[int] = []  # Slot -> product ID
+        self._lengths = np.zeros(64, dtype=np.float32)
+        self._alive = np.zeros(64, dtype=bool)
+        self._total_length = 0.0
+
+        for product in products or []:
+            self.add(product)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _tokens(self, product: Dict) -> Tuple[Counter, float]:
+        """Get field-weighted term frequencies and document length of a product"""
+        name_tokens = (product.get('name') or '').lower().split()
+        description_tokens = (product.get('description') or '').lower().split()
+
+        weights = Counter()
+        for token in name_tokens:
+            weights[token] += self.NAME_WEIGHT
+        for token in description_tokens:
+            weights[token] += self.DESCRIPTION_WEIGHT
+
+        length = self.NAME_WEIGHT * len(name_tokens) + self.DESCRIPTION_WEIGHT * len(description_tokens)
+        return weights, length
+
+    def add(self, product: Dict):
+        """Index a product in a new slot (replacing its old slot if present)"""
+        product_id = product.get('id')
+        self.remove(product_id)
+
+        slot = len(self._product_ids)
+        if slot >= len(self._lengths):
+            self._lengths = np.concatenate([self._lengths, np.zeros_like(self._lengths)])
+            self._alive = np.concatenate([self._alive, np.zeros_like(self._alive)])
+
+        weights, length = self._tokens(product)
+        self._product_ids.append(product_id)
+        self._slots[product_id] = slot
+        self._slot_terms[slot] = list(weights)
+        self._lengths[slot] = length
+        self._alive[slot] = True
+        self._total_length += length
+
+        for term, weight in weights.items():
+            slots, tfs = self._postings.setdefault(term, ([], []))
+            slots.append(slot)
+            tfs.append(weight)
+            self._df[term] = self._df.get(term, 0) + 1
+            self._arrays.pop(term, None)
+
+    def remove(self, product_id: int):
+        """Retire a product's slot (compacting once half the slots are dead)"""
+        slot = self._slots.pop(product_id, None)
+        if slot is None:
+            return
+
+        self._alive[slot] = False
+        self._total_length -= float(self._lengths[slot])
+        for term in self._slot_terms.pop(slot, ()):
+            self._df[term] -= 1
+
+        if len(self._product_ids) > 64 and len(self._slots) < len(self._product_ids) // 2:
+            self._compact()
+
+    def _compact(self):
+        """Drop dead slots and renumber the live ones"""
+        remap = {}
+        for old_slot in range(len(self._product_ids)):
+            if self._alive[old_slot]:
+                remap[old_slot] = len(remap)
+
+        live = np.flatnonzero(self._alive[:len(self._product_ids)])
+        self._lengths = np.concatenate([self._lengths[live], np.zeros(max(64, len(live)), dtype=np.float32)])
+        self._alive = np.concatenate([np.ones(len(live), dtype=bool), np.zeros(max(64, len(live)), dtype=bool)])
+        self._product_ids = [self._product_ids[s] for s in live]
+        self._slots = {product_id: slot for slot, product_id in enumerate(self._product_ids)}
+        self._slot_terms = {remap[s]: terms for s, terms in self._slot_terms.items()}
+
+        postings = {}
+        for term, (slots, tfs) in self._postings.items():
+            kept = [(remap[s], tf) for s, tf in zip(slots, tfs) if s in remap]
+            if kept:
+                postings[term] = ([s for s, _ in kept], [tf for _, tf in kept])
+            else:
+                self._df.pop(term, None)
+        self._postings = postings
+        self._arrays = {}
+
+    def _term_arrays(self, term: str):
+        """Get a term's postings as NumPy arrays"""
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            slots, tfs = self._postings[term]
+            arrays = (np.asarray(slots, dtype=np.int64), np.asarray(tfs, dtype=np.float32))
+            self._arrays[term] = arrays
+        return arrays
+
+    def top_k(self, terms: Dict[str, float], limit: int) -> List[Tuple[int, float]]:
+        """
+        Score the catalog against weighted query terms.
+        Returns up to `limit` (product ID, score) pairs, best first.
+        """
+        doc_count = len(self._slots)
+        if not doc_count or limit <= 0:
+            return []
+
+        size = len(self._product_ids)
+        avg_length = self._total_length / doc_count if self._total_length > 0 else 1.0
+        lengths = self._lengths[:size]
+
+        slot_parts = []
+        score_parts = []
+        for term, weight in terms.items():
+            df = self._df.get(term, 0)
+            if df <= 0:
+                continue
+            slots, tfs = self._term_arrays(term)
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            norm = self.K1 * (1 - self.B + self.B * lengths[slots] / avg_length)
+            slot_parts.append(slots)
+            score_parts.append(weight * idf * tfs * (self.K1 + 1) / (tfs + norm))
+
+        if not slot_parts:
+            return []
+
+        scores = np.bincount(
+            np.concatenate(slot_parts),
+            weights=np.concatenate(score_parts),
+            minlength=size
+        )
+        scores[~self._alive[:size]] = 0.0
+
+        matched = int(np.count_nonzero(scores > 0))
+        k = min(limit, matched)
+        if k == 0:
+            return []
+
+        top = np.argpartition(-scores, k - 1)[:k]
+        # Best score first, earlier slot first on ties
+        top = top[np.lexsort((top, -scores[top]))]
+        return [(self._product_ids[s], float(scores[s])) for s in top]
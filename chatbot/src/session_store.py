@@ -0,0 +1,532 @@
+"""
+Session backends for per-user conversation memories.
+- SessionStore keeps memories in process, evicting least-recently-used
+  sessions once full and dropping idle ones after a timeout. Sessions
+  evicted for room can be spilled to a secondary mapping (e.g. a shelve
+  file) and restored later; spilled sessions also expire after the timeout.
+- SQLiteSessionStore keeps them in a SQLite file shared by workers on a host.
+- KVSessionStore keeps them in a Redis-protocol key-value server.
+The shared backends store sessions in a compact, versioned encoding. A
+sweeper thread (start_sweeper) drops idle sessions between requests.
+"""
+import json
+import socket
+import sqlite3
+import time
+import zlib
+from collections import OrderedDict
+from threading import Event, Lock, Thread
+from typing import Any, Dict, Iterator, MutableMapping, Optional
+from urllib.parse import urlparse
+
+
+# Bump when the encoded session layout changes; older layouts are read as new sessions
+SESSION_FORMAT_VERSION = 1
+
+
+def encode_session(memory: Any) -> bytes:
+    """Encode a memory as a version byte followed by zlib-compressed JSON"""
+    payload = json.dumps(memory.to_dict(), separators=(',', ':'), ensure_ascii=False, default=str)
+    return bytes([SESSION_FORMAT_VERSION]) + zlib.compress(payload.encode('utf-8'))
+
+
+def decode_session(data: bytes, memory_class: Any) -> Optional[Any]:
+    """Decode a memory made by encode_session (None for unknown versions or damaged data)"""
+    if not data or data[0] != SESSION_FORMAT_VERSION:
+        return None
+    try:
+        return memory_class.from_dict(json.loads(zlib.decompress(data[1:]).decode('utf-8')))
+    except (ValueError, zlib.error) as e:
+        print(f"Error decoding session: {e}")
+        return None
+
+
+class SessionBackend:
+    """Interface of the stores NLPEngine keeps conversation memories in"""
+
+    def __init__(self, memory_class: Any, idle_ttl: float = 3600, max_messages: int = 200,
+                 max_bytes: int = 256 * 1024):
+        self.memory_class = memory_class
+        self.idle_ttl = idle_ttl  # Seconds; 0 keeps idle sessions
+        self.max_messages = max_messages  # Per session; 0 is unlimited
+        self.max_bytes = max_bytes  # Per session; 0 is unlimited
+        self._sweeper: Optional[Thread] = None
+        self._sweeper_stop = Event()
+
+    def get(self, user_id: str) -> Any:
+        """Get a user's memory, creating it if needed"""
+        raise NotImplementedError
+
+    def save(self, user_id: str, memory: Any):
+        """Store a user's memory after it changed"""
+        raise NotImplementedError
+
+    def pop(self, user_id: str) -> Optional[Any]:
+        """Drop a user's memory"""
+        raise NotImplementedError
+
+    def evict_idle(self):
+        """Drop sessions idle for longer than idle_ttl"""
+
+    def start_sweeper(self, interval: float) -> 'SessionBackend':
+        """Call evict_idle every `interval` seconds from a daemon thread (0 disables)"""
+        if interval > 0 and self.idle_ttl and self._sweeper is None:
+            self._sweeper = Thread(
+                target=self._sweep_loop, args=(interval,), name='session-sweeper', daemon=True
+            )
+            self._sweeper.start()
+        return self
+
+    def stop_sweeper(self):
+        """Stop the sweeper thread"""
+        self._sweeper_stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join(timeout=5)
+            self._sweeper = None
+
+    def _sweep_loop(self, interval: float):
+        while not self._sweeper_stop.wait(interval):
+            try:
+                self.evict_idle()
+            except Exception as e:
+                print(f"Error sweeping idle sessions: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Backend counters for health output"""
+        return {}
+
+    def close(self):
+        """Release the backend's resources"""
+        self.stop_sweeper()
+
+    def _new_memory(self) -> Any:
+        """Create an empty memory"""
+        return self.memory_class()
+
+
+class SessionStore(SessionBackend):
+    """In-process LRU + idle-TTL store of conversation memories keyed by user ID"""
+
+    def __init__(self, memory_class: Any, max_sessions: int = 10000, idle_ttl: float = 3600,
+                 max_messages: int = 200, max_bytes: int = 256 * 1024,
+                 spill: Optional[MutableMapping] = None):
+        super().__init__(memory_class, idle_ttl, max_messages, max_bytes)
+        self.max_sessions = max_sessions
+        self.spill = spill
+
+        self._sessions: 'OrderedDict[str, Any]' = OrderedDict()  # Least recently used first
+        self._last_access: Dict[str, float] = {}
+        # Last access of each spilled session (spill entries are (last_access, memory));
+        # filled from the spill itself on the first sweep
+        self._spilled_at: Dict[str, float] = {}
+        self._spill_indexed = False
+        self._lock = Lock()
+        self._counters = {
+            'created': 0,
+            'evicted_lru': 0,
+            'evicted_idle': 0,
+            'spilled': 0,
+            'restored': 0,
+            'spill_expired': 0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._sessions
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._sessions))
+
+    def __getitem__(self, user_id: str) -> Any:
+        return self.get(user_id)
+
+    def __delitem__(self, user_id: str):
+        self.pop(user_id)
+
+    def get(self, user_id: str) -> Any:
+        """Get a user's memory, restoring it from the spill or creating it if needed"""
+        now = time.time()
+        with self._lock:
+            memory = self._sessions.get(user_id)
+            if memory is not None:
+                self._sessions.move_to_end(user_id)
+                self._last_access[user_id] = now
+                return memory
+
+            self._evict_idle(now)
+
+            memory = self._restore(user_id, now)
+            if memory is None:
+                memory = self._new_memory()
+                self._counters['created'] += 1
+            memory.set_limits(self.max_messages, self.max_bytes)
+
+            self._sessions[user_id] = memory
+            self._last_access[user_id] = now
+            while len(self._sessions) > self.max_sessions:
+                oldest = next(iter(self._sessions))
+                self._evict(oldest, spill=True)
+                self._counters['evicted_lru'] += 1
+            return memory
+
+    def save(self, user_id: str, memory: Any):
+        """Memories are changed in place, so there is nothing to write"""
+
+    def pop(self, user_id: str) -> Optional[Any]:
+        """Drop a user's memory, including any spilled copy"""
+        with self._lock:
+            memory = self._sessions.pop(user_id, None)
+            self._last_access.pop(user_id, None)
+            if self.spill is not None:
+                self._spilled_at.pop(user_id, None)
+                try:
+                    self.spill.pop(user_id, None)
+                except Exception as e:
+                    print(f"Error removing spilled session: {e}")
+            return memory
+
+    def evict_idle(self):
+        """Drop sessions, in memory or spilled, idle for longer than idle_ttl (run by the sweeper)"""
+        with self._lock:
+            now = time.time()
+            self._evict_idle(now)
+            self._expire_spill(now)
+
+    def _evict_idle(self, now: float):
+        """Drop idle sessions from the least recently used end (caller holds the lock)"""
+        if not self.idle_ttl:
+            return
+        while self._sessions:
+            user_id = next(iter(self._sessions))
+            if now - self._last_access[user_id] <= self.idle_ttl:
+                break
+            # Idle sessions are over, not spilled: the spill only holds sessions evicted for room
+            self._evict(user_id, spill=False)
+            self._counters['evicted_idle'] += 1
+
+    def _evict(self, user_id: str, spill: bool):
+        """Remove a session from memory, spilling it if asked and a secondary store is set"""
+        memory = self._sessions.pop(user_id)
+        last_access = self._last_access.pop(user_id, time.time())
+        if not spill or self.spill is None:
+            return
+        try:
+            self.spill[user_id] = (last_access, memory)
+            self._spilled_at[user_id] = last_access
+            self._counters['spilled'] += 1
+        except Exception as e:
+            print(f"Error spilling session: {e}")
+
+    def _restore(self, user_id: str, now: float) -> Optional[Any]:
+        """Take a session back from the spill (None if it is not there or went idle there)"""
+        if self.spill is None:
+            return None
+        self._spilled_at.pop(user_id, None)
+        try:
+            entry = self.spill.pop(user_id, None)
+        except Exception as e:
+            print(f"Error restoring spilled session: {e}")
+            return None
+        if entry is None:
+            return None
+
+        last_access, memory = entry if isinstance(entry, tuple) else (now, entry)
+        if self.idle_ttl and now - last_access > self.idle_ttl:
+            self._counters['spill_expired'] += 1
+            return None
+        self._counters['restored'] += 1
+        return memory
+
+    def _expire_spill(self, now: float):
+        """Delete spilled sessions idle for longer than idle_ttl (caller holds the lock)"""
+        if self.spill is None or not self.idle_ttl:
+            return
+        try:
+            if not self._spill_indexed:
+                # Sessions spilled before this process started; entries without a time start now
+                for user_id in list(self.spill.keys()):
+                    entry = self.spill.get(user_id)
+                    self._spilled_at[user_id] = entry[0] if isinstance(entry, tuple) else now
+                self._spill_indexed = True
+
+            expired = [user_id for user_id, at in self._spilled_at.items() if now - at > self.idle_ttl]
+            for user_id in expired:
+                del self._spilled_at[user_id]
+                self.spill.pop(user_id, None)
+            self._counters['spill_expired'] += len(expired)
+        except Exception as e:
+            print(f"Error expiring spilled sessions: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for live sessions, evictions and bytes held"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['live_sessions'] = len(self._sessions)
+            stats['spilled_sessions'] = len(self._spilled_at)
+            stats['bytes_held'] = sum(m.size_bytes for m in self._sessions.values())
+        stats['evictions'] = stats['evicted_lru'] + stats['evicted_idle']
+        return stats
+
+    def close(self):
+        """Stop the sweeper and close the spill store if it supports closing"""
+        self.stop_sweeper()
+        close = getattr(self.spill, 'close', None)
+        if close is not None:
+            close()
+
+
+class SQLiteSessionStore(SessionBackend):
+    """Sessions in a SQLite file, shared by the worker processes of one host"""
+
+    def __init__(self, memory_class: Any, path: str, idle_ttl: float = 3600, max_messages: int = 200,
+                 max_bytes: int = 256 * 1024):
+        super().__init__(memory_class, idle_ttl, max_messages, max_bytes)
+        self.path = path
+        self._lock = Lock()
+        self._counters = {'created': 0, 'loaded': 0, 'saved': 0, 'evicted_idle': 0}
+
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                user_id TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions (updated_at)")
+
+    def get(self, user_id: str) -> Any:
+        """Load a user's memory, creating it if missing or idle past the TTL (the idle row is deleted)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, updated_at FROM sessions WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            if row and self.idle_ttl and time.time() - row[1] > self.idle_ttl:
+                # Only if no other worker saved the session since it was read
+                cursor = self._conn.execute(
+                    "DELETE FROM sessions WHERE user_id = ? AND updated_at = ?", (user_id, row[1])
+                )
+                self._counters['evicted_idle'] += cursor.rowcount
+                row = None
+
+        memory = None
+        if row:
+            memory = decode_session(row[0], self.memory_class)
+        if memory is None:
+            memory = self._new_memory()
+            self._counters['created'] += 1
+        else:
+            self._counters['loaded'] += 1
+        memory.set_limits(self.max_messages, self.max_bytes)
+        return memory
+
+    def save(self, user_id: str, memory: Any):
+        """Write a user's memory"""
+        data = encode_session(memory)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (user_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (user_id, data, time.time())
+            )
+        self._counters['saved'] += 1
+
+    def pop(self, user_id: str) -> Optional[Any]:
+        """Delete a user's memory"""
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+        return None
+
+    def evict_idle(self):
+        """Delete sessions idle for longer than idle_ttl (run by the sweeper)"""
+        if not self.idle_ttl:
+            return
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.idle_ttl,)
+            )
+            self._counters['evicted_idle'] += cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters plus the sessions and bytes held in the file"""
+        with self._lock:
+            count, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM sessions"
+            ).fetchone()
+        stats = dict(self._counters)
+        stats['live_sessions'] = count
+        stats['bytes_held'] = size
+        return stats
+
+    def close(self):
+        """Stop the sweeper and close the database file"""
+        self.stop_sweeper()
+        with self._lock:
+            self._conn.close()
+
+
+class RespClient:
+    """Minimal client for Redis-protocol (RESP) key-value servers"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 6379, db: int = 0, password: str = None,
+                 timeout: float = 2.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._sock = None
+        self._reader = None
+        self._lock = Lock()
+
+    @classmethod
+    def from_url(cls, url: str, timeout: float = 2.0) -> 'RespClient':
+        """Create a client from a redis://[:password@]host:port/db URL"""
+        parsed = urlparse(url)
+        db = parsed.path.strip('/')
+        return cls(parsed.hostname or '127.0.0.1', parsed.port or 6379, int(db) if db else 0,
+                   parsed.password, timeout)
+
+    def _connect(self):
+        """Open the socket and select the database"""
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._sock.makefile('rb')
+        if self.password:
+            self._call('AUTH', self.password)
+        if self.db:
+            self._call('SELECT', self.db)
+
+    def _disconnect(self):
+        """Drop the socket after an error"""
+        try:
+            if self._sock is not None:
+                self._sock.close()
+        except OSError:
+            pass
+        self._sock = None
+        self._reader = None
+
+    def execute(self, *args) -> Any:
+        """Run a command, reconnecting once if the connection was lost"""
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._call(*args)
+                except (OSError, ConnectionError):
+                    self._disconnect()
+                    if attempt:
+                        raise
+
+    def _call(self, *args) -> Any:
+        """Send one command and read its reply"""
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if isinstance(arg, str):
+                arg = arg.encode('utf-8')
+            elif not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        self._sock.sendall(b''.join(parts))
+        return self._read_reply()
+
+    def _read_reply(self) -> Any:
+        """Parse one RESP reply"""
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode('utf-8')
+        if kind == b'-':
+            raise RuntimeError(rest.decode('utf-8'))
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            count = int(rest)
+            return None if count < 0 else [self._read_reply() for _ in range(count)]
+        raise ConnectionError(f"Unexpected reply: {line!r}")
+
+    def close(self):
+        """Close the connection"""
+        with self._lock:
+            self._disconnect()
+
+
+class KVSessionStore(SessionBackend):
+    """Sessions in a networked Redis-protocol key-value server, shared by all nodes"""
+
+    KEY_PREFIX = 'chatbot:session:'
+
+    def __init__(self, memory_class: Any, client: RespClient, idle_ttl: float = 3600,
+                 max_messages: int = 200, max_bytes: int = 256 * 1024):
+        super().__init__(memory_class, idle_ttl, max_messages, max_bytes)
+        self.client = client
+        self._counters = {'created': 0, 'loaded': 0, 'saved': 0, 'errors': 0}
+
+    def _key(self, user_id: str) -> str:
+        return self.KEY_PREFIX + user_id
+
+    def get(self, user_id: str) -> Any:
+        """Load a user's memory (a fresh one if missing or the server is unreachable)"""
+        memory = None
+        try:
+            data = self.client.execute('GET', self._key(user_id))
+            memory = decode_session(data, self.memory_class) if data else None
+        except Exception as e:
+            print(f"Error loading session: {e}")
+            self._counters['errors'] += 1
+
+        if memory is None:
+            memory = self._new_memory()
+            self._counters['created'] += 1
+        else:
+            self._counters['loaded'] += 1
+        memory.set_limits(self.max_messages, self.max_bytes)
+        return memory
+
+    def save(self, user_id: str, memory: Any):
+        """Write a user's memory; the server expires it after idle_ttl"""
+        args = ['SET', self._key(user_id), encode_session(memory)]
+        if self.idle_ttl:
+            args += ['EX', max(1, int(self.idle_ttl))]
+        try:
+            self.client.execute(*args)
+            self._counters['saved'] += 1
+        except Exception as e:
+            print(f"Error saving session: {e}")
+            self._counters['errors'] += 1
+
+    def pop(self, user_id: str) -> Optional[Any]:
+        """Delete a user's memory"""
+        try:
+            self.client.execute('DEL', self._key(user_id))
+        except Exception as e:
+            print(f"Error deleting session: {e}")
+            self._counters['errors'] += 1
+        return None
+
+    def start_sweeper(self, interval: float) -> 'KVSessionStore':
+        """Nothing to sweep: the server expires idle sessions itself (SET ... EX)"""
+        return self
+
+    def stats(self) -> Dict[str, Any]:
+        """Request counters (the server tracks its own key counts)"""
+        return dict(self._counters)
+
+    def close(self):
+        """Close the server connection"""
+        self.stop_sweeper()
+        self.client.close()
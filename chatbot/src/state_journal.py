@@ -0,0 +1,216 @@
+"""
+Append-only journal storage for conversation states.
+Each user has a snapshot file ({user_id}.json, the full state) and a journal
+({user_id}.journal) of numbered deltas written since that snapshot: new
+history messages and changed fields. A save appends one line, so its cost
+follows the size of the change rather than the length of the history. After
+compact_every entries the state is written as a new snapshot and the journal
+is emptied. Loading reads the snapshot and replays the newer journal entries;
+a journal without its snapshot is ignored, since deltas alone are not a state.
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+HISTORY_KEY = 'conversation_history'
+# Snapshot field with the last journal entry it includes
+SEQ_KEY = 'journal_seq'
+
+
+class StateJournal:
+    """Snapshot + delta journal files for conversation state dicts"""
+
+    def __init__(self, storage_dir, encoder=None, compact_every: int = 100, max_history: int = 50):
+        self.storage_dir = str(storage_dir)
+        self.encoder = encoder
+        self.compact_every = compact_every
+        self.max_history = max_history
+        # user_id -> what is on disk: field JSON, last history message, seq, entries since snapshot
+        self._persisted: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._stats = {'appends': 0, 'bytes_appended': 0, 'snapshots': 0, 'replayed_entries': 0, 'bad_lines': 0,
+                       'orphan_journals': 0}
+
+    def snapshot_path(self, user_id: str) -> str:
+        return os.path.join(self.storage_dir, f"{user_id}.json")
+
+    def journal_path(self, user_id: str) -> str:
+        return os.path.join(self.storage_dir, f"{user_id}.journal")
+
+    def save(self, user_id: str, data: Dict) -> str:
+        """
+        Persist a state dict (from ConversationState.to_dict()).
+        Returns 'append', 'snapshot' or 'unchanged'.
+        """
+        persisted = self._persisted.get(user_id)
+        if persisted is None:
+            return self._write_snapshot(user_id, data, 0)
+
+        history = data.get(HISTORY_KEY) or []
+        new_messages = self._new_messages(history, persisted['last_message'])
+        if new_messages is None:
+            # History was replaced or cleared rather than appended to
+            return self._write_snapshot(user_id, data, persisted['seq'])
+
+        fields = self._encode_fields(data)
+        changed = {key: data[key] for key, encoded in fields.items() if persisted['fields'].get(key) != encoded}
+        if not new_messages and not changed:
+            return 'unchanged'
+
+        if persisted['entries'] + 1 >= self.compact_every:
+            return self._write_snapshot(user_id, data, persisted['seq'])
+
+        seq = persisted['seq'] + 1
+        entry = {'seq': seq}
+        if new_messages:
+            entry['add'] = new_messages
+        if changed:
+            entry['set'] = changed
+        line = json.dumps(entry, cls=self.encoder, ensure_ascii=False, separators=(',', ':')) + '\n'
+        with open(self.journal_path(user_id), 'a', encoding='utf-8') as f:
+            f.write(line)
+
+        persisted.update({
+            'seq': seq,
+            'entries': persisted['entries'] + 1,
+            'last_message': history[-1] if history else persisted['last_message'],
+        })
+        persisted['fields'].update((key, fields[key]) for key in changed)
+        with self._lock:
+            self._stats['appends'] += 1
+            self._stats['bytes_appended'] += len(line.encode('utf-8'))
+        return 'append'
+
+    def load(self, user_id: str) -> Optional[Dict]:
+        """Rebuild a state dict from the snapshot and journal (None if there is neither)"""
+        data, entries, seq = self.replay(user_id)
+        if data is None:
+            return None
+        self.track(user_id, data, seq, entries)
+        return data
+
+    def replay(self, user_id: str):
+        """(state dict or None, journal entries applied, last seq) without tracking the user"""
+        try:
+            with open(self.snapshot_path(user_id), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            if os.path.exists(self.journal_path(user_id)):
+                # The snapshot was lost (e.g. deleted on its own); replaying the deltas would
+                # rebuild a state missing everything before them
+                with self._lock:
+                    self._stats['orphan_journals'] += 1
+                print(f"Ignoring journal of {user_id}: no snapshot")
+            return None, 0, 0
+        seq = data.pop(SEQ_KEY, 0) or 0
+
+        applied = 0
+        try:
+            with open(self.journal_path(user_id), 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn last line after a crash
+                        with self._lock:
+                            self._stats['bad_lines'] += 1
+                        continue
+                    if entry.get('seq', 0) <= seq:
+                        continue  # Already in the snapshot (crash between compaction steps)
+                    self._apply(data, entry)
+                    seq = entry['seq']
+                    applied += 1
+        except FileNotFoundError:
+            pass
+
+        if applied:
+            with self._lock:
+                self._stats['replayed_entries'] += applied
+        return data, applied, seq
+
+    def track(self, user_id: str, data: Dict, seq: int = 0, entries: int = 0):
+        """Remember what is on disk for a user so the next save can write only the delta"""
+        history = data.get(HISTORY_KEY) or []
+        self._persisted[user_id] = {
+            'fields': self._encode_fields(data),
+            'last_message': history[-1] if history else None,
+            'seq': seq,
+            'entries': entries,
+        }
+
+    def compact(self, user_id: str, data: Dict):
+        """Write a state dict as a snapshot and empty its journal"""
+        persisted = self._persisted.get(user_id)
+        self._write_snapshot(user_id, data, persisted['seq'] if persisted else 0)
+
+    def forget(self, user_id: str):
+        """Stop tracking a user whose state left memory (the next load re-reads the files)"""
+        self._persisted.pop(user_id, None)
+
+    def remove(self, user_id: str):
+        """Forget a user and delete their files"""
+        self._persisted.pop(user_id, None)
+        for path in (self.snapshot_path(user_id), self.journal_path(user_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def user_ids(self) -> List[str]:
+        """Users with a snapshot or journal on disk"""
+        users = set()
+        for name in os.listdir(self.storage_dir):
+            for suffix in ('.json', '.journal'):
+                if name.endswith(suffix):
+                    users.add(name[:-len(suffix)])
+        return sorted(users)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['tracked_users'] = len(self._persisted)
+        stats['compact_every'] = self.compact_every
+        return stats
+
+    def _write_snapshot(self, user_id: str, data: Dict, seq: int) -> str:
+        snapshot = dict(data)
+        snapshot[SEQ_KEY] = seq
+        path = self.snapshot_path(user_id)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, cls=self.encoder, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        # Entries up to seq are in the snapshot now; a crash before this truncate is harmless
+        try:
+            os.remove(self.journal_path(user_id))
+        except FileNotFoundError:
+            pass
+        self.track(user_id, data, seq, 0)
+        with self._lock:
+            self._stats['snapshots'] += 1
+        return 'snapshot'
+
+    def _apply(self, data: Dict, entry: Dict):
+        if entry.get('add'):
+            history = data.get(HISTORY_KEY) or []
+            history.extend(entry['add'])
+            data[HISTORY_KEY] = history[-self.max_history:]
+        if entry.get('set'):
+            data.update(entry['set'])
+
+    def _encode_fields(self, data: Dict) -> Dict[str, str]:
+        return {
+            key: json.dumps(value, cls=self.encoder, ensure_ascii=False, sort_keys=True)
+            for key, value in data.items() if key != HISTORY_KEY
+        }
+
+    @staticmethod
+    def _new_messages(history: List[Dict], last_message: Optional[Dict]) -> Optional[List[Dict]]:
+        """Messages appended since last_message, or None if the history was not just appended to"""
+        if last_message is None:
+            return list(history)
+        for i in range(len(history) - 1, -1, -1):
+            if history[i] is last_message:
+                return history[i + 1:]
+        return None
@@ -0,0 +1,109 @@
+"""
+Stand-in Gemini API server for trying the chatbot's Gemini fallback locally
+without a real API key or network access. It answers generateContent requests
+with a canned reply after an optional delay, and can fail a share of requests,
+which is useful for checking deadlines and the circuit breaker.
+
+Usage (from the chatbot/ directory):
+    python tools/fake_gemini.py [--port 8765] [--delay 0.2] [--fail-rate 0.0]
+    GEMINI_API_KEY=test GEMINI_BASE_URL=http://127.0.0.1:8765 python app.py
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    """Serves POST /<version>/models/<model>:generateContent"""
+
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            number = server.requests
+
+        if ':generateContent' not in self.path:
+            return self.reply(404, {'error': {'code': 404, 'message': f"Unknown path {self.path}", 'status': 'NOT_FOUND'}})
+
+        if server.delay:
+            time.sleep(server.delay)
+        if server.fail_rate and random.random() < server.fail_rate:
+            return self.reply(503, {'error': {'code': 503, 'message': 'The model is overloaded.', 'status': 'UNAVAILABLE'}})
+
+        try:
+            request = json.loads(body or b'{}')
+            prompt = request['contents'][0]['parts'][0]['text']
+        except (ValueError, KeyError, IndexError):
+            prompt = ''
+        match = re.search(r'Customer (?:says|question): "?([^"\n]*)', prompt)
+        question = match.group(1).strip()[:80] if match else ''
+        text = f"[fake gemini #{number}] Here is some general advice about {question or 'your question'}."
+
+        self.reply(200, {
+            'candidates': [{
+                'content': {'role': 'model', 'parts': [{'text': text}]},
+                'finishReason': 'STOP',
+                'index': 0,
+            }],
+            'usageMetadata': {
+                'promptTokenCount': len(prompt) // 4,
+                'candidatesTokenCount': len(text) // 4,
+                'totalTokenCount': (len(prompt) + len(text)) // 4,
+            },
+            'modelVersion': self.path.split('/models/')[-1].split(':')[0],
+        })
+
+    def reply(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, delay=0.0, fail_rate=0.0, quiet=False):
+        super().__init__(address, FakeGeminiHandler)
+        self.delay = delay
+        self.fail_rate = fail_rate
+        self.quiet = quiet
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in Gemini API server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=0.2, help="Seconds before each reply")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument('--quiet', action='store_true')
+    args = parser.parse_args()
+
+    with FakeGeminiServer((args.host, args.port), args.delay, args.fail_rate, args.quiet) as server:
+        print(f"Fake Gemini listening on http://{args.host}:{args.port} (delay {args.delay}s, "
+              f"fail rate {args.fail_rate})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Stand-in Redis-protocol key-value server for trying the 'kv' session backend
+locally without a real Redis. Keeps everything in memory and supports only
+the commands the chatbot uses: PING, AUTH, SELECT, GET, SET [EX], DEL,
+EXISTS, EXPIRE, TTL, DBSIZE and FLUSHDB.
+
+Usage (from the chatbot/ directory):
+    python tools/kv_server.py [--host 127.0.0.1] [--port 6379]
+    CHATBOT_SESSION_BACKEND=kv CHATBOT_SESSION_KV_URL=redis://127.0.0.1:6379/0 python app.py
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class KeyValueData:
+    """Keys per database with optional expiry times"""
+
+    def __init__(self):
+        self.databases = {}
+        self.lock = threading.Lock()
+
+    def db(self, index):
+        return self.databases.setdefault(index, {})
+
+    def get(self, index, key):
+        entry = self.db(index).get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self.db(index)[key]
+            return None
+        return value
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+    """Serves one client connection"""
+
+    def handle(self):
+        self.db_index = 0
+        while True:
+            try:
+                args = self.read_command()
+            except (ConnectionError, ValueError):
+                return
+            if args is None:
+                return
+            try:
+                reply = self.dispatch(args)
+            except Exception as e:
+                reply = RuntimeError(str(e))
+            self.wfile.write(self.encode(reply))
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            # Inline command, e.g. from telnet
+            return line.strip().split()
+        args = []
+        for _ in range(int(line[1:-2])):
+            header = self.rfile.readline()
+            length = int(header[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def encode(self, reply):
+        if reply is None:
+            return b'$-1\r\n'
+        if isinstance(reply, RuntimeError):
+            return b'-ERR %s\r\n' % str(reply).encode('utf-8')
+        if isinstance(reply, bool):
+            return b':%d\r\n' % int(reply)
+        if isinstance(reply, int):
+            return b':%d\r\n' % reply
+        if isinstance(reply, str):
+            return b'+%s\r\n' % reply.encode('utf-8')
+        return b'$%d\r\n%s\r\n' % (len(reply), reply)
+
+    def dispatch(self, args):
+        command = args[0].upper().decode('utf-8')
+        data = self.server.data
+        with data.lock:
+            db = data.db(self.db_index)
+
+            if command == 'PING':
+                return 'PONG'
+            if command == 'AUTH':
+                return 'OK'
+            if command == 'SELECT':
+                self.db_index = int(args[1])
+                return 'OK'
+            if command == 'GET':
+                return data.get(self.db_index, args[1])
+            if command == 'SET':
+                expires_at = None
+                options = [a.upper() for a in args[3:]]
+                if b'EX' in options:
+                    expires_at = time.time() + int(args[3 + options.index(b'EX') + 1])
+                db[args[1]] = (args[2], expires_at)
+                return 'OK'
+            if command == 'DEL':
+                return sum(1 for key in args[1:] if db.pop(key, None) is not None)
+            if command == 'EXISTS':
+                return sum(1 for key in args[1:] if data.get(self.db_index, key) is not None)
+            if command == 'EXPIRE':
+                if data.get(self.db_index, args[1]) is None:
+                    return 0
+                db[args[1]] = (db[args[1]][0], time.time() + int(args[2]))
+                return 1
+            if command == 'TTL':
+                if data.get(self.db_index, args[1]) is None:
+                    return -2
+                expires_at = db[args[1]][1]
+                return -1 if expires_at is None else int(expires_at - time.time())
+            if command == 'DBSIZE':
+                return sum(1 for key in list(db) if data.get(self.db_index, key) is not None)
+            if command == 'FLUSHDB':
+                db.clear()
+                return 'OK'
+        return RuntimeError(f"unknown command '{command}'")
+
+
+class KeyValueServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, RespHandler)
+        self.data = KeyValueData()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in Redis-protocol key-value server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6379)
+    args = parser.parse_args()
+
+    with KeyValueServer((args.host, args.port)) as server:
+        print(f"Key-value server listening on {args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
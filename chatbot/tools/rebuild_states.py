@@ -0,0 +1,69 @@
+"""
+Rebuild conversation states from their snapshot and journal files.
+Replays each user's journal on top of their snapshot and reports what was
+found. With --compact the rebuilt state is written as a new snapshot and the
+journal removed. Run it while the chatbot is stopped: a running server keeps
+appending to the journals.
+
+Usage (from the chatbot/ directory):
+    python tools/rebuild_states.py [--dir data/contexts] [--user ID] [--compact]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.conversation_state import STATE_COMPACT_EVERY, ConversationState, StateEncoder
+from src.state_journal import StateJournal
+
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'contexts')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild conversation states from snapshots and journals")
+    parser.add_argument('--dir', default=DEFAULT_DIR)
+    parser.add_argument('--user', help="Only this user id")
+    parser.add_argument('--compact', action='store_true', help="Write rebuilt states as snapshots, drop journals")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.dir):
+        print(f"No state directory at {args.dir}")
+        return 0
+
+    journal = StateJournal(
+        args.dir, encoder=StateEncoder, compact_every=STATE_COMPACT_EVERY,
+        max_history=ConversationState('').max_history_size
+    )
+    users = [args.user] if args.user else journal.user_ids()
+
+    started = time.perf_counter()
+    rebuilt = failed = entries = 0
+    for user_id in users:
+        try:
+            data, applied, seq = journal.replay(user_id)
+            if data is None:
+                print(f"{user_id}: no snapshot")
+                continue
+            # Round-trip through ConversationState so the result is what the chatbot would load
+            state = ConversationState.from_dict(data)
+            if args.compact:
+                journal.track(user_id, data, seq)
+                journal.compact(user_id, state.to_dict())
+            rebuilt += 1
+            entries += applied
+            print(f"{user_id}: {len(state.conversation_history)} messages, {applied} journal entries "
+                  f"(seq {seq}){', compacted' if args.compact else ''} | {state.get_context_summary()}")
+        except Exception as e:
+            failed += 1
+            print(f"{user_id}: could not rebuild: {e}")
+
+    bad_lines = journal.stats()['bad_lines']
+    print(f"\nRebuilt {rebuilt} states from {entries} journal entries in {time.perf_counter() - started:.2f}s"
+          f" ({failed} failed, {bad_lines} unreadable journal lines skipped)")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+Load the JSONL fallback log files back into conversation_logs once the
+database is reachable again. Files are loaded oldest first in batches of
+--batch rows, one transaction per batch. After each batch the number of lines
+done is saved in <file>.progress, so an interrupted replay resumes without
+inserting duplicates. Fully loaded files are renamed to <file>.replayed.
+
+Today's newest file may still be open in a running chatbot and is skipped
+unless --include-current is given.
+
+Usage (from the chatbot/ directory):
+    python tools/replay_logs.py [--dir logs] [--batch 1000] [--include-current] [--dry-run]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from utils.database import LOG_FALLBACK_DIR, DatabaseConnector
+from utils.log_sink import FILE_PATTERN
+
+
+def fallback_files(directory, include_current=False):
+    """JSONL fallback files in write order: by date, then rotation index"""
+    files = []
+    for name in os.listdir(directory):
+        match = FILE_PATTERN.match(name)
+        if match:
+            files.append((match.group(1), int(match.group(2) or 0), name))
+    files.sort()
+
+    today = time.strftime('%Y-%m-%d')
+    if files and not include_current and files[-1][0] == today:
+        print(f"Skipping {files[-1][2]} (may still be written; use --include-current)")
+        files.pop()
+    return [os.path.join(directory, name) for _, _, name in files]
+
+
+def read_records(path, skip):
+    """(line number, record) for each parsable line after the first `skip` lines"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            if number <= skip or not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except json.JSONDecodeError:
+                # A torn last line after a crash
+                print(f"  {os.path.basename(path)}:{number}: skipping unreadable line")
+
+
+def read_progress(path):
+    try:
+        with open(path + '.progress', 'r') as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def write_progress(path, lines):
+    tmp_path = path + '.progress.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(str(lines))
+    os.replace(tmp_path, path + '.progress')
+
+
+def replay_file(database, path, batch_size, dry_run=False):
+    """Load one file; returns (rows inserted, completed)"""
+    done = read_progress(path)
+    inserted = 0
+    batch = []
+    last_line = done
+
+    def flush():
+        nonlocal inserted
+        if dry_run:
+            inserted += len(batch)
+            return True
+        count = database.replay_conversation_logs(batch)
+        if count is None:
+            return False
+        inserted += count
+        write_progress(path, last_line)
+        return True
+
+    for number, record in read_records(path, done):
+        batch.append(record)
+        last_line = number
+        if len(batch) >= batch_size:
+            if not flush():
+                return inserted, False
+            batch = []
+    if batch and not flush():
+        return inserted, False
+
+    if not dry_run:
+        os.replace(path, path + '.replayed')
+        try:
+            os.remove(path + '.progress')
+        except FileNotFoundError:
+            pass
+    return inserted, True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay fallback conversation logs into the database")
+    parser.add_argument('--dir', default=LOG_FALLBACK_DIR)
+    parser.add_argument('--batch', type=int, default=1000, help="Rows per INSERT transaction")
+    parser.add_argument('--include-current', action='store_true', help="Also load today's newest file")
+    parser.add_argument('--dry-run', action='store_true', help="Count rows without inserting")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.dir):
+        print(f"No log directory at {args.dir}")
+        return 0
+
+    database = DatabaseConnector()
+    if not args.dry_run and not database.connect():
+        print("Database is not reachable, nothing replayed")
+        return 1
+
+    started = time.perf_counter()
+    total = 0
+    for path in fallback_files(args.dir, args.include_current):
+        inserted, completed = replay_file(database, path, args.batch, args.dry_run)
+        total += inserted
+        print(f"{os.path.basename(path)}: {inserted} rows{'' if completed else ' (stopped, rerun to resume)'}")
+        if not completed:
+            return 1
+
+    elapsed = time.perf_counter() - started
+    print(f"{'Would replay' if args.dry_run else 'Replayed'} {total} rows in {elapsed:.2f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,10 +2,23 @@
 Database connector for the chatbot using MySQL (same DB as main site)
 """
 import os
+import sys
 import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import wraps
 import mysql.connector
 from mysql.connector import Error
 
+from utils.db_pool import ConnectionPool, RetryingConnection
+from utils.log_sink import JsonlLogSink
+
+try:
+    import resource  # Not available on Windows
+except ImportError:
+    resource = None
+
 
 # MySQL connection settings
 DB_CONFIG = {
@@ -18,47 +31,124 @@ DB_CONFIG = {
     'autocommit': True
 }
 
+# Connection pool size and how long a request may wait for a free connection (seconds)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 8))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 5))
+# Connections idle for longer than this (seconds) are pinged before use
+DB_VALIDATE_IDLE_SECONDS = float(os.getenv('DB_VALIDATE_IDLE_SECONDS', 30))
+
+# Conversation logs that cannot reach the database go to JSONL files here
+LOG_FALLBACK_DIR = os.getenv('CHATBOT_LOG_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs'))
+LOG_FILE_MAX_BYTES = int(os.getenv('CHATBOT_LOG_FILE_MAX_BYTES', 50 * 1024 * 1024))
+LOG_FSYNC_SECONDS = float(os.getenv('CHATBOT_LOG_FSYNC_SECONDS', 1))
+
+
+def pooled(method):
+    """Run a DatabaseConnector method with a pooled connection checked out as self.connection"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.connection is not None:
+            # Nested call, reuse the connection already checked out by this thread
+            return method(self, *args, **kwargs)
+        try:
+            connection = self.pool.acquire()
+        except Error as e:
+            # Without a connection ensure_connection() fails and the method returns its usual fallback
+            print(f"Database pool error: {e}")
+            return method(self, *args, **kwargs)
+        with self.checkout(connection):
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 class DatabaseConnector:
     """
     Handles MySQL database connections for the chatbot
     """
 
+    # Changed rows fetched per query by the catalog poller
+    CHANGE_BATCH_SIZE = 500
+    # Rows per keyset page when loading the whole catalog
+    CATALOG_PAGE_SIZE = 1000
+    # Ids per keyset page when listing active products to find hard deletes
+    ACTIVE_ID_PAGE_SIZE = 10000
+
     def __init__(self):
-        self.connection = None
-        print(f"MySQL Config: {DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}")
+        self.pool = ConnectionPool(DB_CONFIG, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT)
+        self._local = threading.local()  # Connection checked out by the current thread
+        self._poller = None
+        self._poller_stop = threading.Event()
+        self._poller_status = {
+            'watermark': None,
+            'last_poll': None,
+            'db_time': None,
+            'changes_applied': 0,
+            'deletes_detected': 0,
+            'last_delete_scan': None,
+            'errors': 0,
+        }
+        self.catalog_load_stats = {}
+        self.log_sink = JsonlLogSink(LOG_FALLBACK_DIR, max_bytes=LOG_FILE_MAX_BYTES, fsync_interval=LOG_FSYNC_SECONDS)
+        print(f"MySQL Config: {DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']} "
+              f"(pool of {DB_POOL_SIZE})")
+
+    @property
+    def connection(self):
+        """The pooled connection checked out by the current thread (None outside a checkout)"""
+        return getattr(self._local, 'connection', None)
+
+    @contextmanager
+    def checkout(self, connection=None):
+        """Check a pooled connection out to the current thread for the duration of a with block"""
+        if connection is None:
+            connection = self.pool.acquire()
+        self._local.connection = RetryingConnection(connection, self.pool)
+        self._local.idle_seconds = self.pool.idle_seconds(connection)
+        self._local.broken = False
+        proxy = self._local.connection
+        try:
+            yield proxy
+        finally:
+            self._local.connection = None
+            self.pool.release(connection, discard=self._local.broken or proxy.lost)
 
     def connect(self):
-        """Connect to MySQL database"""
+        """Check that the pool can provide a working MySQL connection"""
         try:
-            if self.connection and self.connection.is_connected():
-                return True
-
-            self.connection = mysql.connector.connect(**DB_CONFIG)
-            print("MySQL database connection successful!")
-            return True
+            with self.checkout():
+                return self.ensure_connection()
         except Error as e:
             print(f"Database connection error: {e}")
             return False
 
     def disconnect(self):
-        """Close the database connection"""
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
-            self.connection = None
+        """Close the idle pooled connections"""
+        self.pool.close()
 
     def ensure_connection(self):
-        """Ensure database connection is alive"""
+        """
+        Ensure the checked-out connection is alive.
+        Only connections idle past DB_VALIDATE_IDLE_SECONDS are pinged; a
+        connection lost mid-query is handled by the one-time read retry.
+        """
+        connection = self.connection
+        if connection is None:
+            return False
+        if self._local.idle_seconds < DB_VALIDATE_IDLE_SECONDS:
+            return True
         try:
-            if self.connection is None or not self.connection.is_connected():
-                return self.connect()
-            # Test connection with ping
-            self.connection.ping(reconnect=True)
+            self.pool.count('pings')
+            connection.ping(reconnect=True, attempts=1)
+            self._local.idle_seconds = 0.0
             return True
         except Error as e:
-            print(f"Connection lost, reconnecting: {e}")
-            self.connection = None
-            return self.connect()
+            print(f"Connection lost: {e}")
+            self._local.broken = True
+            return False
+
+    def get_pool_stats(self):
+        """Connection pool metrics (in use, waiting, wait time)"""
+        return self.pool.stats()
 
     def _dict_from_row(self, cursor, row):
         """Convert row to dict using cursor description"""
@@ -72,6 +162,7 @@ class DatabaseConnector:
         columns = [col[0] for col in cursor.description]
         return [dict(zip(columns, row)) for row in rows]
 
+    @pooled
     def get_products(self, limit=10, category_id=None, search=None, product_id=None):
         """Get products from the database"""
         try:
@@ -116,6 +207,303 @@ class DatabaseConnector:
             print(f"Error getting products: {e}")
             return []
 
+    def iter_product_pages(self, page_size=None):
+        """
+        Yield all active products in pages, using keyset pagination on id.
+        Each page is streamed through an unbuffered cursor, so only one page
+        of rows is held by the driver at a time. Raises Error when a page
+        cannot be read, so a stopped load is never taken for the whole catalog.
+        """
+        page_size = int(page_size or self.CATALOG_PAGE_SIZE)
+        query = f"""
+            SELECT p.*, c.name as category_name, s.company_name as supplier_name
+            FROM products p
+            LEFT JOIN categories c ON p.category_id = c.id
+            LEFT JOIN suppliers s ON p.supplier_id = s.id
+            WHERE p.is_active = 1 AND p.id > %s
+            ORDER BY p.id ASC
+            LIMIT {page_size}
+        """
+
+        last_id = 0
+        while True:
+            # The connection goes back to the pool between pages
+            with self.checkout() as connection:
+                if not self.ensure_connection():
+                    raise Error(msg=f"Failed to connect to database (catalog page after id {last_id})")
+
+                cursor = connection.cursor(buffered=False)
+                try:
+                    cursor.execute(query, (last_id,))
+                    page = []
+                    while True:
+                        rows = cursor.fetchmany(page_size)
+                        if not rows:
+                            break
+                        page.extend(self._dicts_from_rows(cursor, rows))
+                finally:
+                    cursor.close()
+
+            if not page:
+                return
+            yield page
+            if len(page) < page_size:
+                return
+            last_id = page[-1]['id']
+
+    def get_all_products(self, page_size=None):
+        """
+        Load the whole active catalog page by page, ordered by name like get_products.
+        Returns None if any page failed: a partial catalog is never returned.
+        """
+        started = time.perf_counter()
+        products = []
+        pages = 0
+        try:
+            for page in self.iter_product_pages(page_size):
+                products.extend(page)
+                pages += 1
+        except Error as e:
+            print(f"Error loading catalog after {len(products)} products: {e}")
+            self.catalog_load_stats = {
+                'products': len(products),
+                'pages': pages,
+                'seconds': round(time.perf_counter() - started, 3),
+                'error': str(e),
+            }
+            return None
+
+        products.sort(key=lambda p: (p.get('name') or '').lower())
+
+        self.catalog_load_stats = {
+            'products': len(products),
+            'pages': pages,
+            'seconds': round(time.perf_counter() - started, 3),
+            'peak_rss_mb': self._peak_rss_mb(),
+        }
+        stats = self.catalog_load_stats
+        rss = f"{stats['peak_rss_mb']} MB" if stats['peak_rss_mb'] is not None else "n/a"
+        print(f"Catalog loaded: {stats['products']} products in {stats['pages']} pages, "
+              f"{stats['seconds']}s, peak RSS {rss}")
+        return products
+
+    @staticmethod
+    def _peak_rss_mb():
+        """Peak resident set size of this process in MB (None where unsupported)"""
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+        return round(peak / divisor, 1)
+
+    @pooled
+    def get_catalog_watermark(self):
+        """
+        Get the change watermark to poll from, taken before a catalog load.
+        It is one second behind the database clock, since updated_at has
+        whole-second resolution; rows seen twice are simply re-applied.
+        """
+        try:
+            if not self.ensure_connection():
+                return None
+            return self._query_watermark(self.connection)
+        except Error as e:
+            print(f"Error getting catalog watermark: {e}")
+            return None
+
+    def _query_watermark(self, connection):
+        """Read the database clock as a (updated_at, id) watermark"""
+        now = self._query_db_time(connection)
+        return (now - timedelta(seconds=1), 0) if now else None
+
+    def _query_db_time(self, connection):
+        """Read the database clock (the same clock products.updated_at is set from)"""
+        cursor = connection.cursor()
+        cursor.execute("SELECT NOW()")
+        row = cursor.fetchone()
+        cursor.close()
+        return row[0] if row else None
+
+    @pooled
+    def get_product_changes(self, watermark, limit=None):
+        """Get products changed after a (updated_at, id) watermark, including deactivated ones"""
+        try:
+            if not self.ensure_connection():
+                return []
+            return self._fetch_product_changes(self.connection, watermark, limit)
+        except Error as e:
+            print(f"Error getting product changes: {e}")
+            return []
+
+    def _fetch_product_changes(self, connection, watermark, limit=None):
+        """
+        Query one batch of changed products in (updated_at, id) order.
+        Rows from the current second are left for the next call, so a second
+        is only read once it can no longer change.
+        """
+        updated_at, last_id = watermark
+        query = """
+            SELECT p.*, c.name as category_name, s.company_name as supplier_name
+            FROM products p
+            LEFT JOIN categories c ON p.category_id = c.id
+            LEFT JOIN suppliers s ON p.supplier_id = s.id
+            WHERE (p.updated_at > %s OR (p.updated_at = %s AND p.id > %s))
+              AND p.updated_at < NOW()
+            ORDER BY p.updated_at ASC, p.id ASC
+        """
+        query += f" LIMIT {int(limit or self.CHANGE_BATCH_SIZE)}"
+
+        cursor = connection.cursor()
+        cursor.execute(query, (updated_at, updated_at, last_id))
+        rows = cursor.fetchall()
+        changes = self._dicts_from_rows(cursor, rows)
+        cursor.close()
+        return changes
+
+    @pooled
+    def get_active_product_ids(self):
+        """Get the ids of all active products, or None if they could not be read"""
+        try:
+            if not self.ensure_connection():
+                return None
+            return self._fetch_active_product_ids(self.connection)
+        except Error as e:
+            print(f"Error getting active product ids: {e}")
+            return None
+
+    def _fetch_active_product_ids(self, connection):
+        """Read every active product id in keyset pages of ACTIVE_ID_PAGE_SIZE"""
+        query = f"""
+            SELECT id FROM products
+            WHERE is_active = 1 AND id > %s
+            ORDER BY id ASC
+            LIMIT {int(self.ACTIVE_ID_PAGE_SIZE)}
+        """
+        ids = set()
+        last_id = 0
+        cursor = connection.cursor()
+        try:
+            while True:
+                cursor.execute(query, (last_id,))
+                rows = cursor.fetchall()
+                ids.update(row[0] for row in rows)
+                if len(rows) < self.ACTIVE_ID_PAGE_SIZE:
+                    return ids
+                last_id = rows[-1][0]
+        finally:
+            cursor.close()
+
+    def start_catalog_poller(self, on_changes, interval, watermark=None, known_ids=None, delete_scan_interval=0):
+        """
+        Poll products.updated_at in a background thread and pass changes to
+        on_changes(upserts, deletes). The poller uses its own connection.
+
+        Rows deleted outright (the PHP admin runs DELETE FROM products) never
+        show up as changes, so every delete_scan_interval seconds the poller
+        also lists the active ids and reports the ids from known_ids() that
+        are gone as deletes. A delete_scan_interval of 0 disables the scan.
+        """
+        if self._poller is not None and self._poller.is_alive():
+            return
+
+        self._poller_stop.clear()
+        self._poller_status['watermark'] = watermark
+        self._poller = threading.Thread(
+            target=self._poll_catalog, args=(on_changes, interval, known_ids, delete_scan_interval),
+            name='catalog-poller', daemon=True
+        )
+        self._poller.start()
+        print(f"Catalog poller started (every {interval}s)")
+
+    def stop_catalog_poller(self):
+        """Stop the catalog poller thread"""
+        self._poller_stop.set()
+        if self._poller is not None:
+            self._poller.join(timeout=5)
+            self._poller = None
+
+    def get_poller_status(self):
+        """
+        Get the poller watermark and lag. lag_seconds is how far the watermark
+        was behind the database clock at the last poll (replication lag);
+        seconds_since_poll is how long ago that poll finished.
+        """
+        status = dict(self._poller_status)
+        watermark = status.pop('watermark')
+        db_time = status.pop('db_time')
+        last_poll = status['last_poll']
+        status['running'] = self._poller is not None and self._poller.is_alive()
+        status['watermark'] = watermark[0].isoformat() if watermark and watermark[0] else None
+        status['lag_seconds'] = None
+        if db_time and watermark and watermark[0]:
+            status['lag_seconds'] = round(max(0.0, (db_time - watermark[0]).total_seconds()), 1)
+        status['seconds_since_poll'] = round(time.time() - last_poll, 1) if last_poll else None
+        if last_poll:
+            status['last_poll'] = datetime.fromtimestamp(last_poll).isoformat()
+        if status['last_delete_scan']:
+            status['last_delete_scan'] = datetime.fromtimestamp(status['last_delete_scan']).isoformat()
+        return status
+
+    def _poll_catalog(self, on_changes, interval, known_ids=None, delete_scan_interval=0):
+        """Poller loop: fetch batches past the watermark and hand them over"""
+        connection = None
+        next_delete_scan = time.monotonic() + delete_scan_interval
+        while not self._poller_stop.is_set():
+            try:
+                if connection is None or not connection.is_connected():
+                    connection = mysql.connector.connect(**DB_CONFIG)
+
+                db_time = self._query_db_time(connection)
+                if self._poller_status['watermark'] is None:
+                    self._poller_status['watermark'] = self._query_watermark(connection)
+
+                while self._poller_status['watermark'] is not None:
+                    changes = self._fetch_product_changes(connection, self._poller_status['watermark'])
+                    if not changes:
+                        break
+
+                    upserts = [p for p in changes if p.get('is_active')]
+                    deletes = [p.get('id') for p in changes if not p.get('is_active')]
+                    on_changes(upserts, deletes)
+
+                    last = changes[-1]
+                    self._poller_status['watermark'] = (last.get('updated_at'), last.get('id'))
+                    self._poller_status['changes_applied'] += len(changes)
+                    if len(changes) < self.CHANGE_BATCH_SIZE:
+                        break
+
+                # Caught up: every row older than the poll's start has been read, so on a quiet
+                # catalog the watermark follows the clock (as a fresh watermark would) and
+                # lag_seconds stays small instead of growing with the time since the last edit
+                watermark = self._poller_status['watermark']
+                if watermark and watermark[0] and db_time and watermark[0] < db_time - timedelta(seconds=1):
+                    self._poller_status['watermark'] = (db_time - timedelta(seconds=1), 0)
+
+                if known_ids is not None and delete_scan_interval > 0 and time.monotonic() >= next_delete_scan:
+                    # Ids are taken before the scan: a product added meanwhile is not in
+                    # known and can't be mistaken for a deleted one
+                    known = set(known_ids())
+                    missing = known - self._fetch_active_product_ids(connection)
+                    if missing:
+                        on_changes([], sorted(missing))
+                        self._poller_status['deletes_detected'] += len(missing)
+                    self._poller_status['last_delete_scan'] = time.time()
+                    next_delete_scan = time.monotonic() + delete_scan_interval
+
+                self._poller_status['db_time'] = db_time
+                self._poller_status['last_poll'] = time.time()
+            except Exception as e:
+                print(f"Catalog poller error: {e}")
+                self._poller_status['errors'] += 1
+                connection = None
+
+            self._poller_stop.wait(interval)
+
+        if connection is not None and connection.is_connected():
+            connection.close()
+
+    @pooled
     def get_categories(self, with_product_counts=False):
         """Get all product categories"""
         try:
@@ -143,6 +531,7 @@ class DatabaseConnector:
             print(f"Error getting categories: {e}")
             return []
 
+    @pooled
     def get_suppliers(self, limit=10):
         """Get suppliers from the database"""
         try:
@@ -160,6 +549,7 @@ class DatabaseConnector:
             print(f"Error getting suppliers: {e}")
             return []
 
+    @pooled
     def log_conversation(self, user_id, user_message, bot_response, intent=None):
         """Log a conversation to database"""
         try:
@@ -177,27 +567,80 @@ class DatabaseConnector:
             print(f"Error logging to DB: {e}")
             return self._log_to_file(user_id, user_message, bot_response, intent)
 
-    def _log_to_file(self, user_id, user_message, bot_response, intent=None):
-        """Log conversation to a file (fallback)"""
+    @pooled
+    def log_conversations(self, rows):
+        """
+        Log a batch of (user_id, user_message, bot_response, intent) rows in one INSERT.
+        Returns True when the rows reached the database; on failure they go to the log file.
+        """
+        if not rows:
+            return True
         try:
-            log_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs')
-            os.makedirs(log_dir, exist_ok=True)
-
-            log_file = os.path.join(log_dir, f"chatbot_{time.strftime('%Y-%m-%d')}.log")
-
-            timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
-            log_entry = f"[{timestamp}] User ID: {user_id}, Intent: {intent or 'unknown'}\n"
-            log_entry += f"User: {user_message}\n"
-            log_entry += f"Bot: {bot_response}\n\n"
-
-            with open(log_file, 'a', encoding='utf-8') as f:
-                f.write(log_entry)
+            if not self.ensure_connection():
+                self._log_rows_to_file(rows)
+                return False
 
+            cursor = self.connection.cursor()
+            # executemany() sends a single multi-row INSERT
+            cursor.executemany("""
+                INSERT INTO conversation_logs (user_id, user_message, bot_response, intent)
+                VALUES (%s, %s, %s, %s)
+            """, [(str(user_id), user_message, bot_response, intent)
+                  for user_id, user_message, bot_response, intent in rows])
+            cursor.close()
             return True
-        except Exception as e:
-            print(f"Error logging to file: {e}")
+        except Error as e:
+            print(f"Error logging {len(rows)} conversations to DB: {e}")
+            self._log_rows_to_file(rows)
             return False
 
+    def _log_to_file(self, user_id, user_message, bot_response, intent=None):
+        """Log conversation to a file (fallback)"""
+        return self._log_rows_to_file([(user_id, user_message, bot_response, intent)])
+
+    def _log_rows_to_file(self, rows):
+        """Append (user_id, user_message, bot_response, intent) rows to the JSONL fallback files"""
+        created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        return self.log_sink.write([
+            {
+                'created_at': created_at,
+                'user_id': str(user_id),
+                'user_message': user_message,
+                'bot_response': bot_response,
+                'intent': intent,
+            }
+            for user_id, user_message, bot_response, intent in rows
+        ])
+
+    @pooled
+    def replay_conversation_logs(self, records):
+        """
+        Insert fallback log records (dicts from the JSONL files) keeping their created_at.
+        All records go in one transaction; returns the number inserted, or None on failure.
+        """
+        try:
+            if not self.ensure_connection():
+                return None
+
+            self.connection.start_transaction()
+            cursor = self.connection.cursor()
+            cursor.executemany("""
+                INSERT INTO conversation_logs (user_id, user_message, bot_response, intent, created_at)
+                VALUES (%s, %s, %s, %s, %s)
+            """, [(r.get('user_id'), r.get('user_message'), r.get('bot_response'), r.get('intent'),
+                   r.get('created_at')) for r in records])
+            cursor.close()
+            self.connection.commit()
+            return len(records)
+        except Error as e:
+            print(f"Error replaying conversation logs: {e}")
+            try:
+                self.connection.rollback()
+            except Error:
+                pass
+            return None
+
+    @pooled
     def get_product_by_id(self, product_id):
         """Get a single product by ID"""
         try:
@@ -222,6 +665,36 @@ class DatabaseConnector:
             print(f"Error getting product by ID: {e}")
             return None
 
+    @pooled
+    def get_product_row(self, product_id):
+        """
+        Read one product whatever its is_active flag, for patching the NLP engine.
+        Returns (True, row), (True, None) if there is no such product, or
+        (False, None) if the read failed, so a failure is not taken for a deletion.
+        """
+        try:
+            if not self.ensure_connection():
+                return False, None
+
+            query = """
+                SELECT p.*, c.name as category_name, s.company_name as supplier_name
+                FROM products p
+                LEFT JOIN categories c ON p.category_id = c.id
+                LEFT JOIN suppliers s ON p.supplier_id = s.id
+                WHERE p.id = %s
+            """
+
+            cursor = self.connection.cursor()
+            cursor.execute(query, (product_id,))
+            row = cursor.fetchone()
+            result = self._dict_from_row(cursor, row)
+            cursor.close()
+            return True, result
+        except Error as e:
+            print(f"Error reading product {product_id}: {e}")
+            return False, None
+
+    @pooled
     def get_user_by_email(self, email):
         """Get user by email"""
         try:
@@ -238,6 +711,7 @@ class DatabaseConnector:
             print(f"Error getting user: {e}")
             return None
 
+    @pooled
     def create_user(self, email, password, name=''):
         """Create new user"""
         try:
@@ -256,6 +730,7 @@ class DatabaseConnector:
             print(f"Error creating user: {e}")
             return None
 
+    @pooled
     def get_cart(self, user_id):
         """Get user's cart items"""
         try:
@@ -278,6 +753,7 @@ class DatabaseConnector:
             print(f"Error getting cart: {e}")
             return []
 
+    @pooled
     def add_to_cart(self, user_id, product_id, quantity=1):
         """Add item to cart"""
         try:
@@ -313,6 +789,7 @@ class DatabaseConnector:
             print(f"Error adding to cart: {e}")
             return None
 
+    @pooled
     def update_cart_item(self, item_id, quantity):
         """Update cart item quantity"""
         try:
@@ -327,6 +804,7 @@ class DatabaseConnector:
             print(f"Error updating cart: {e}")
             return False
 
+    @pooled
     def remove_from_cart(self, item_id):
         """Remove item from cart"""
         try:
@@ -341,6 +819,7 @@ class DatabaseConnector:
             print(f"Error removing from cart: {e}")
             return False
 
+    @pooled
     def clear_cart(self, user_id):
         """Clear user's cart"""
         try:
@@ -355,6 +834,7 @@ class DatabaseConnector:
             print(f"Error clearing cart: {e}")
             return False
 
+    @pooled
     def get_user_orders(self, user_id):
         """Get user's orders"""
         try:
@@ -385,6 +865,7 @@ class DatabaseConnector:
             print(f"Error getting user orders: {e}")
             return []
 
+    @pooled
     def get_all_orders(self):
         """Get all orders (for managers)"""
         try:
@@ -406,6 +887,7 @@ class DatabaseConnector:
             print(f"Error getting orders: {e}")
             return []
 
+    @pooled
     def get_order(self, order_id):
         """Get order details"""
         try:
@@ -433,6 +915,7 @@ class DatabaseConnector:
             print(f"Error getting order: {e}")
             return None
 
+    @pooled
     def create_order(self, user_id, shipping_address='', notes=''):
         """Create order from cart"""
         try:
@@ -464,6 +947,7 @@ class DatabaseConnector:
             print(f"Error creating order: {e}")
             return None
 
+    @pooled
     def update_order_status(self, order_id, status):
         """Update order status"""
         try:
@@ -482,6 +966,7 @@ class DatabaseConnector:
     # SUPPORT MESSAGES
     # ============================================
 
+    @pooled
     def get_support_messages(self, customer_id):
         """Get support messages for a customer"""
         try:
@@ -504,6 +989,7 @@ class DatabaseConnector:
             print(f"Error getting support messages: {e}")
             return []
 
+    @pooled
     def send_support_message(self, customer_id, message, is_from_customer=True, manager_id=None):
         """Send a support message"""
         try:
@@ -521,6 +1007,7 @@ class DatabaseConnector:
             print(f"Error sending support message: {e}")
             return False
 
+    @pooled
     def get_support_chats(self):
         """Get all support chats (for managers)"""
         try:
@@ -550,6 +1037,7 @@ class DatabaseConnector:
     # CRUD OPERATIONS
     # ============================================
 
+    @pooled
     def create_product(self, data):
         """Create new product"""
         try:
@@ -577,6 +1065,7 @@ class DatabaseConnector:
             print(f"Error creating product: {e}")
             return None
 
+    @pooled
     def update_product(self, product_id, data):
         """Update product"""
         try:
@@ -604,6 +1093,7 @@ class DatabaseConnector:
             print(f"Error updating product: {e}")
             return False
 
+    @pooled
     def delete_product(self, product_id):
         """Delete product (soft delete)"""
         try:
@@ -618,6 +1108,7 @@ class DatabaseConnector:
             print(f"Error deleting product: {e}")
             return False
 
+    @pooled
     def create_category(self, data):
         """Create new category"""
         try:
@@ -636,6 +1127,7 @@ class DatabaseConnector:
             print(f"Error creating category: {e}")
             return None
 
+    @pooled
     def update_category(self, category_id, data):
         """Update category"""
         try:
@@ -653,6 +1145,7 @@ class DatabaseConnector:
             print(f"Error updating category: {e}")
             return False
 
+    @pooled
     def delete_category(self, category_id):
         """Delete category"""
         try:
@@ -671,6 +1164,7 @@ class DatabaseConnector:
     # USER MANAGEMENT
     # ============================================
 
+    @pooled
     def get_all_users(self):
         """Get all users"""
         try:
@@ -689,6 +1183,7 @@ class DatabaseConnector:
             print(f"Error getting users: {e}")
             return []
 
+    @pooled
     def update_user_role(self, user_id, role):
         """Update user role"""
         try:
@@ -703,6 +1198,7 @@ class DatabaseConnector:
             print(f"Error updating user role: {e}")
             return False
 
+    @pooled
     def update_user_status(self, user_id, is_active):
         """Update user status"""
         try:
@@ -717,6 +1213,7 @@ class DatabaseConnector:
             print(f"Error updating user status: {e}")
             return False
 
+    @pooled
     def delete_user(self, user_id):
         """Delete user"""
         try:
@@ -0,0 +1,223 @@
+"""
+Thread-safe MySQL connection pool for the chatbot.
+mysql.connector.pooling fails at once when every connection is taken, so this
+pool queues callers for up to a checkout timeout instead, and keeps metrics.
+It also tracks how long each connection sat idle, so callers only need to
+validate connections that may have been dropped by the server meanwhile.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import Error
+
+# Client errors for a connection the server or network has dropped
+# (2006 server has gone away, 2013 lost connection during query, 2055 lost connection)
+LOST_CONNECTION_ERRNOS = {2006, 2013, 2055}
+
+
+class PoolTimeout(Error):
+    """No pooled connection became free within the checkout timeout"""
+
+
+class RetryingCursor:
+    """
+    Cursor that re-runs a read once on a fresh connection if the old one was lost.
+    Writes are not retried: the server may already have applied them.
+    """
+
+    def __init__(self, owner, connection, pool, args, kwargs):
+        self._owner = owner
+        self._connection = connection
+        self._pool = pool
+        self._args = args
+        self._kwargs = kwargs
+        self._cursor = connection.cursor(*args, **kwargs)
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        except Error as e:
+            if e.errno not in LOST_CONNECTION_ERRNOS:
+                raise
+            if not operation.lstrip().upper().startswith('SELECT'):
+                self._owner.lost = True  # Keep it out of the pool
+                raise
+            self._pool.count('retries')
+            self._connection.reconnect(attempts=1)
+            self._cursor = self._connection.cursor(*self._args, **self._kwargs)
+            return self._cursor.execute(operation, params, *args, **kwargs)
+
+    def executemany(self, operation, seq_params):
+        try:
+            return self._cursor.executemany(operation, seq_params)
+        except Error as e:
+            if e.errno in LOST_CONNECTION_ERRNOS:
+                self._owner.lost = True
+            raise
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class RetryingConnection:
+    """Connection wrapper whose cursors retry reads once after a lost connection"""
+
+    def __init__(self, connection, pool):
+        self._connection = connection
+        self._pool = pool
+        self.lost = False  # Set when a write hit a lost connection
+
+    def cursor(self, *args, **kwargs):
+        return RetryingCursor(self, self._connection, self._pool, args, kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class ConnectionPool:
+    """Bounded pool of MySQL connections with checkout/return"""
+
+    def __init__(self, config, size=8, timeout=5.0, connect=None):
+        self.config = config
+        self.size = size
+        self.timeout = timeout  # Seconds a checkout may wait for a free connection
+        self._connect = connect or (lambda: mysql.connector.connect(**self.config))
+
+        self._idle = []  # Most recently returned last
+        self._last_used = {}  # id(connection) -> monotonic time it was last returned or opened
+        self._created = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._metrics = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'discarded': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+            'pings': 0,
+            'retries': 0,
+        }
+
+    def acquire(self, timeout=None):
+        """Check out a connection, waiting up to the timeout for one to be returned"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        with self._cond:
+            self._waiting += 1
+            try:
+                while not self._idle and self._created >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._metrics['timeouts'] += 1
+                        raise PoolTimeout(f"No database connection free after {timeout}s")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+            waited = time.monotonic() - started
+            self._metrics['checkouts'] += 1
+            self._metrics['wait_seconds_total'] += waited
+            self._metrics['wait_seconds_max'] = max(self._metrics['wait_seconds_max'], waited)
+            self._in_use += 1
+
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+
+        # Open new connections outside the lock so other checkouts are not held up
+        try:
+            connection = self._connect()
+            with self._cond:
+                self._last_used[id(connection)] = time.monotonic()
+            return connection
+        except Exception:
+            with self._cond:
+                self._created -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, connection, discard=False):
+        """Return a connection; discarded ones are closed and free their slot"""
+        if discard:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+        with self._cond:
+            self._in_use -= 1
+            if discard:
+                self._created -= 1
+                self._metrics['discarded'] += 1
+                self._last_used.pop(id(connection), None)
+            else:
+                self._idle.append(connection)
+                self._last_used[id(connection)] = time.monotonic()
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Check out a connection for the duration of a with block"""
+        connection = self.acquire(timeout)
+        discard = False
+        try:
+            yield connection
+        except Error:
+            discard = not self._is_alive(connection)
+            raise
+        finally:
+            self.release(connection, discard=discard)
+
+    @staticmethod
+    def _is_alive(connection):
+        """Check a connection after an error without raising"""
+        try:
+            return connection.is_connected()
+        except Exception:
+            return False
+
+    def idle_seconds(self, connection):
+        """Seconds since a connection was last returned to the pool (or opened)"""
+        last_used = self._last_used.get(id(connection))
+        return float('inf') if last_used is None else time.monotonic() - last_used
+
+    def count(self, metric):
+        """Bump a pool counter (e.g. 'pings', 'retries')"""
+        with self._cond:
+            self._metrics[metric] += 1
+
+    def close(self):
+        """Close the idle connections (checked-out ones are closed when returned with discard)"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+            for connection in idle:
+                self._last_used.pop(id(connection), None)
+        for connection in idle:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        """Pool size, usage and checkout wait metrics"""
+        with self._cond:
+            stats = dict(self._metrics)
+            stats.update({
+                'size': self.size,
+                'open': self._created,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+            })
+        checkouts = stats['checkouts']
+        stats['wait_seconds_avg'] = round(stats['wait_seconds_total'] / checkouts, 6) if checkouts else 0.0
+        stats['wait_seconds_total'] = round(stats['wait_seconds_total'], 6)
+        stats['wait_seconds_max'] = round(stats['wait_seconds_max'], 6)
+        return stats
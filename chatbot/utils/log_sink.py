@@ -0,0 +1,153 @@
+"""
+Fallback file sink for conversation logs while the database is unavailable.
+Keeps one buffered file open and writes one JSON object per line, rotating
+to a new file at midnight or when the file reaches max_bytes. Buffered lines
+are flushed and fsynced at most fsync_interval seconds after being written.
+tools/replay_logs.py loads the files back into conversation_logs.
+"""
+import json
+import os
+import re
+import threading
+import time
+
+# chatbot_2026-01-31.jsonl, then chatbot_2026-01-31.1.jsonl, ... after size rotations
+FILE_PATTERN = re.compile(r'^chatbot_(\d{4}-\d{2}-\d{2})(?:\.(\d+))?\.jsonl$')
+
+
+class JsonlLogSink:
+    """Long-lived, buffered, rotating JSONL writer"""
+
+    def __init__(self, directory, max_bytes=50 * 1024 * 1024, fsync_interval=1.0, buffer_size=64 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fsync_interval = fsync_interval
+        self.buffer_size = buffer_size
+        self._file = None
+        self._date = None
+        self._index = 0
+        self._size = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._syncer = None
+        self._closed = threading.Event()
+        self._stats = {'written': 0, 'rotations': 0, 'fsyncs': 0, 'errors': 0}
+
+    @staticmethod
+    def file_name(date, index=0):
+        return f"chatbot_{date}.jsonl" if index == 0 else f"chatbot_{date}.{index}.jsonl"
+
+    @property
+    def path(self):
+        """File currently being written (None before the first write)"""
+        return os.path.join(self.directory, self.file_name(self._date, self._index)) if self._file else None
+
+    def write(self, records):
+        """Append records (dicts) as JSON lines; returns False if they could not be written"""
+        lines = [json.dumps(record, ensure_ascii=False, default=str) + '\n' for record in records]
+        with self._lock:
+            try:
+                for line in lines:
+                    data = line.encode('utf-8')
+                    self._rotate_if_needed(len(data))
+                    self._file.write(data)
+                    self._size += len(data)
+                self._dirty = True
+                self._stats['written'] += len(lines)
+            except OSError as e:
+                self._stats['errors'] += 1
+                print(f"Error writing log file: {e}")
+                self._close_file()
+                return False
+        self._start_syncer()
+        return True
+
+    def sync(self):
+        """Flush buffered lines and fsync them to disk"""
+        with self._lock:
+            self._sync_locked()
+
+    def close(self):
+        """Sync and close the current file and stop the background sync"""
+        self._closed.set()
+        with self._lock:
+            self._close_file()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['file'] = self.path
+            stats['file_bytes'] = self._size if self._file else 0
+        return stats
+
+    def _rotate_if_needed(self, incoming):
+        date = time.strftime('%Y-%m-%d')
+        if self._file is not None:
+            if date == self._date and self._size + incoming <= self.max_bytes:
+                return
+            self._close_file()
+            self._stats['rotations'] += 1
+            if date == self._date:
+                self._index += 1
+        if date != self._date:
+            self._date = date
+            self._index = self._last_index(date)
+        self._open()
+        if self._size and self._size + incoming > self.max_bytes:
+            # Today's last file from before a restart is already full
+            self._close_file()
+            self._index += 1
+            self._open()
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, self.file_name(self._date, self._index))
+        self._file = open(path, 'ab', buffering=self.buffer_size)
+        self._size = self._file.tell()
+
+    def _last_index(self, date):
+        """Highest rotation index already on disk for a date, so restarts append to it"""
+        last = 0
+        try:
+            for name in os.listdir(self.directory):
+                match = FILE_PATTERN.match(name)
+                if match and match.group(1) == date:
+                    last = max(last, int(match.group(2) or 0))
+        except OSError:
+            pass
+        return last
+
+    def _sync_locked(self):
+        if self._file is None or not self._dirty:
+            return
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._dirty = False
+            self._stats['fsyncs'] += 1
+        except OSError as e:
+            self._stats['errors'] += 1
+            print(f"Error syncing log file: {e}")
+
+    def _close_file(self):
+        if self._file is None:
+            return
+        self._sync_locked()
+        try:
+            self._file.close()
+        except OSError:
+            pass
+        self._file = None
+        self._dirty = False
+
+    def _start_syncer(self):
+        if self._syncer is not None or self._closed.is_set():
+            return
+        with self._lock:
+            if self._syncer is None:
+                self._syncer = threading.Thread(target=self._sync_loop, name='log-sink-sync', daemon=True)
+                self._syncer.start()
+
+    def _sync_loop(self):
+        while not self._closed.wait(self.fsync_interval):
+            self.sync()
@@ -0,0 +1,145 @@
+"""
+Background writer for conversation_logs.
+Requests only put rows on a bounded queue; a single writer thread inserts them
+in batches of up to batch_size rows, at least every flush_interval seconds.
+When the queue is full rows are dropped (and counted) rather than making the
+request wait, unless an enqueue timeout is set.
+"""
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class ConversationLogWriter:
+    """Bounded queue of conversation log rows drained in batches by one thread"""
+
+    def __init__(self, database, batch_size=100, flush_interval=0.2, queue_size=10000, enqueue_timeout=0.0):
+        self.database = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval  # Seconds a row may wait for its batch to fill
+        self.enqueue_timeout = enqueue_timeout  # Seconds a request may block on a full queue (0 drops)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'queued': 0,
+            'dropped': 0,
+            'written': 0,
+            'failed': 0,
+            'batches': 0,
+            'max_batch': 0,
+            'last_flush': None,
+        }
+
+    def start(self):
+        """Start the writer thread (once)"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='conversation-log-writer', daemon=True)
+                self._thread.start()
+        return self
+
+    def log(self, user_id, user_message, bot_response, intent=None):
+        """Queue a row; returns False when it was dropped because the queue is full"""
+        row = (user_id, user_message, bot_response, intent)
+        try:
+            if self.enqueue_timeout > 0:
+                self._queue.put(row, timeout=self.enqueue_timeout)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            self._count('dropped')
+            return False
+        self._count('queued')
+        return True
+
+    def close(self, timeout=10.0):
+        """Flush the queued rows and stop the writer thread"""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            # Writer never started (or died), flush what is left from this thread
+            self._drain(self._take_all())
+            return
+        # The stop marker must get in even if the queue is full
+        while True:
+            try:
+                self._queue.put(_STOP, timeout=0.1)
+                break
+            except queue.Full:
+                if not thread.is_alive():
+                    break
+        thread.join(timeout)
+
+    def stats(self):
+        """Queue depth and write counters"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            'queue_depth': self._queue.qsize(),
+            'queue_size': self._queue.maxsize,
+            'batch_size': self.batch_size,
+            'flush_interval': self.flush_interval,
+            'running': bool(self._thread and self._thread.is_alive()),
+        })
+        return stats
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            row = self._queue.get()
+            if row is _STOP:
+                break
+            batch = [row]
+
+            # Fill the batch until it is full or the oldest row has waited flush_interval
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    row = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if row is _STOP:
+                    stopping = True
+                    break
+                batch.append(row)
+
+            self._flush(batch)
+
+        self._drain(self._take_all())
+
+    def _take_all(self):
+        rows = []
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                return rows
+            if row is not _STOP:
+                rows.append(row)
+
+    def _drain(self, rows):
+        for start in range(0, len(rows), self.batch_size):
+            self._flush(rows[start:start + self.batch_size])
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        try:
+            ok = self.database.log_conversations(batch)
+        except Exception as e:
+            print(f"Error writing conversation logs: {e}")
+            ok = False
+        with self._lock:
+            self._stats['written' if ok else 'failed'] += len(batch)
+            self._stats['batches'] += 1
+            self._stats['max_batch'] = max(self._stats['max_batch'], len(batch))
+            self._stats['last_flush'] = time.time()
+
+    def _count(self, metric):
+        with self._lock:
+            self._stats[metric] += 1